@@ -72,10 +72,16 @@ setup(
         "Chameleon >= 2.4",
     ],
     extras_require={"test": [
+        'futures; python_version == "2.7"',
+        "zope.configuration",
         "zope.pagetemplate",
         "zope.testing",
         "zope.testrunner",
     ]},
+    entry_points={"console_scripts": [
+        "z3c-pt-benchmark = z3c.pt.benchmarks.runner:main",
+        "z3c-pt-precompile = z3c.pt.precompile:main",
+    ]},
     include_package_data=True,
     zip_safe=False,
 )
@@ -0,0 +1,5 @@
+"""Benchmarks for the z3c.pt template classes and expression types.
+
+Run with ``python -m z3c.pt.benchmarks`` or the ``z3c-pt-benchmark``
+script; see ``--help`` for options.
+"""
@@ -0,0 +1,4 @@
+if __name__ == "__main__":  # pragma: no cover
+    from z3c.pt.benchmarks.runner import main
+
+    main()
@@ -0,0 +1,251 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Benchmark runner.
+
+Measures the cold compile time and the warm render throughput and
+latency of each workload and writes the results out as JSON::
+
+  $ z3c-pt-benchmark --output results.json
+
+Timings are reported in milliseconds. The garbage collector is
+disabled while timing (as ``timeit`` does) so that runs are
+comparable. The memory allocated by a render is reported as the mean
+peak of the memory traced by ``tracemalloc`` (in bytes), if it is
+available.
+
+The cold start benchmark renders a view template which is not
+compiled yet in a number of threads at once (32 by default), as the
+first requests of a threaded server do, and reports the number of
+times the template was compiled and the latency of those renders.
+"""
+import argparse
+import gc
+import json
+import math
+import platform
+import sys
+import threading
+import time
+from timeit import default_timer
+
+import pkg_resources
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+from z3c.pt.benchmarks import workloads as _workloads
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(timings, p):
+    """Return the ``p``-th percentile of ``timings`` (nearest rank).
+
+    The timings must be sorted.
+    """
+    index = int(math.ceil(p / 100.0 * len(timings))) - 1
+    return timings[max(0, index)]
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    result = {
+        "min": timings[0] * 1000,
+        "max": timings[-1] * 1000,
+        "mean": sum(timings) / len(timings) * 1000,
+    }
+    for p in PERCENTILES:
+        result["p%d" % p] = percentile(timings, p) * 1000
+    return result
+
+
+def measure(func, number):
+    timings = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(number):
+            start = default_timer()
+            func()
+            timings.append(default_timer() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return timings
+
+
+def measure_memory(func, number):
+    """Return the mean peak of the memory allocated by ``func`` in
+    bytes, or ``None`` if ``tracemalloc`` is not available."""
+
+    if tracemalloc is None:  # pragma: no cover
+        return None
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    peaks = []
+    try:
+        for i in range(number):
+            tracemalloc.clear_traces()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return sum(peaks) / float(len(peaks))
+
+
+def run_workload(workload, number=1000, repeat=20, warmup=50):
+    """Benchmark a single workload; returns a JSON-compatible dict."""
+
+    compile_timings = measure(workload.compile, repeat)
+
+    for i in range(warmup):
+        workload.render()
+
+    render_timings = measure(workload.render, number)
+    render = summarize(render_timings)
+    render["ops_per_second"] = number / sum(render_timings)
+    render["peak_memory"] = measure_memory(workload.render, min(number, 100))
+
+    return {
+        "name": workload.name,
+        "description": workload.description,
+        "compile": summarize(compile_timings),
+        "render": render,
+    }
+
+
+def run_cold_start(threads=32, rows=100):
+    """Render a cold view template in ``threads`` threads at once;
+    returns a JSON-compatible dict."""
+
+    template, render = _workloads.cold_view_template(rows)
+    started = threading.Event()
+    timings = []
+
+    def run():
+        started.wait()
+        start = default_timer()
+        render()
+        timings.append(default_timer() - start)
+
+    workers = [threading.Thread(target=run) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    started.set()
+    for worker in workers:
+        worker.join()
+
+    stats = template.cache.stats()
+    return {
+        "threads": threads,
+        "compiles": stats["misses"],
+        "waits": stats["waits"],
+        "render": summarize(timings),
+    }
+
+
+def environment():
+    versions = {}
+    for name in ("z3c.pt", "Chameleon", "zope.interface", "zope.component"):
+        try:
+            versions[name] = pkg_resources.get_distribution(name).version
+        except pkg_resources.DistributionNotFound:  # pragma: no cover
+            versions[name] = None
+
+    return {
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "versions": versions,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(names=(), rows=100, number=1000, repeat=20, warmup=50, threads=32):
+    """Run the workloads matching ``names`` (all by default) and the
+    cold start benchmark (unless ``threads`` is 0)."""
+
+    _workloads.setUp()
+    results = []
+    for workload in _workloads.make_workloads(rows):
+        if names and not any(name in workload.name for name in names):
+            continue
+        results.append(run_workload(workload, number, repeat, warmup))
+
+    return {
+        "environment": environment(),
+        "parameters": {
+            "rows": rows,
+            "number": number,
+            "repeat": repeat,
+            "warmup": warmup,
+            "threads": threads,
+        },
+        "results": results,
+        "cold_start": run_cold_start(threads, rows) if threads else None,
+    }
+
+
+def main(argv=None, stdout=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark z3c.pt template compilation and rendering."
+    )
+    parser.add_argument(
+        "names", nargs="*",
+        help="run only the workloads whose name contains one of these",
+    )
+    parser.add_argument(
+        "-n", "--number", type=int, default=1000,
+        help="renders timed per workload (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=20,
+        help="cold compiles timed per workload (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-w", "--warmup", type=int, default=50,
+        help="untimed renders before timing (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rows", type=int, default=100,
+        help="items rendered per listing (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-t", "--threads", type=int, default=32,
+        help="threads rendering a cold template at once, 0 to skip the"
+        " cold start benchmark (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="write the JSON results to this file instead of stdout",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.names, args.rows, args.number, args.repeat, args.warmup,
+        args.threads,
+    )
+    data = json.dumps(results, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        stdout = stdout if stdout is not None else sys.stdout
+        stdout.write(data + "\n")
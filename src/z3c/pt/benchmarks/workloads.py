@@ -0,0 +1,301 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Benchmark workloads.
+
+Each workload pairs a template from the ``templates`` directory with
+the data it is rendered against. The template classes are exercised
+as they are used in applications: ``PageTemplate`` from a string,
+``PageTemplateFile`` from disk, ``ViewPageTemplateFile`` on a view and
+``BoundPageTemplate`` through class attribute access.
+"""
+import os
+
+import zope.component
+import zope.interface
+from zope.contentprovider.interfaces import IContentProvider
+from zope.traversing.adapters import DefaultTraversable
+from zope.traversing.interfaces import ITraversable
+from zope.traversing.interfaces import IPathAdapter
+
+from z3c.pt.cache import TemplateCache
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+here = os.path.join(os.path.dirname(__file__), "templates")
+
+
+def template_path(name):
+    return os.path.join(here, name)
+
+
+def template_source(name):
+    with open(template_path(name)) as f:
+        return f.read()
+
+
+class Container(object):
+    """Only reachable through ``ITraversable`` (item access)."""
+
+    def __init__(self, items):
+        self._items = items
+
+    def __getitem__(self, name):
+        return self._items[name]
+
+
+class Record(object):
+    def __init__(self, number):
+        self.fields = {
+            "value": {
+                "title": u"Title %d" % number,
+                "description": u"Description of item %d" % number,
+            }
+        }
+
+
+class Item(object):
+    def __init__(self, number):
+        self.title = u"Item %d" % number
+        self.url = u"http://localhost/items/%d" % number
+        self.record = Record(number)
+        self.container = Container({"entry": {"title": self.title}})
+
+    def method(self):
+        raise AssertionError("Must not be called")
+
+
+class Context(object):
+    title = u"Listing"
+
+
+class Request(object):
+    response = None
+
+
+class View(object):
+    template = PageTemplate(template_source("page.pt"))
+
+    def __init__(self, context, request, rows):
+        self.context = context
+        self.request = request
+        self.items = make_items(rows)
+
+
+class Widget(object):
+    """A small template rendered many times on a page."""
+
+    template = PageTemplate(template_source("widget.pt"))
+
+    name = "form.widgets.title"
+    value = u"Title"
+    title = u"The title"
+
+
+class CachedWidget(Widget):
+    template = PageTemplate(template_source("widget.pt"))
+    template.cache_bound = True
+
+
+@zope.interface.implementer(IContentProvider)
+class Provider(object):
+    def __init__(self, context, request, view):
+        self.context = context
+        self.request = request
+        self.__parent__ = view
+
+    def update(self):
+        self.count = len(self.__parent__.items)
+
+    def render(self):
+        return u"<span>%d items</span>" % self.count
+
+
+class UpperNamespace(object):
+    def __init__(self, context):
+        self.context = context
+
+    def upper(self):
+        return self.context.upper()
+
+
+def make_items(rows):
+    return [Item(number) for number in range(rows)]
+
+
+def setUp():
+    """Register the components the workloads depend upon."""
+
+    zope.component.provideAdapter(
+        DefaultTraversable, (zope.interface.Interface,), ITraversable
+    )
+    zope.component.provideAdapter(
+        Provider,
+        (
+            zope.interface.Interface,
+            zope.interface.Interface,
+            zope.interface.Interface,
+        ),
+        IContentProvider,
+        name="benchmark",
+    )
+    zope.component.provideAdapter(
+        UpperNamespace,
+        (zope.interface.Interface,),
+        IPathAdapter,
+        name="benchmark",
+    )
+
+
+def uncached(factory):
+    """Return a subclass of the template class ``factory`` with a
+    program cache of its own, so that its templates are compiled
+    rather than found in the cache shared by the template classes."""
+
+    class Template(factory):
+        cache = TemplateCache()
+
+    return Template
+
+
+class Workload(object):
+    """A named benchmark.
+
+    The ``compile`` callable creates and compiles a new template
+    (cold); the ``render`` callable renders an already compiled
+    template (warm).
+    """
+
+    def __init__(self, name, description, compile, render):
+        self.name = name
+        self.description = description
+        self.compile = compile
+        self.render = render
+
+
+def file_workload(name, description, filename, render,
+                  factory=PageTemplateFile):
+    """Return a workload for a file-based template.
+
+    The ``render`` function is called with the warm template.
+    """
+
+    path = template_path(filename)
+
+    def compile():
+        template = uncached(factory)(path)
+        template.cook_check()
+        return template
+
+    template = compile()
+    return Workload(name, description, compile, lambda: render(template))
+
+
+def cold_view_template(rows=100):
+    """Return a new view template which is not compiled yet and has a
+    cache of its own, and a function which renders it."""
+
+    template = uncached(ViewPageTemplateFile)(template_path("view.pt"))
+    context = Context()
+    request = Request()
+    view = View(context, request, rows)
+    return template, lambda: template(view, context=context, request=request)
+
+
+def make_workloads(rows=100):
+    """Return the list of workloads with ``rows`` items per listing."""
+
+    items = make_items(rows)
+    context = Context()
+    request = Request()
+    view = View(context, request, rows)
+    source = template_source("page.pt")
+    widget = Widget()
+    cached_widget = CachedWidget()
+
+    def compile_page():
+        return uncached(PageTemplate)(source)
+
+    def compile_widget():
+        return uncached(PageTemplate)(template_source("widget.pt"))
+
+    page = compile_page()
+
+    workloads = [
+        Workload(
+            "PageTemplate",
+            "String template; options and attribute paths.",
+            compile_page,
+            lambda: page(title=u"Listing", items=items),
+        ),
+        file_workload(
+            "PageTemplateFile",
+            "File template; options and attribute paths.",
+            "page.pt",
+            lambda template: template(title=u"Listing", items=items),
+        ),
+        file_workload(
+            "ViewPageTemplateFile",
+            "View template; view, context and request variables.",
+            "view.pt",
+            lambda template: template(view, context=context, request=request),
+            ViewPageTemplateFile,
+        ),
+        Workload(
+            "BoundPageTemplate",
+            "Class attribute access (binding) followed by a call.",
+            compile_page,
+            lambda: view.template(title=u"Listing", items=items),
+        ),
+        Workload(
+            "widget",
+            "Small template; binding and context setup dominate.",
+            compile_widget,
+            lambda: widget.template(),
+        ),
+        Workload(
+            "widget-cached",
+            "Small template bound once per instance (cache_bound).",
+            compile_widget,
+            lambda: cached_widget.template(),
+        ),
+    ]
+
+    for name, description in (
+        ("path", "Deep path traversal over attributes, dicts and items."),
+        ("exists", "The exists: expression and path alternatives."),
+        ("nocall", "The nocall: expression."),
+        ("python", "The path() and string() builtins of python:."),
+        ("namespace", "Function namespaces (ns:) in path expressions."),
+    ):
+        workloads.append(
+            file_workload(
+                "expression-%s" % name,
+                description,
+                "%s.pt" % name,
+                lambda template: template(items=items),
+            )
+        )
+
+    workloads.append(
+        file_workload(
+            "expression-provider",
+            "The provider: expression (content provider lookup).",
+            "provider.pt",
+            lambda template: template(view, context=context, request=request),
+            ViewPageTemplateFile,
+        )
+    )
+
+    return workloads
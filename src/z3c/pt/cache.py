@@ -0,0 +1,338 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import marshal
+import sys
+import threading
+import time
+import types
+import weakref
+from collections import OrderedDict
+
+import zope.component
+import zope.event
+from zope.interface.interfaces import IRegistrationEvent
+
+_lock = threading.Lock()
+_lookup_caches = weakref.WeakSet()
+_marker = object()
+
+
+class LookupCache(object):
+    """Cache for the results of component lookups.
+
+    All lookup caches are cleared when a component is registered or
+    unregistered (see ``invalidate``). If a ``size`` is given, an
+    entry is evicted to make room for a new one when the cache is
+    full. The cache may be used by several threads at once.
+
+      >>> cache = LookupCache(size=2)
+      >>> cache.get('a') is None
+      True
+      >>> cache['a'] = 1
+      >>> cache['b'] = 2
+      >>> cache['c'] = 3
+      >>> len(cache)
+      2
+      >>> cache.get('c')
+      3
+      >>> sorted(cache.stats().items())
+      [('entries', 2), ('hits', 1), ('misses', 1)]
+
+      >>> invalidate()
+      >>> len(cache)
+      0
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.data = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        with _lock:
+            _lookup_caches.add(self)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            data = self.data
+            if self.size is not None and len(data) >= self.size and (
+                key not in data
+            ):
+                data.pop(next(iter(data), None), None)
+            data[key] = value
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ExpressionCache(LookupCache):
+    """Cache for expressions compiled at runtime.
+
+    Its statistics include the ratio of hits to lookups.
+
+      >>> cache = ExpressionCache(size=10)
+      >>> cache['python:1'] = 1
+      >>> cache.get('python:1')
+      1
+      >>> cache.get('python:2') is None
+      True
+      >>> sorted(cache.stats().items())
+      [('entries', 1), ('hits', 1), ('misses', 1), ('ratio', 0.5)]
+    """
+
+    def stats(self):
+        stats = super(ExpressionCache, self).stats()
+        lookups = self.hits + self.misses
+        stats["ratio"] = float(self.hits) / lookups if lookups else None
+        return stats
+
+
+class AdapterLookupCache(LookupCache):
+    """Cache for adapter factories.
+
+    Factories are looked up in the adapter registry of the current
+    site manager and cached on the required specifications, the site
+    manager, the provided interface and the name; ``None`` is cached
+    when there is no such adapter. Registrations made without an
+    event (for instance using ``provideAdapter``) are not noticed;
+    call ``invalidate`` after making them.
+    """
+
+    def lookup(self, required, provided, name=u""):
+        """Return the factory adapting objects which provide the
+        specifications in the ``required`` tuple to ``provided``."""
+
+        sm = zope.component.getSiteManager()
+        key = required, sm, provided, name
+        factory = self.get(key, _marker)
+        if factory is not _marker:
+            return factory
+
+        factory = sm.adapters.lookup(required, provided, name)
+        self[key] = factory
+        return factory
+
+
+class TemplateCache(object):
+    """Cache for compiled template programs.
+
+    Programs are cached on the module name, which is derived from a
+    digest of the template source and configuration, so templates
+    with the same source share a program. The least recently used
+    program is evicted when the cache holds more than ``size``
+    programs; a program loaded as a module (from an on-disk cache)
+    is removed from ``sys.modules`` as well. Programs are also
+    referred to weakly (by their ``initialize`` function), so that an
+    evicted program is still shared as long as a template uses it;
+    with a ``size`` of 0, programs are freed as soon as no template
+    uses them.
+
+    A program is compiled by a single thread (see ``load``): threads
+    which need a program another thread is compiling wait for it.
+
+    The statistics include the total time spent compiling (or
+    loading) programs in seconds, the approximate memory of a program
+    in bytes (the size of its marshalled bytecode) and the number of
+    times a thread waited for a program.
+
+      >>> cache = TemplateCache(size=1)
+      >>> cache.get('a.py') is None
+      True
+      >>> cache.set('a.py', {}, 0.5)
+      >>> cache.get('a.py')
+      {}
+      >>> cache.set('b.py', {}, 0.25)
+      >>> len(cache)
+      1
+      >>> sorted(cache.stats().items())
+      [('compile_time', 0.75), ('entries', 1), ('hits', 1),
+       ('live', 0), ('memory', 0), ('memory_per_entry', 0),
+       ('misses', 1), ('waits', 0)]
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.live = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.compile_time = 0.0
+        self.memory = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, name):
+        with self.lock:
+            program = self._lookup(name)
+            if program is None:
+                self.misses += 1
+            return program
+
+    def _lookup(self, name):
+        # Called with the lock held; counts the hits.
+        entry = self.data.pop(name, None)
+        if entry is not None:
+            self.data[name] = entry
+            self.hits += 1
+            return entry[0]
+
+        initialize = self.live.get(name)
+        if initialize is not None:
+            self.hits += 1
+            return initialize.__globals__
+
+    def load(self, name, compile):
+        """Return the program ``name``, calling ``compile`` to compile
+        it if it is not in the cache.
+
+        If another thread is compiling the program, the thread waits
+        for it rather than compiling the program as well. If that
+        compilation fails, the program is compiled again.
+
+          >>> cache = TemplateCache()
+          >>> cache.load('a.py', dict)
+          {}
+          >>> cache.load('a.py', None)
+          {}
+        """
+
+        while True:
+            with self.lock:
+                program = self._lookup(name)
+                if program is not None:
+                    return program
+
+                compiled = self.pending.get(name)
+                if compiled is None:
+                    compiled = self.pending[name] = threading.Event()
+                    self.misses += 1
+                    break
+
+                self.waits += 1
+            compiled.wait()
+
+        try:
+            start = time.time()
+            program = compile()
+            self.set(name, program, time.time() - start)
+        finally:
+            with self.lock:
+                del self.pending[name]
+            compiled.set()
+        return program
+
+    def set(self, name, program, seconds=0.0):
+        memory = sum(
+            len(marshal.dumps(value.__code__))
+            for value in program.values()
+            if isinstance(value, types.FunctionType)
+        )
+
+        with self.lock:
+            self.compile_time += seconds
+            data = self.data
+            self._evict(data.pop(name, None))
+            data[name] = program, memory
+            self.memory += memory
+            initialize = program.get("initialize")
+            if isinstance(initialize, types.FunctionType):
+                self.live[name] = initialize
+            while self.size is not None and len(data) > self.size:
+                self._evict(data.popitem(last=False)[1])
+
+    def clear(self):
+        with self.lock:
+            while self.data:
+                self._evict(self.data.popitem()[1])
+
+    def stats(self):
+        entries = len(self.data)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "live": len(self.live),
+            "compile_time": self.compile_time,
+            "memory": self.memory,
+            "memory_per_entry": self.memory // entries if entries else 0,
+        }
+
+    def _evict(self, entry):
+        if entry is None:
+            return
+
+        program, memory = entry
+        self.memory -= memory
+        module = sys.modules.get(program.get("__name__"))
+        if getattr(module, "__dict__", None) is program:
+            del sys.modules[program["__name__"]]
+
+
+def invalidate():
+    """Clear all lookup caches.
+
+    This is done when a component is registered or unregistered with
+    an event, and on test cleanup; registrations made without an
+    event, for instance using ``zope.component.provideAdapter``, must
+    be followed by a call to this function.
+    """
+
+    with _lock:
+        caches = list(_lookup_caches)
+
+    for cache in caches:
+        cache.clear()
+
+
+def _invalidate_on_registration(event):
+    if IRegistrationEvent.providedBy(event):
+        invalidate()
+
+
+zope.event.subscribers.append(_invalidate_on_registration)
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ImportError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(invalidate)
@@ -13,44 +13,97 @@
 ##############################################################################
 import re
 import ast
+import contextlib
+import functools
+import threading
+import types
+import uuid
 from types import MethodType
 
 import z3c.pt.namespaces
 
+import zope.component
 import zope.event
+from zope.component.hooks import getSite
+from zope.component.hooks import setSite
+from zope.interface import providedBy
+from zope.security import management
 
+from zope.traversing.adapters import DefaultTraversable
 from zope.traversing.adapters import traversePathElement
 from zope.contentprovider.interfaces import IContentProvider
 from zope.contentprovider.interfaces import ContentProviderLookupError
 from zope.contentprovider.tales import addTALNamespaceData
 from zope.traversing.interfaces import ITraversable
 from zope.location.interfaces import ILocation
+from zope.location.interfaces import LocationError
 from zope.contentprovider.interfaces import BeforeUpdateEvent
 
+from chameleon.compiler import Compiler
+from chameleon.nodes import Assignment
+from chameleon.nodes import Context
+from chameleon.nodes import Module
 from chameleon.tales import TalesExpr
+from chameleon.tales import exc_clear
+from chameleon.tales import match_prefix
+from chameleon.tales import resolve_global
+from chameleon.tales import split_parts
 from chameleon.tales import ExistsExpr as BaseExistsExpr
+from chameleon.tales import ExpressionParser as BaseExpressionParser
 from chameleon.tales import PythonExpr as BasePythonExpr
 from chameleon.tales import StringExpr
 from chameleon.codegen import template
 from chameleon.astutil import load
+from chameleon.astutil import store
 from chameleon.astutil import Symbol
 from chameleon.astutil import Builtin
+from chameleon.astutil import Static
 from chameleon.astutil import NameLookupRewriteVisitor
 from chameleon.exc import ExpressionError
 
+from z3c.pt.cache import AdapterLookupCache
+from z3c.pt.cache import ExpressionCache
+from z3c.pt.cache import LookupCache
+from z3c.pt.fragments import RAMFragmentCache
+from z3c.pt.fragments import fragment_key
+from z3c.pt.interfaces import IContentProviderCacheKey
+from z3c.pt.interfaces import IFragmentCache
+from z3c.pt.interfaces import IThreadSafeContentProvider
+
 _marker = object()
 
+#: The content provider factories used by ``provider:`` expressions.
+content_providers = AdapterLookupCache(size=1000)
+
+#: The ``IContentProviderCacheKey`` adapter factories of content
+#: providers.
+provider_cache_keys = AdapterLookupCache(size=1000)
+
+#: The output of content providers which have a cache key, unless
+#: an ``IFragmentCache`` utility named "provider" is registered.
+provider_outputs = RAMFragmentCache(size=1000)
+
+#: The expressions evaluated at runtime by the ``path()``,
+#: ``exists()``, ``string()`` and ``nocall()`` functions of python
+#: expressions, compiled.
+compiled_expressions = ExpressionCache(size=1000)
 
-def render_content_provider(econtext, name):
+
+def render_content_provider(econtext, name, defer=False):
     name = name.strip()
 
     context = econtext.get("context")
     request = econtext.get("request")
     view = econtext.get("view")
 
-    cp = zope.component.queryMultiAdapter(
-        (context, request, view), IContentProvider, name=name
+    # the factory is cached on the provided interfaces of the
+    # objects (see ``content_providers``).
+    factory = content_providers.lookup(
+        (providedBy(context), providedBy(request), providedBy(view)),
+        IContentProvider,
+        name,
     )
+    cp = factory(context, request, view) if factory is not None else None
 
     # provide a useful error message, if the provider was not found.
     # Be sure to provide the objects in addition to the name so
@@ -65,12 +118,221 @@ def render_content_provider(econtext, name):
     # Insert the data gotten from the context
     addTALNamespaceData(cp, econtext)
 
+    # The output of a provider which has a cache key is cached across
+    # requests; on a hit, it is neither updated nor rendered.
+    store = None
+    cached = cached_output(econtext, cp, name)
+    if cached is not None:
+        cache, key = cached
+        output = cache.get(key)
+        if output is not None:
+            return output
+        store = functools.partial(store_output, cache, key)
+
+    # Thread-safe providers are updated and rendered concurrently if
+    # the template has an executor (see ``ConcurrentProviders``) and
+    # the output is inserted as is.
+    providers = econtext.get("__providers") if defer else None
+    if providers is not None and IThreadSafeContentProvider.providedBy(cp):
+        return providers.submit(econtext, cp, request, store)
+
+    return update_and_render(econtext, cp, request, store)
+
+
+def defer_content_provider(econtext, name):
+    """Render the content provider ``name`` for output which is
+    inserted as structure; the compiler uses this function rather than
+    ``render_content_provider`` for such content (the output may be a
+    placeholder for the output of a concurrent provider)."""
+
+    return render_content_provider(econtext, name, True)
+
+
+render_content_provider.deferred = defer_content_provider
+
+
+def cached_output(econtext, cp, name):
+    """Return the cache and the key for the output of the content
+    provider ``cp``, or ``None`` if it has no cache key."""
+
+    factory = provider_cache_keys.lookup(
+        (providedBy(cp),), IContentProviderCacheKey
+    )
+    adapter = factory(cp) if factory is not None else None
+    key = getattr(adapter, "key", None)
+    if key is None:
+        return None
+
+    cache = zope.component.queryUtility(
+        IFragmentCache, name="provider", default=provider_outputs
+    )
+    cls = type(cp)
+    name = u"provider:%s:%s.%s" % (name, cls.__module__, cls.__name__)
+    return cache, fragment_key(name, key, econtext.get("target_language"))
+
+
+def store_output(cache, key, output):
+    cache.set(key, u"" if output is None else output)
+
+
+def update_and_render(econtext, cp, request, store=None):
     # Stage 1: Do the state update.
     zope.event.notify(BeforeUpdateEvent(cp, request))
-    cp.update()
+    resolve_awaitable(econtext, cp.update())
 
     # Stage 2: Render the HTML content.
-    return cp.render()
+    output = resolve_awaitable(econtext, cp.render())
+    if store is not None:
+        store(output)
+    return output
+
+
+def resolve_awaitable(econtext, value):
+    """Return the result of the awaitable ``value`` when the template
+    is rendered using ``render_async``; otherwise, ``value``."""
+
+    awaiter = econtext.get("__await")
+    if awaiter is None:
+        return value
+    return awaiter(value)
+
+
+class EventLoopAwaiter(object):
+    """Awaits awaitables on an event loop from another thread."""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def __call__(self, awaitable):
+        import asyncio
+        from concurrent.futures import Future
+
+        future = Future()
+
+        def done(task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def schedule():
+            try:
+                task = asyncio.ensure_future(awaitable, loop=self.loop)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                task.add_done_callback(done)
+
+        self.loop.call_soon_threadsafe(schedule)
+        return future.result()
+
+
+def translate_await(target):
+    """Return statements which resolve ``target`` if it is awaitable
+    (see ``resolve_awaitable``)."""
+
+    return template(
+        "if getattr(target, '__await__', None) is not None:\n"
+        "    target = resolve(econtext, target)",
+        getattr=getattr,
+        resolve=Symbol(resolve_awaitable),
+        target=target,
+    )
+
+
+def thread_state():
+    """Return the thread-local state which rendering depends upon: the
+    current site and the security interaction."""
+
+    return getSite(), management.queryInteraction()
+
+
+def _restore_thread_state(state):
+    site, interaction = state
+    setSite(site)
+    if interaction is None:
+        management.thread_local.__dict__.pop("interaction", None)
+    else:
+        management.thread_local.interaction = interaction
+
+
+@contextlib.contextmanager
+def inherited_thread_state(state):
+    """Set up the ``thread_state()`` of another thread while in the
+    context."""
+
+    previous = thread_state()
+    _restore_thread_state(state)
+    try:
+        yield
+    finally:
+        _restore_thread_state(previous)
+
+
+_worker = threading.local()
+
+
+def update_and_render_worker(state, econtext, cp, request, store=None):
+    """Update and render a content provider in a worker thread."""
+
+    with inherited_thread_state(state):
+        _worker.active = True
+        try:
+            return update_and_render(econtext, cp, request, store)
+        finally:
+            _worker.active = False
+
+
+class ConcurrentProviders(object):
+    """Content providers which are updated and rendered on an
+    executor while a template renders.
+
+    A submitted provider is represented in the output by a
+    placeholder; ``stitch`` waits for the providers and replaces the
+    placeholders with their output, in document order.
+
+    Providers used by templates which are rendered from within a
+    worker thread are updated and rendered sequentially, so that a
+    bounded executor cannot deadlock waiting for itself.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.prefix = "z3c.pt.provider.%s." % uuid.uuid4().hex
+        self.futures = []
+
+    def submit(self, econtext, cp, request, store=None):
+        if getattr(_worker, "active", False):
+            return update_and_render(econtext, cp, request, store)
+
+        future = self.executor.submit(
+            update_and_render_worker,
+            thread_state(),
+            econtext,
+            cp,
+            request,
+            store,
+        )
+        self.futures.append(future)
+        return "%s%d." % (self.prefix, len(self.futures) - 1)
+
+    def stitch(self, output):
+        if not self.futures:
+            return output
+
+        results = [future.result() for future in self.futures]
+        results = [u"" if result is None else result for result in results]
+        return re.sub(
+            re.escape(self.prefix) + r"(\d+)\.",
+            lambda match: results[int(match.group(1))],
+            output,
+        )
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
 
 
 def path_traverse(base, econtext, call, path_items):
@@ -84,7 +346,7 @@ def path_traverse(base, econtext, call, path_items):
             ns_used = ":" in name
             if ns_used:
                 namespace, name = name.split(":", 1)
-                base = z3c.pt.namespaces.function_namespaces[namespace](base)
+                base = z3c.pt.namespaces.lookup(namespace)(base)
                 if ITraversable.providedBy(base):
                     base = traversePathElement(
                         base, name, path_items, request=request
@@ -120,6 +382,291 @@ def path_traverse(base, econtext, call, path_items):
     return base
 
 
+def path_traverse_miss(base, econtext, call, name, path_items):
+    """Continue a traversal which could not find ``name`` by item or
+    attribute lookup; used by the code that ``PathExpr`` compiles."""
+
+    path_items = list(path_items)
+    path_items.reverse()
+    base = traversePathElement(
+        base, name, path_items, request=econtext.get("request")
+    )
+    path_items.reverse()
+    return path_traverse(base, econtext, call, path_items)
+
+
+class Missing(object):
+    """The value of a path which is not found, when it is compiled
+    with ``PathExpr.assign_missing`` (the class itself is the
+    marker)."""
+
+
+def default_traverse(base, name):
+    """Traverse ``name`` as ``DefaultTraversable`` does, returning
+    ``Missing`` rather than raising ``LocationError``."""
+
+    next = getattr(base, name, _marker)
+    if next is not _marker:
+        return next
+    if hasattr(base, "__getitem__"):
+        try:
+            return base[name]
+        except (KeyError, TypeError):
+            pass
+    return Missing
+
+
+def find_element(base, name, path_items, request):
+    """Traverse ``name`` as ``traversePathElement`` does, returning
+    ``Missing`` if it is not found.
+
+    Objects which are adapted to ``ITraversable`` by
+    ``DefaultTraversable`` are traversed without raising an
+    exception.
+    """
+
+    if name not in (".", "..") and name[:1] not in "@+":
+        spec = providedBy(base)
+        if not spec.isOrExtends(ITraversable) and getattr(
+            base, "__conform__", None
+        ) is None:
+            sm = zope.component.getSiteManager()
+            factory = sm.adapters.lookup((spec,), ITraversable, u"")
+            if factory is DefaultTraversable:
+                return default_traverse(base, name)
+
+    return traversePathElement(
+        base, name, path_items, default=Missing, request=request
+    )
+
+
+def path_find(base, econtext, call, path_items):
+    """Traverse like ``path_traverse``, returning ``Missing`` if the
+    path is not found (see ``find_element``)."""
+
+    request = econtext.get("request")
+    path_items = list(path_items)
+    path_items.reverse()
+
+    while path_items:
+        name = path_items.pop()
+        ns_used = ":" in name
+        if ns_used:
+            namespace, name = name.split(":", 1)
+            base = z3c.pt.namespaces.lookup(namespace)(base)
+            if ITraversable.providedBy(base):
+                base = traversePathElement(
+                    base, name, path_items, default=Missing, request=request
+                )
+                if base is Missing:
+                    return base
+                continue
+
+        if isinstance(base, dict):
+            next = base.get(name, _marker)
+        else:
+            next = getattr(base, name, _marker)
+
+        if next is _marker:
+            base = find_element(base, name, path_items, request)
+            if base is Missing:
+                return base
+        else:
+            base = next
+            if ns_used and isinstance(base, MethodType):
+                base = base()
+
+    if call and getattr(base, "__call__", _marker) is not _marker:
+        return base()
+
+    return base
+
+
+def path_find_miss(base, econtext, call, name, path_items):
+    """Continue a traversal like ``path_traverse_miss``, returning
+    ``Missing`` if the path is not found."""
+
+    path_items = list(path_items)
+    path_items.reverse()
+    base = find_element(base, name, path_items, econtext.get("request"))
+    if base is Missing:
+        return base
+    path_items.reverse()
+    return path_find(base, econtext, call, path_items)
+
+
+class PathTraversalCache(LookupCache):
+    """Inline cache for a path segment that is compiled into a
+    template.
+
+    It is used when the segment is not found by item or attribute
+    lookup and remembers the ``ITraversable`` adapter factory for the
+    last few kinds of objects seen (keyed on the provided interfaces
+    and the site manager); later evaluations traverse using the
+    remembered factory directly instead of ``traversePathElement``.
+
+    The entries are cleared when a component is registered or
+    unregistered with an event (see ``z3c.pt.cache``); registrations
+    made without one, for instance using ``provideAdapter``, must be
+    followed by a call to ``z3c.pt.cache.invalidate()``.
+    """
+
+    size = 4
+
+    def __init__(self, name):
+        super(PathTraversalCache, self).__init__(self.size)
+        self.name = name
+
+    def factory(self, base):
+        """Return the ``ITraversable`` adapter factory for ``base``
+        (or ``None`` if it must be traversed generically)."""
+
+        spec = providedBy(base)
+        sm = zope.component.getSiteManager()
+        factory = self.get((spec, sm))
+        if factory is not None:
+            return factory
+
+        factory = None
+        if spec.isOrExtends(ITraversable):
+            factory = _provided
+        elif getattr(base, "__conform__", None) is None:
+            factory = sm.adapters.lookup((spec,), ITraversable, u"")
+
+        if factory is not None:
+            self[spec, sm] = factory
+        return factory
+
+    def __call__(self, base, econtext, call, path_items):
+        factory = self.factory(base)
+        traversable = factory(base) if factory is not None else None
+        if traversable is None:
+            return path_traverse_miss(
+                base, econtext, call, self.name, path_items
+            )
+
+        path_items = list(path_items)
+        path_items.reverse()
+        base = traversable.traverse(self.name, path_items)
+        path_items.reverse()
+        return path_traverse(base, econtext, call, path_items)
+
+    def find(self, base, econtext, call, path_items):
+        """Traverse like ``__call__``, returning ``Missing`` if the
+        path is not found."""
+
+        factory = self.factory(base)
+        if factory is DefaultTraversable:
+            base = default_traverse(base, self.name)
+        else:
+            traversable = factory(base) if factory is not None else None
+            if traversable is None:
+                return path_find_miss(
+                    base, econtext, call, self.name, path_items
+                )
+
+            path_items = list(path_items)
+            path_items.reverse()
+            try:
+                base = traversable.traverse(self.name, path_items)
+            except LocationError:
+                return Missing
+            path_items.reverse()
+
+        if base is Missing:
+            return base
+        return path_find(base, econtext, call, path_items)
+
+
+def _provided(ob):
+    return ob
+
+
+def path_namespace(base, namespace):
+    return z3c.pt.namespaces.lookup(namespace)(base)
+
+
+def try_except(body, exceptions, handler, orelse=None):
+    """Return a ``try`` statement which runs ``handler`` if ``body``
+    raises one of ``exceptions`` (and ``orelse`` otherwise)."""
+
+    source = "try:\n    pass\nexcept exceptions:\n    pass"
+    if orelse is not None:
+        source += "\nelse:\n    pass"
+
+    stmts = template(
+        source,
+        exceptions=ast.Tuple(
+            elts=list(map(resolve_global, exceptions)), ctx=ast.Load()
+        ),
+    )
+    stmts[0].body = body
+    stmts[0].handlers[0].body = handler
+    if orelse is not None:
+        stmts[0].orelse = orelse
+    return stmts
+
+
+def provides_any(ob, interfaces):
+    """Return whether ``ob`` provides one of ``interfaces``."""
+
+    spec = providedBy(ob)
+    for iface in interfaces:
+        if spec.isOrExtends(iface):
+            return True
+    return False
+
+
+def pure_expression_types(expression_types, paths=(), attributes=()):
+    """Return the ``expression_types`` with the path expression types
+    replaced by types which evaluate pure path expressions once for
+    each object they start from in a render.
+
+    A path expression is pure if its value only depends on the object
+    it starts from (for the duration of a render). The pure paths are
+    given as the ``paths`` themselves (such as "view/portal_url") and
+    as ``attributes`` of interfaces (such as ``IView["portal_url"]``):
+    a path of two segments whose second segment is the name of such
+    an attribute is pure if the object it starts from provides the
+    interface.
+
+    >>> from zope.interface import Attribute, Interface
+    >>> class IView(Interface):
+    ...     portal_url = Attribute("The URL of the portal.")
+    >>> types = pure_expression_types(
+    ...     {"path": PathExpr, "string": StringExpr},
+    ...     ["context/absolute_url"], [IView["portal_url"]],
+    ... )
+    >>> types["string"] is StringExpr
+    True
+    >>> issubclass(types["path"], PathExpr)
+    True
+    >>> sorted(types["path"].pure_paths)
+    ['context/absolute_url']
+    >>> types["path"].pure_attributes == {"portal_url": (IView,)}
+    True
+    """
+
+    pure_attributes = {}
+    for attribute in attributes:
+        name = attribute.getName()
+        pure_attributes[name] = pure_attributes.get(name, ()) + (
+            attribute.interface,
+        )
+
+    namespace = {
+        "pure_paths": frozenset(paths),
+        "pure_attributes": pure_attributes,
+    }
+
+    types = {}
+    for name, factory in expression_types.items():
+        if isinstance(factory, type) and issubclass(factory, PathExpr):
+            factory = type(factory.__name__, (factory,), namespace)
+        types[name] = factory
+    return types
+
+
 class ContextExpressionMixin(object):
     """Mixin-class for expression compilers."""
 
@@ -150,6 +697,16 @@ class PathExpr(TalesExpr):
 
     traverser = Symbol(path_traverse)
 
+    marker = Static(
+        template("object()", object=object, mode="eval"), "__path_marker"
+    )
+
+    # The paths (such as "view/portal_url") which are pure, and the
+    # interfaces which make the paths of two segments pure, by the
+    # name of the second segment (see ``pure_expression_types``).
+    pure_paths = frozenset()
+    pure_attributes = {}
+
     def _find_translation_components(self, parts):
         components = []
         for part in parts[1:]:
@@ -181,12 +738,111 @@ class PathExpr(TalesExpr):
 
         return components
 
+    def __call__(self, target, engine):
+        return self._assign(target, engine, False)
+
+    def assign_missing(self, target, engine):
+        """Return statements which assign the value of the expression
+        to ``target``, or ``Missing`` if none of its paths is found.
+
+        Paths which are not found are not traversed using exceptions
+        (see ``translate_missing``).
+        """
+
+        return self._assign(target, engine, True)
+
+    def _assign(self, target, engine, missing):
+        # The alternatives are split as ``TalesExpr`` does it; each
+        # alternative but the last (all of them if ``missing`` is
+        # true) is compiled with ``translate_missing``, and the next
+        # one is evaluated if its value is ``Missing`` (or if it
+        # raises one of the ``exceptions``).
+        alternatives = []
+        remaining = self.expression
+
+        while remaining:
+            if self.ignore_prefix and match_prefix(remaining) is not None:
+                alternatives.append(
+                    engine.parse(remaining).assign_value(target)
+                )
+                break
+
+            m = split_parts.search(remaining)
+            if m is None:
+                expression, remaining = remaining, ""
+            else:
+                expression = remaining[:m.start()]
+                remaining = remaining[m.end():]
+
+            alternatives.append(expression.replace("\\|", "|"))
+
+        if not alternatives:
+            raise ExpressionError("No input:", remaining)
+
+        body = None
+        for alternative in reversed(alternatives):
+            if isinstance(alternative, list):
+                body = alternative
+                continue
+
+            if body is None and not missing:
+                body = self.translate(alternative, target)
+                continue
+
+            if self._translates_missing():
+                stmts = self.translate_missing(alternative, target)
+            else:
+                stmts = self.translate(alternative, target)
+            if body is None:
+                body = stmts
+                continue
+
+            handler = template("target = missing", target=target,
+                               missing=Missing)
+            if exc_clear is not None:  # pragma: no cover
+                handler += template("__exc_clear()")
+
+            body = try_except(stmts, self.exceptions, handler) + [
+                ast.If(
+                    test=template(
+                        "target is missing", target=target, missing=Missing,
+                        mode="eval",
+                    ),
+                    body=body,
+                    orelse=[],
+                ),
+            ]
+
+        return body
+
     def translate(self, string, target):
         """
         >>> from chameleon.tales import test
         >>> test(PathExpr('None')) is None
         True
         """
+        return self._translate(string, target, False)
+
+    def translate_missing(self, string, target):
+        """Return statements which assign the value of the path
+        ``string`` to ``target``, or ``Missing`` if it is not found.
+
+        Objects adapted by ``DefaultTraversable`` are traversed
+        without raising an exception when a name is not found.
+        """
+
+        return self._translate(string, target, True)
+
+    def _translates_missing(self):
+        """Return whether ``translate_missing`` compiles paths as
+        ``translate`` does; a subclass which only overrides
+        ``translate`` is compiled with it."""
+
+        for cls in type(self).__mro__:
+            if "translate" in cls.__dict__:
+                return "translate_missing" in cls.__dict__
+
+    def _translate(self, string, target, missing):
         string = string.strip()
 
         if not string:
@@ -211,16 +867,227 @@ class PathExpr(TalesExpr):
             else:
                 components = ()
 
-        call = template(
-            "traverse(base, econtext, call, path_items)",
-            traverse=self.traverser,
-            base=load(base),
-            call=load(str(not nocall)),
-            path_items=ast.Tuple(elts=components),
+        # A custom traverser must see every path; otherwise, static
+        # path segments are compiled into inline lookups.
+        if self.traverser is not PathExpr.traverser or (
+            components and not isinstance(components[0], ast.Str)
+        ):
+            stmts = template(
+                "target = traverse(base, econtext, call, path_items)",
+                traverse=self._traverser(missing),
+                base=load(base),
+                call=load(str(not nocall)),
+                path_items=ast.Tuple(elts=components),
+                target=target,
+            )
+        else:
+            stmts = self._translate_inline(
+                load(base), parts[1:], not nocall, target, missing
+            )
+
+        # The value of a path (or the result of calling it) may be
+        # awaitable.
+        if not nocall:
+            stmts += translate_await(target)
+
+        if path in self.pure_paths:
+            interfaces = ()
+        elif len(parts) == 2 and parts[1] in self.pure_attributes:
+            interfaces = self.pure_attributes[parts[1]]
+        else:
+            return stmts
+
+        key = "%s:%s" % (nocall, path) if nocall else path
+        return self._translate_pure(stmts, key, load(base), target, interfaces)
+
+    def _translate_pure(self, stmts, key, base, target, interfaces):
+        """Return statements which evaluate the pure path ``key`` (with
+        ``stmts``) once for each object ``base`` in a render.
+
+        The values are kept in the ``__pure_paths`` dictionary of the
+        render. If ``interfaces`` are given, the value is kept only if
+        ``base`` provides one of them.
+        """
+
+        lookup = template(
+            "__pure_memo = econtext.get('__pure_paths')\n"
+            "if __pure_memo is None:\n"
+            "    __pure_memo = econtext['__pure_paths'] = {}\n"
+            "__pure_base = base\n"
+            "__pure_entry = __pure_memo.get(key)\n"
+            "if __pure_entry is not None and __pure_entry[0] is __pure_base:\n"
+            "    target = __pure_entry[1]\n"
+            "else:\n"
+            "    pass",
+            base=base,
+            key=ast.Str(s=key),
+            target=target,
+        )
+
+        condition = "target is not missing"
+        if interfaces:
+            condition += " and provides(__pure_base, interfaces)"
+
+        lookup[-1].orelse = stmts + template(
+            "if " + condition + ":\n"
+            "    __pure_memo[key] = __pure_base, target",
+            key=ast.Str(s=key),
+            target=target,
+            missing=Missing,
+            provides=Symbol(provides_any),
+            interfaces=ast.Tuple(
+                elts=[Symbol(iface) for iface in interfaces], ctx=ast.Load()
+            ),
+        )
+        return lookup
+
+    def _path_items(self, names):
+        # Each use needs its own nodes; the name lookups in
+        # interpolated segments must be rewritten exactly once.
+        components = self._find_translation_components([None] + names)
+        return ast.Tuple(elts=components, ctx=ast.Load())
+
+    def _traverser(self, missing):
+        if missing and self.traverser is PathExpr.traverser:
+            return Symbol(path_find)
+        return self.traverser
+
+    def _translate_inline(self, base, names, call, target, missing=False):
+        """Return statements which look up each static path segment
+        by item (dictionaries) or attribute, resolving function
+        namespaces at compile time.
+
+        The generic traversal (``traversePathElement``) is used only
+        when such a lookup misses and for the segments following an
+        interpolated segment. If ``missing`` is true, the value of a
+        path which is not found is ``Missing``.
+        """
+
+        call = load(str(call))
+        stmts = body = template("__path_base = base", base=base)
+
+        for i, name in enumerate(names):
+            if self.interpolation_regex.search(name):
+                body += template(
+                    "target = traverse(__path_base, econtext, call, items)",
+                    traverse=self._traverser(missing),
+                    call=call,
+                    items=self._path_items(names[i:]),
+                    target=target,
+                )
+                return stmts
+
+            step = self._translate_step(name)
+            step += template(
+                "if __path_next is marker:\n"
+                "    target = miss\n"
+                "else:\n"
+                "    __path_base = __path_next",
+                marker=self.marker,
+                miss=self._translate_miss(
+                    name.split(":", 1)[-1], call, names[i + 1:], missing
+                ),
+                target=target,
+            )
+
+            body += step
+            body = step[-1].orelse
+
+            if ":" in name:
+                body += template(
+                    "if isinstance(__path_base, types.MethodType):\n"
+                    "    __path_base = __path_base()",
+                    isinstance=isinstance,
+                    types=Symbol(types),
+                )
+
+        if call.id == "True":
+            body += template(
+                "if getattr(__path_base, '__call__', marker) is not marker:\n"
+                "    target = __path_base()\n"
+                "else:\n"
+                "    target = __path_base",
+                getattr=getattr,
+                marker=self.marker,
+                target=target,
+            )
+        else:
+            body += template("target = __path_base", target=target)
+
+        return stmts
+
+    def _translate_miss(self, name, call, names, missing=False):
+        """Return an expression which traverses ``name`` and the
+        following path segments when item and attribute lookup
+        failed."""
+
+        # Names with a special meaning to ``traversePathElement``
+        # (parents and traversal namespaces) are not cached.
+        if name in (".", "..") or name[:1] in "@+":
+            return template(
+                "miss(__path_base, econtext, call, name, items)",
+                miss=Symbol(path_find_miss if missing else path_traverse_miss),
+                call=call,
+                name=ast.Str(s=name),
+                items=self._path_items(names),
+                mode="eval",
+            )
+
+        cache = template(
+            "PathTraversalCache(name)",
+            PathTraversalCache=Symbol(PathTraversalCache),
+            name=ast.Str(s=name),
+            mode="eval",
+        )
+
+        return template(
+            "cache.find(__path_base, econtext, call, items)"
+            if missing else
+            "cache(__path_base, econtext, call, items)",
+            cache=Static(cache),
+            call=call,
+            items=self._path_items(names),
             mode="eval",
         )
 
-        return template("target = value", target=target, value=call)
+    def _translate_step(self, name):
+        """Return statements which assign the value of the path
+        segment ``name`` to ``__path_next`` or the marker on a miss."""
+
+        lookup = (
+            "if isinstance(__path_base, dict):\n"
+            "    __path_next = __path_base.get(name, marker)\n"
+            "else:\n"
+            "    __path_next = getattr(__path_base, name, marker)"
+        )
+
+        if ":" not in name:
+            return template(
+                lookup,
+                isinstance=isinstance,
+                dict=dict,
+                getattr=getattr,
+                name=ast.Str(s=name),
+                marker=self.marker,
+            )
+
+        # A traversable namespace adapter is always traversed using
+        # the generic traversal.
+        namespace, name = name.split(":", 1)
+        return template(
+            "__path_base = namespace(__path_base, prefix)\n"
+            "if ITraversable.providedBy(__path_base):\n"
+            "    __path_next = marker\n"
+            "el" + lookup,
+            namespace=Symbol(path_namespace),
+            prefix=ast.Str(s=namespace),
+            ITraversable=Symbol(ITraversable),
+            isinstance=isinstance,
+            dict=dict,
+            getattr=getattr,
+            name=ast.Str(s=name),
+            marker=self.marker,
+        )
 
 
 class NocallExpr(PathExpr):
@@ -231,13 +1098,56 @@ class NocallExpr(PathExpr):
             "nocall:%s" % expression, engine
         )
 
+    def translate_missing(self, expression, target):
+        return super(NocallExpr, self).translate_missing(
+            "nocall:%s" % expression, target
+        )
+
 
 class ExistsExpr(BaseExistsExpr):
     exceptions = AttributeError, LookupError, TypeError, KeyError, NameError
 
+    #: The parser of the expression (see ``ExpressionParser``).
+    parser = None
+
     def __init__(self, expression):
         super(ExistsExpr, self).__init__("nocall:" + expression)
 
+    def __call__(self, target, engine):
+        # A path which is not found is ``Missing`` rather than an
+        # exception (see ``PathExpr.assign_missing``).
+        parser = self.parser
+        expression = parser(self.expression) if parser is not None else None
+        if not isinstance(expression, PathExpr):
+            return super(ExistsExpr, self).__call__(target, engine)
+
+        value = store("__exists_value")
+        return try_except(
+            expression.assign_missing(value, engine),
+            self.exceptions,
+            template("target = 0", target=target),
+            template(
+                "if value is missing:\n"
+                "    target = 0\n"
+                "else:\n"
+                "    target = 1",
+                target=target,
+                value=value,
+                missing=Missing,
+            ),
+        )
+
+
+class ExpressionParser(BaseExpressionParser):
+    """Parser for expressions which passes itself to the exists
+    expressions which it makes, to parse their paths."""
+
+    def __call__(self, expression):
+        expression = super(ExpressionParser, self).__call__(expression)
+        if isinstance(expression, ExistsExpr):
+            expression.parser = self
+        return expression
+
 
 class ProviderExpr(ContextExpressionMixin, StringExpr):
     transform = Symbol(render_content_provider)
@@ -257,6 +1167,10 @@ class PythonExpr(BasePythonExpr):
     def __call__(self, target, engine):
         return self.translate(self.expression, target)
 
+    def translate(self, expression, target):
+        stmts = super(PythonExpr, self).translate(expression, target)
+        return stmts + translate_await(target)
+
     def rewrite(self, node):
         builtin = self.builtins.get(node.id)
         if builtin is not None:
@@ -271,3 +1185,55 @@ class PythonExpr(BasePythonExpr):
     @property
     def transform(self):
         return NameLookupRewriteVisitor(self.rewrite)
+
+
+class ExpressionEvaluator(object):
+    """Evaluates expressions given as strings at runtime (the
+    ``tales`` builtin of templates).
+
+    The compiled expressions are shared by the evaluators with the
+    same ``key``, which identifies the configuration of the
+    expression ``engine``, in ``compiled_expressions``.
+    """
+
+    __slots__ = "_engine", "_key", "_names", "_builtins"
+
+    def __init__(self, engine, builtins, key):
+        self._engine = engine
+        self._names, self._builtins = zip(*sorted(builtins.items()))
+        self._key = key, self._names
+
+    def __call__(self, econtext, rcontext, expression_type, string=None):
+        if string is None:
+            return functools.partial(
+                self.__call__, econtext, rcontext, expression_type
+            )
+
+        key = self._key, expression_type, string
+        evaluate = compiled_expressions.get(key)
+        if evaluate is None:
+            evaluate = self._compile("%s:%s" % (expression_type, string))
+            compiled_expressions[key] = evaluate
+
+        evaluate(econtext, rcontext, *self._builtins)
+        return econtext["_result"]
+
+    def _compile(self, expression):
+        assignment = Assignment(["_result"], expression, True)
+        module = Module("evaluate", Context(assignment))
+        compiler = Compiler(
+            self._engine, module, "<string>", expression,
+            ("econtext", "rcontext") + self._names,
+        )
+
+        env = {}
+        exec(compiler.code, env)
+        return env["evaluate"]
+
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ImportError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(provider_outputs.clear)
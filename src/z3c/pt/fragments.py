@@ -0,0 +1,484 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Fragment caching.
+
+The output of an element (including the element itself) is cached
+using the ``z3c:cache`` attribute::
+
+  <div xmlns:z3c="http://xml.zope.org/namespaces/z3c"
+       z3c:cache="context/modified; 300">
+    ...
+  </div>
+
+The attribute value is an expression which evaluates to the cache
+key, optionally followed by a semicolon and a time-to-live in seconds.
+The key must determine the output of the element; the element's
+source position and the target language are added to it. When the
+key evaluates to ``None`` the element is rendered without caching.
+
+The key is evaluated in the scope of the element: after its
+``tal:define``, for each repetition of ``tal:repeat`` and only when
+its ``tal:condition`` (or ``tal:case``) holds.
+
+The output of a macro or a slot filling is cached in the templates
+which use it as well; for ``metal:define-slot``, the default content
+of the slot is cached, not the content which fills it.
+
+On a hit, the cached output is written out and nothing inside the
+element is evaluated. The cache is the ``IFragmentCache`` utility if
+one is registered and the in-process ``fragment_cache`` otherwise.
+"""
+import ast
+import functools
+import hashlib
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+import six
+import zope.component
+
+from chameleon import compiler
+from chameleon.astutil import Node
+from chameleon.astutil import Symbol
+from chameleon.astutil import load
+from chameleon.astutil import node_annotations
+from chameleon.astutil import swap
+from chameleon.codegen import template
+from chameleon.exc import LanguageError
+from chameleon.namespaces import I18N_NS as I18N
+from chameleon.namespaces import METAL_NS as METAL
+from chameleon.namespaces import TAL_NS as TAL
+from chameleon.nodes import Value
+from chameleon.zpt import program
+
+from z3c.pt.interfaces import IFragmentCache
+
+Z3C_NS = "http://xml.zope.org/namespaces/z3c"
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, "monotonic", time.time)
+
+
+class RAMFragmentCache(object):
+    """In-process fragment cache.
+
+    The least recently used entry is evicted when the cache holds more
+    than ``size`` entries. Entries expire after ``ttl`` seconds unless
+    a time-to-live is given when they are stored; 0 or ``None`` means
+    that they do not expire.
+
+      >>> cache = RAMFragmentCache(size=2)
+      >>> cache.set('a', u'<p>a</p>')
+      >>> cache.set('b', u'<p>b</p>')
+      >>> print(cache.get('a'))
+      <p>a</p>
+      >>> cache.set('c', u'<p>c</p>')
+      >>> cache.get('b') is None
+      True
+      >>> sorted(cache.stats().items())
+      [('entries', 2), ('hits', 1), ('misses', 1), ('ratio', 0.5)]
+    """
+
+    def __init__(self, size=1000, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.pop(key, None)
+            if entry is None or (
+                entry[0] is not None and entry[0] <= _clock()
+            ):
+                self.misses += 1
+                return None
+
+            self.data[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        expires = _clock() + ttl if ttl else None
+
+        with self.lock:
+            data = self.data
+            data.pop(key, None)
+            data[key] = expires, value
+            while len(data) > self.size:
+                data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ratio": float(self.hits) / lookups if lookups else None,
+        }
+
+
+class MemcachedFragmentCache(object):
+    """Fragment cache kept by a memcached server.
+
+    The ``server`` is given as ``"host:port"``; each thread has its own
+    connection, using the text protocol. The server being unavailable
+    is logged and treated as a miss. Note that memcached takes a
+    time-to-live of more than 30 days to be a Unix timestamp.
+    """
+
+    def __init__(self, server="127.0.0.1:11211", ttl=None, timeout=1.0):
+        host, port = server.rsplit(":", 1)
+        self.address = host, int(port)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get(self, key):
+        def read(rfile):
+            line = rfile.readline()
+            if line == b"END\r\n":
+                return None
+
+            parts = line.split()
+            if len(parts) != 4 or parts[0] != b"VALUE":
+                raise ValueError("Unexpected response: %r" % line)
+
+            value = rfile.read(int(parts[3]) + 2)[:-2]
+            line = rfile.readline()
+            if line != b"END\r\n":
+                raise ValueError("Unexpected response: %r" % line)
+
+            return value.decode("utf-8")
+
+        return self._command(("get %s\r\n" % key).encode("ascii"), read)
+
+    def set(self, key, value, ttl=None):
+        def read(rfile):
+            line = rfile.readline()
+            if line != b"STORED\r\n":
+                raise ValueError("Unexpected response: %r" % line)
+
+        if ttl is None:
+            ttl = self.ttl
+        data = value.encode("utf-8")
+        command = "set %s 0 %d %d\r\n" % (key, ttl or 0, len(data))
+        self._command(command.encode("ascii") + data + b"\r\n", read)
+
+    def close(self):
+        """Close the connection of the current thread."""
+
+        connection = self.local.__dict__.pop("connection", None)
+        if connection is not None:
+            for f in reversed(connection):
+                f.close()
+
+    def _command(self, command, read):
+        try:
+            connection = self.local.__dict__.get("connection")
+            if connection is None:
+                sock = socket.create_connection(self.address, self.timeout)
+                connection = sock, sock.makefile("rb")
+                self.local.connection = connection
+
+            connection[0].sendall(command)
+            return read(connection[1])
+        except (socket.error, ValueError) as exc:
+            logger.warning("Memcached server %s:%d: %s",
+                           self.address[0], self.address[1], exc)
+            self.close()
+
+
+fragment_cache = RAMFragmentCache()
+
+
+def fragment_key(name, key, language):
+    """Return the cache key of the output of the element ``name``
+    (the digest of its source position) for ``key`` in ``language``."""
+
+    data = u"\0".join(
+        (name, six.text_type(key), six.text_type(language or u""))
+    )
+    return "z3c.pt.fragment." + hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class Fragment(object):
+    """The output of an element with a ``z3c:cache`` attribute.
+
+    When ``output`` is ``None`` the element must be rendered and its
+    output passed to ``store``.
+    """
+
+    output = None
+    cache = None
+
+    def __init__(self, econtext, name, key, ttl):
+        if key is None:
+            return
+
+        self.cache = cache = zope.component.queryUtility(
+            IFragmentCache, default=fragment_cache
+        )
+        self.key = fragment_key(name, key, econtext.get("target_language"))
+        self.ttl = ttl
+        self.output = cache.get(self.key)
+
+        if self.output is None:
+            # Content providers are rendered inline; a placeholder for
+            # the concurrent output must not end up in the cache. On
+            # an error, the remaining providers are rendered inline.
+            self.econtext = econtext
+            self.providers = econtext.get("__providers")
+            if self.providers is not None:
+                econtext["__providers"] = None
+
+    def store(self, stream):
+        self.output = output = u"".join(stream)
+        if self.cache is not None:
+            self.cache.set(self.key, output, self.ttl)
+            if self.providers is not None:
+                self.econtext["__providers"] = self.providers
+
+
+class CachedFragment(Node):
+    """Element output cached on the value of the ``key`` expression."""
+
+    _fields = "name", "key", "ttl", "node"
+
+
+def parse_cache(clause):
+    """Parse a ``z3c:cache`` clause into the key expression and the
+    time-to-live.
+
+      >>> parse_cache("context/modified; 60")
+      ('context/modified', 60)
+      >>> parse_cache("string:a;b")
+      ('string:a;b', None)
+    """
+
+    index = clause.rfind(";")
+    if index >= 0:
+        ttl = clause[index + 1:].strip()
+        if ttl.isdigit():
+            return clause[:index], int(ttl)
+    return clause, None
+
+
+class MacroProgram(program.MacroProgram):
+    """Program which supports the ``z3c`` attribute namespace."""
+
+    DEFAULT_NAMESPACES = dict(
+        program.MacroProgram.DEFAULT_NAMESPACES, z3c=Z3C_NS
+    )
+
+    DROP_NS = program.MacroProgram.DROP_NS + (Z3C_NS,)
+
+    def _make_content_node(self, expression, default, key, translate):
+        node = super(MacroProgram, self)._make_content_node(
+            expression, default, key, translate
+        )
+
+        # The value of content which is inserted as structure is
+        # marked for the compiler (see ``Compiler``).
+        if key == "structure" and not translate:
+            if default is None:
+                value = node.expression
+            else:
+                value = node.node.expressions[0]
+            value.structure = True
+        return node
+
+    def visit_element(self, start, end, children):
+        ns = start["ns_attrs"]
+        clause = ns.get((Z3C_NS, "cache"))
+        for namespace, attr in ns:
+            if namespace == Z3C_NS and attr != "cache":
+                raise LanguageError(
+                    "Bad attribute for namespace '%s'" % namespace, attr
+                )
+
+        node = super(MacroProgram, self).visit_element(start, end, children)
+        if clause is None:
+            return node
+
+        key, ttl = parse_cache(clause)
+        if not key.strip():
+            raise LanguageError("Missing cache key expression", clause)
+
+        position = u"%s:%d" % (
+            getattr(clause, "source", None) or u"",
+            getattr(clause, "pos", 0),
+        )
+        name = hashlib.sha1(position.encode("utf-8")).hexdigest()
+        return self._wrap_scope(
+            node, ns, functools.partial(CachedFragment, name, Value(key), ttl)
+        )
+
+    def _wrap_scope(self, node, ns, wrapper):
+        """Wrap the node of an element with ``wrapper`` inside the
+        nodes which define its variables, test its condition and
+        repeat it.
+
+        The node made by ``visit_element`` is nested in the nodes for
+        the attributes of the element (on-error and i18n:name, then
+        the macro or slot, which is also kept for the templates which
+        use the macro or fill the slot, the slot definition, define,
+        case, condition and repeat), in this order.
+        """
+
+        outer = ((TAL, "on-error") in ns) + bool(
+            ns.get((I18N, "name"), "").strip()
+        )
+        inner = ((METAL, "define-slot") in ns) + sum((
+            1 if (TAL, "define") in ns or (I18N, "target") in ns else 0,
+            3 if (TAL, "case") in ns else 0,
+            1 if (TAL, "condition") in ns else 0,
+            1 if (TAL, "repeat") in ns else 0,
+        ))
+
+        parent = None
+        slot = node
+        for _ in range(outer):
+            parent, slot = slot, slot.node
+
+        macro = ns.get((METAL, "define-macro"))
+        if macro is not None:
+            slot = self._macros[macro]
+
+        if inner:
+            for _ in range(inner - 1):
+                slot = slot.node
+            slot.node = wrapper(slot.node)
+            return node
+
+        wrapped = wrapper(slot)
+        for slots in self._use_macro:
+            for fill in slots:
+                if fill.node is slot:
+                    fill.node = wrapped
+
+        if macro is not None:
+            self._macros[macro] = wrapped
+        elif parent is not None:
+            parent.node = wrapped
+        else:
+            node = wrapped
+        return node
+
+
+def defer(body, name):
+    """Call the ``deferred`` variant of the functions whose result is
+    assigned to ``name`` in ``body``.
+
+    Content providers are rendered concurrently by their variant; it
+    is only used for values which are inserted as structure, since
+    the output may be a placeholder.
+    """
+
+    # The names in code made from templates stand for the nodes
+    # which they are annotated with.
+    def resolve(node):
+        return node_annotations.get(node, node)
+
+    for node in ast.walk(ast.Module(body=body)):
+        if not isinstance(node, ast.Assign) or not any(
+            getattr(resolve(target), "id", None) == name
+            for target in node.targets
+        ):
+            continue
+        func = getattr(node.value, "func", None)
+        if func is None:
+            continue
+        symbol = resolve(func)
+        deferred = getattr(getattr(symbol, "value", None), "deferred", None)
+        if isinstance(symbol, Symbol) and deferred is not None:
+            node_annotations[func] = Symbol(deferred)
+
+
+class Compiler(compiler.Compiler):
+    """Compiler for programs with ``z3c:cache`` elements.
+
+    The value of content which is inserted as structure is computed
+    using the ``deferred`` variant of a function, if it has one (see
+    ``defer``).
+    """
+
+    def visit_Content(self, node):
+        body = super(Compiler, self).visit_Content(node)
+        if getattr(node.expression, "structure", False):
+            defer(body, "__content")
+        return body
+
+    def visit_Cache(self, node):
+        body = super(Compiler, self).visit_Cache(node)
+        for expression in node.expressions:
+            if getattr(expression, "structure", False):
+                defer(body, compiler.identifier("cache", id(expression)))
+        return body
+
+    def visit_CachedFragment(self, node):
+        fragment = compiler.identifier("fragment", id(node))
+        stream = compiler.identifier("stream", id(node))
+        append = compiler.identifier("append", id(node))
+
+        body = self._engine(node.key, fragment)
+        body += template(
+            "f = Fragment(econtext, name, f, ttl)",
+            f=fragment,
+            Fragment=Symbol(Fragment),
+            name=ast.Str(s=node.name),
+            ttl=load("None") if node.ttl is None else ast.Num(n=node.ttl),
+        )
+
+        # The element renders to a stream of its own.
+        code = self.visit(node.node)
+        swap(ast.Module(body=code), load(append), "__append")
+        swap(ast.Module(body=code), load(stream), "__stream")
+
+        render = template("s = []\na = s.append", s=stream, a=append)
+        render += code
+        render += template("f.store(s)", f=fragment, s=stream)
+
+        body.append(
+            ast.If(
+                test=template("f.output is None", f=fragment, mode="eval"),
+                body=render,
+                orelse=[],
+            )
+        )
+        body += template("__append(f.output)", f=fragment)
+        return body
+
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ImportError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(fragment_cache.clear)
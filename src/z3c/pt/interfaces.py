@@ -0,0 +1,59 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from zope.interface import Attribute
+from zope.interface import Interface
+from zope.contentprovider.interfaces import IContentProvider
+
+
+class IThreadSafeContentProvider(IContentProvider):
+    """A content provider which may be updated and rendered in a
+    thread other than the one rendering the template.
+
+    When a template has a ``provider_executor``, such providers are
+    updated and rendered on it concurrently with the rest of the
+    template. The current site and security interaction are set up in
+    the worker thread; other thread-local state is not.
+    """
+
+
+class IContentProviderCacheKey(Interface):
+    """The key on which the output of a content provider is cached
+    across requests.
+
+    Content providers are adapted to this interface by ``provider:``
+    expressions. When the output is in the cache, the provider is
+    neither updated nor rendered.
+    """
+
+    key = Attribute(
+        "The cache key (for instance, the modification time of the "
+        "context and the roles of the user), or None not to cache "
+        "the output. It is converted to text."
+    )
+
+
+class IFragmentCache(Interface):
+    """Cache for the output of elements with a ``z3c:cache``
+    attribute (see ``z3c.pt.fragments``)."""
+
+    def get(key):
+        """Return the output stored for ``key`` (a native string), or
+        ``None`` if there is none or it has expired."""
+
+    def set(key, value, ttl=None):
+        """Store the output ``value`` (text) for ``key``.
+
+        The entry expires after ``ttl`` seconds; if not given, the
+        default time-to-live of the cache applies.
+        """
@@ -11,9 +11,51 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
-import zope.component
+
+from zope.interface import providedBy
 from zope.traversing.interfaces import IPathAdapter
 
+from z3c.pt.cache import AdapterLookupCache
+
+#: The path adapter factories used by function namespaces.
+adapter_factories = AdapterLookupCache(size=1000)
+
+
+class AdapterNamespace(object):
+    """Function namespace which adapts an object to ``IPathAdapter``.
+
+    The adapter factory is looked up using ``adapter_factories``:
+
+      >>> import zope.component
+      >>> def adapter1(ob):
+      ...     return 1
+      >>> zope.component.getGlobalSiteManager().registerAdapter(
+      ...     adapter1, [zope.interface.Interface], IPathAdapter, 'a1')
+
+      >>> namespace = AdapterNamespace('a1')
+      >>> namespace(object())
+      1
+      >>> len(adapter_factories)
+      1
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, object):
+        factory = adapter_factories.lookup(
+            (providedBy(object),), IPathAdapter, self.name
+        )
+        if factory is not None:
+            adapter = factory(object)
+            if adapter is not None:
+                return adapter
+
+        raise KeyError(self.name)
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.name)
+
 
 class AdapterNamespaces(object):
     """Simulate tales function namespaces with adapter lookup.
@@ -23,6 +65,7 @@ class AdapterNamespaces(object):
 
     To demonstrate this, we need to register an adapter:
 
+      >>> import zope.component
       >>> def adapter1(ob):
       ...     return 1
       >>> zope.component.getGlobalSiteManager().registerAdapter(
@@ -48,16 +91,7 @@ class AdapterNamespaces(object):
     def __getitem__(self, name):
         namespace = self.namespaces.get(name)
         if namespace is None:
-
-            def namespace(object):
-                try:
-                    return zope.component.getAdapter(
-                        object, IPathAdapter, name
-                    )
-                except zope.component.ComponentLookupError:
-                    raise KeyError(name)
-
-            self.namespaces[name] = namespace
+            namespace = self.namespaces[name] = AdapterNamespace(name)
         return namespace
 
     def registerFunctionNamespace(self, namespacename, namespacecallable):
@@ -113,5 +147,40 @@ try:
     from zope.pagetemplate.engine import Engine
 
     function_namespaces = Engine.namespaces
-except (ImportError, AttributeError):  # pragma: no cover
+except ImportError:  # pragma: no cover
     pass
+
+#: The namespaces which adapt objects to ``IPathAdapter``, by name.
+adapter_namespaces = {}
+
+# The code of the namespaces which ``function_namespaces`` makes up
+# for names which are not registered, taken from a namespace made up
+# by an instance of its own (``None`` if they are ``AdapterNamespace``
+# objects, which are cached already).
+_made_up_code = getattr(type(function_namespaces)()["ns"], "__code__", None)
+
+
+def lookup(name):
+    """Return the function namespace ``name``.
+
+    A namespace registered with ``function_namespaces`` is returned
+    as is. Other names are looked up as path adapters by an
+    ``AdapterNamespace``, which caches the adapter factories; these
+    are kept in ``adapter_namespaces`` rather than in the registry of
+    ``function_namespaces``, which may be shared with another engine.
+    This includes names for which that engine has already made up an
+    (uncached) adapter lookup, e.g. after evaluating a path expression
+    of ``zope.pagetemplate``.
+    """
+
+    namespace = function_namespaces.namespaces.get(name)
+    if namespace is None or (
+        _made_up_code is not None
+        and getattr(namespace, "__code__", None) is _made_up_code
+    ):
+        namespace = adapter_namespaces.get(name)
+        if namespace is None:
+            namespace = adapter_namespaces.setdefault(
+                name, AdapterNamespace(name)
+            )
+    return namespace
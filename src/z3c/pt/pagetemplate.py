@@ -11,10 +11,15 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import copy
 import os
 import sys
+import threading
+import time
+import weakref
 
 import six
+from six.moves import queue
 
 from zope import i18n
 from zope.security.proxy import ProxyFactory
@@ -23,9 +28,18 @@ from chameleon.i18n import fast_translate
 from chameleon.zpt import template
 from chameleon.tales import StringExpr
 from chameleon.tales import NotExpr
-from chameleon.compiler import ExpressionEvaluator
+from chameleon.astutil import Builtin
+from chameleon.loader import MemoryLoader
+from chameleon.template import pkg_digest
+from chameleon.nodes import Module
 
 from z3c.pt import expressions
+from z3c.pt import fragments
+from z3c.pt import precompile
+from z3c.pt import translation
+from z3c.pt.cache import TemplateCache
+from z3c.pt.usage import environment_recorder
+from z3c.pt.watcher import environment_watcher
 
 try:
     from Missing import MV
@@ -35,6 +49,15 @@ except ImportError:
     MV = object()
 
 _marker = object()
+_chunk = object()
+_error = object()
+
+_variant_loader = MemoryLoader()
+
+# The keys of the memoized translations and of the negotiated
+# language in the request annotations.
+TRANSLATIONS_KEY = "z3c.pt.translations"
+LANGUAGE_KEY = "z3c.pt.language"
 
 
 BOOLEAN_HTML_ATTRS = frozenset(
@@ -79,6 +102,195 @@ class OpaqueDict(dict):
 sys_modules = ProxyFactory(OpaqueDict(sys.modules))
 
 
+class StreamClosed(Exception):
+    """The consumer of a streaming render has gone away."""
+
+
+class OutputStream(object):
+    """Output stream which writes the output in chunks of at least
+    ``size`` characters.
+
+    The template retracts the output of a ``tal:on-error`` block when
+    an error occurs; this fails if it has already been written.
+    """
+
+    def __init__(self, write, size):
+        self.write = write
+        self.size = size
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+
+    def append(self, s):
+        self.buffer.append(s)
+        self.buffered += len(s)
+        if self.buffered >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write(u"".join(self.buffer))
+            self.written += len(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+
+    def __len__(self):
+        return self.written + len(self.buffer)
+
+    def __delitem__(self, key):
+        start = key.start - self.written
+        if start < 0:
+            raise RuntimeError("Can't retract output which has been streamed")
+        del self.buffer[start:]
+        self.buffered = sum(map(len, self.buffer))
+
+    def __iter__(self):
+        # The template returns the joined output which has not been
+        # written yet.
+        return iter(self.buffer)
+
+
+_streams = threading.local()
+
+
+def request_translations(request):
+    """Return the translations memoized for ``request`` (in its
+    annotations), or a new dictionary if it has no annotations."""
+
+    annotations = getattr(request, "annotations", None)
+    if not isinstance(annotations, dict):
+        return {}
+    return annotations.setdefault(TRANSLATIONS_KEY, {})
+
+
+class LanguageNegotiator(object):
+    """Negotiates the target language of requests.
+
+    The language is negotiated once for a request and kept in its
+    annotations, so that the templates rendered for the request share
+    it (requests without annotations are negotiated each time).
+    ``stats()`` reports the number of negotiations (misses), of the
+    languages found on the request (hits) and the total time spent
+    negotiating in seconds.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.time = 0.0
+
+    def __call__(self, request):
+        annotations = getattr(request, "annotations", None)
+        if not isinstance(annotations, dict):
+            annotations = None
+        else:
+            language = annotations.get(LANGUAGE_KEY, _marker)
+            if language is not _marker:
+                self.hits += 1
+                return language
+
+        start = time.time()
+        try:
+            language = i18n.negotiate(request)
+        except Exception:
+            language = None
+        self.time += time.time() - start
+        self.misses += 1
+
+        if annotations is not None:
+            annotations[LANGUAGE_KEY] = language
+        return language
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "time": self.time,
+        }
+
+
+class Translator(object):
+    """The ``translate`` function of a render, bound to the request.
+
+    Translations of messages without a mapping are memoized in
+    ``translations`` (see ``request_translations``) and, for a target
+    language, in the ``shared`` cache if it is not ``None``.
+    """
+
+    __slots__ = ("request", "translations", "shared")
+
+    def __init__(self, request, translations, shared=None):
+        self.request = request
+        self.translations = translations
+        self.shared = shared
+
+    def __call__(
+        self,
+        msgid,
+        domain=None,
+        mapping=None,
+        target_language=None,
+        default=None,
+        context=None,
+    ):
+        if msgid is MV:
+            # Special case handling of Zope2's Missing.MV
+            # (Missing.Value) used by the ZCatalog but is
+            # unhashable.
+
+            # This case cannot arise in ordinary templates; msgid
+            # comes from i18n:translate attributes, which does not
+            # take a TALES expression, just a literal string.
+            # However, the 'context' argument is available as an
+            # implementation detail for macros
+            return
+        if (
+            mapping
+            or not isinstance(msgid, six.string_types)
+            or getattr(msgid, "mapping", None)
+        ):
+            return fast_translate(
+                msgid, domain, mapping, self.request, target_language,
+                default,
+            )
+
+        key = (
+            msgid,
+            getattr(msgid, "domain", None),
+            getattr(msgid, "default", None),
+            domain,
+            target_language,
+            default,
+        )
+        translations = self.translations
+        result = translations.get(key)
+        if result is None:
+            # Without a target language, the translation depends on
+            # the request.
+            cache = self.shared if target_language is not None else None
+            if cache is not None:
+                result = cache.get(key)
+            if result is None:
+                result = fast_translate(
+                    msgid, domain, None, self.request, target_language,
+                    default,
+                )
+                if cache is not None:
+                    cache[key] = result
+            translations[key] = result
+        return result
+
+
+def _dotted_name(ob):
+    return "%s.%s" % (ob.__module__, ob.__name__)
+
+
+def _defining_class(cls, name):
+    for base in cls.__mro__:
+        if name in base.__dict__:
+            return base
+
+
 class BaseTemplate(template.PageTemplate):
     content_type = None
     version = 2
@@ -101,6 +313,62 @@ class BaseTemplate(template.PageTemplate):
 
     trim_attribute_space = True
 
+    # Compiled code is loaded from the on-disk cache in
+    # ``$Z3C_PT_CACHE`` if set (see ``z3c.pt.precompile``).
+    loader = precompile.environment_loader(template.PageTemplate.loader)
+
+    # The compiled programs, shared by the templates with the same
+    # source and configuration (and class).
+    cache = TemplateCache(size=2000)
+
+    # The minimum number of characters in the chunks yielded by
+    # ``render_iter``.
+    stream_chunk_size = 65536
+
+    # The executor on which ``render_async`` renders the template.
+    render_executor = None
+
+    # An executor (such as ``concurrent.futures.ThreadPoolExecutor``)
+    # on which content providers which provide
+    # ``IThreadSafeContentProvider`` are updated and rendered
+    # concurrently with the rest of the template.
+    provider_executor = None
+
+    # A ``z3c.pt.cache.LookupCache`` of the translations of messages
+    # without a mapping, shared by all renders for a target language.
+    # It is cleared when a component (such as a translation domain) is
+    # registered; translations are memoized for each request only if
+    # it is not set.
+    translation_cache = None
+
+    # Negotiates the target language if none is given.
+    negotiator = LanguageNegotiator()
+
+    # If true, a variant of the template is compiled for each target
+    # language, in which static messages are translated at compile
+    # time (see ``z3c.pt.translation``). Translations registered after
+    # a variant is compiled are not picked up by it.
+    translate_static = False
+
+    # When set, the renders of template files are counted and written
+    # to a manifest, from which the templates rendered most often can
+    # be compiled on startup (see ``z3c.pt.usage``).
+    usage_recorder = environment_recorder()
+
+    # The target language of a variant.
+    _v_language = None
+
+    # The body the variants are compiled from.
+    _v_body = None
+
+    # Path expressions which are evaluated once for each object they
+    # start from in a render: the paths themselves (such as
+    # "view/portal_url") and interface attributes (such as
+    # ``IView["portal_url"]``) which make the paths of two segments
+    # pure (see ``z3c.pt.expressions.pure_expression_types``).
+    pure_paths = ()
+    pure_attributes = ()
+
     @property
     def boolean_attributes(self):
         if self.content_type == "text/xml":
@@ -108,60 +376,319 @@ class BaseTemplate(template.PageTemplate):
 
         return BOOLEAN_HTML_ATTRS
 
+    @property
+    def expression_parser(self):
+        expression_types = self.expression_types
+        if self.pure_paths or self.pure_attributes:
+            expression_types = expressions.pure_expression_types(
+                expression_types, self.pure_paths, self.pure_attributes
+            )
+        return expressions.ExpressionParser(
+            expression_types, self.default_expression
+        )
+
+    def _pt_pure(self):
+        """Return a key for the pure path expressions."""
+
+        return tuple(sorted(self.pure_paths)), tuple(sorted(
+            "%s.%s" % (attribute.interface.__identifier__, attribute.getName())
+            for attribute in self.pure_attributes
+        ))
+
     @property
     def builtins(self):
-        builtins = {"nothing": None, "modules": sys_modules}
+        # The evaluator is created once for the template.
+        tales = self.__dict__.get("_v_tales")
+        if tales is None:
+            key = (
+                tuple(sorted(self.expression_types.items())),
+                self.default_expression,
+                self.literal_false,
+                self._pt_pure(),
+            )
+            tales = self._v_tales = expressions.ExpressionEvaluator(
+                self.engine, {"nothing": None, "modules": sys_modules}, key
+            )
 
-        tales = ExpressionEvaluator(self.engine, builtins)
-        builtins["tales"] = tales
+        return {"nothing": None, "modules": sys_modules, "tales": tales}
 
-        return builtins
+    def parse(self, body):
+        # The program supports the ``z3c`` attribute namespace (see
+        # ``z3c.pt.fragments``).
+        if self.literal_false:
+            default_marker = Builtin("__default")
+        else:
+            default_marker = Builtin("False")
 
-    def bind(self, ob, request=None):
-        def render(request=request, **kwargs):
-            context = self._pt_get_context(ob, request, kwargs)
-            return self.render(**context)
+        return fragments.MacroProgram(
+            body,
+            self.mode,
+            self.filename,
+            escape=True if self.mode == "xml" else False,
+            default_marker=default_marker,
+            boolean_attributes=self.boolean_attributes,
+            implicit_i18n_translate=self.implicit_i18n_translate,
+            implicit_i18n_attributes=self.implicit_i18n_attributes,
+            trim_attribute_space=self.trim_attribute_space,
+            enable_data_attributes=self.enable_data_attributes,
+            restricted_namespace=self.restricted_namespace,
+            tokenizer=self.tokenizer,
+        )
+
+    def _cook(self, body, name, builtins):
+        if self.keep_source:
+            return super(BaseTemplate, self)._cook(body, name, builtins)
+
+        def compile():
+            return super(BaseTemplate, self)._cook(body, name, builtins)
 
-        return BoundPageTemplate(self, render)
+        # Threads which need the program while it is being compiled
+        # wait for it rather than compiling it as well.
+        return self.cache.load(self._get_module_name(name), compile)
+
+    def _compile(self, body, builtins):
+        program = self.parse(body)
+        module = Module("initialize", program)
+        if self._v_language is None:
+            compiler = fragments.Compiler(
+                self.engine, module, self.filename, body, builtins,
+                strict=self.strict,
+            )
+        else:
+            compiler = translation.Compiler(
+                self.engine, module, self.filename, body, builtins,
+                strict=self.strict, target_language=self._v_language,
+                translate=fast_translate,
+            )
+        return compiler.code
+
+    def digest(self, body, names):
+        # The digest addresses the program by its content: templates
+        # with the same source, filename and configuration share it,
+        # whatever their class.
+        sha = pkg_digest.copy()
+        sha.update(body.encode("utf-8", "ignore"))
+        for value in (self.filename, ";".join(names), self._pt_options()):
+            sha.update(b"\0" + value.encode("utf-8"))
+        return sha.hexdigest()
+
+    def _pt_options(self):
+        """Return the configuration which the compiled program depends
+        on, as text."""
+
+        cls = type(self)
+        tokenizer = self.tokenizer
+        options = [
+            "version=%s" % self.version,
+            "content_type=%s" % self.content_type,
+            "mode=%s" % self.mode,
+            "tokenizer=%s" % (
+                tokenizer if tokenizer is None else _dotted_name(tokenizer)
+            ),
+            "default_marker=%s" % (
+                "__default" if self.literal_false else "False"
+            ),
+            "expression_types=%s" % ",".join(
+                "%s:%s" % (name, _dotted_name(factory))
+                for name, factory in sorted(self.expression_types.items())
+            ),
+            "default_expression=%s" % self.default_expression,
+            "boolean_attributes=%s" % ",".join(
+                sorted(self.boolean_attributes)
+            ),
+            "implicit_i18n_attributes=%s" % ",".join(
+                sorted(self.implicit_i18n_attributes)
+            ),
+            # The classes which define how the source is compiled.
+            "compiler=%s" % ",".join(
+                _dotted_name(_defining_class(cls, name))
+                for name in (
+                    "parse", "_compile", "engine", "expression_parser"
+                )
+            ),
+        ]
+        for name in (
+            "strict",
+            "trim_attribute_space",
+            "literal_false",
+            "implicit_i18n_translate",
+            "enable_data_attributes",
+            "restricted_namespace",
+        ):
+            options.append("%s=%s" % (name, getattr(self, name)))
+        if self._v_language is not None:
+            options.append("target_language=%s" % self._v_language)
+        if self.pure_paths or self.pure_attributes:
+            options.append("pure=%r" % (self._pt_pure(),))
+        return ";".join(options)
+
+    def cook(self, body):
+        super(BaseTemplate, self).cook(body)
+        if self.translate_static:
+            self._v_body = body
+            self._v_variants = {}
+
+    def _pt_variant(self, target_language):
+        """Return the variant of the template for
+        ``target_language`` (the template itself if it has none)."""
+
+        if target_language is None or not self.translate_static:
+            return self
+
+        self.cook_check()
+        if self._v_body is None:
+            return self
+
+        variant = self._v_variants.get(target_language)
+        if variant is None:
+            variant = copy.copy(self)
+            variant._v_language = target_language
+            # The translations are not part of the digest; a variant
+            # is never written to an on-disk cache.
+            variant.loader = _variant_loader
+            variant.cook(self._v_body)
+            self._v_variants[target_language] = variant
+        return variant
+
+    def output_stream_factory(self):
+        # A streaming render sets up its output stream for the thread
+        # which renders; it is used by the outermost template only.
+        stream = _streams.__dict__.pop("stream", None)
+        if stream is None:
+            stream = super(BaseTemplate, self).output_stream_factory()
+        return stream
+
+    def bind(self, ob, request=None):
+        return BoundPageTemplate(self, None, None, ob, request)
 
     def render(self, target_language=None, **context):
+        self._pt_prepare(target_language, context)
+        return self._pt_render(context)
+
+    def render_async(self, target_language=None, **context):
+        """Render the template, returning an awaitable for the
+        output (Python 3 only). It must be called from the running
+        event loop (for instance, from a coroutine).
+
+        The template is rendered on the ``render_executor`` (the
+        default executor of the event loop if not set), so that the
+        event loop is not blocked; awaitable values of path and
+        python expressions, and of the ``update()`` and ``render()``
+        methods of content providers, are awaited on the event loop.
+        """
+
+        import asyncio
+
+        get_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+        loop = get_loop()
+        self._pt_prepare(target_language, context)
+        context["__await"] = expressions.EventLoopAwaiter(loop)
+        state = expressions.thread_state()
+
+        def render():
+            with expressions.inherited_thread_state(state):
+                return self._pt_render(context)
+
+        return loop.run_in_executor(self.render_executor, render)
+
+    def _pt_render(self, context):
+        providers = None
+        if self.provider_executor is not None:
+            providers = expressions.ConcurrentProviders(
+                self.provider_executor
+            )
+            context["__providers"] = providers
+
+        variant = self._pt_variant(context["target_language"])
+        base_renderer = super(BaseTemplate, variant).render
+        if providers is None:
+            return base_renderer(**context)
+
+        try:
+            result = base_renderer(**context)
+        except BaseException:
+            providers.cancel()
+            raise
+
+        return providers.stitch(result)
+
+    def render_iter(self, target_language=None, **context):
+        """Render the template, returning an iterator over chunks of
+        the output (of at least ``stream_chunk_size`` characters).
+
+        The context is set up (and the content type set on the
+        response) before this method returns; the template is rendered
+        in a separate thread as the chunks are consumed. Content
+        providers are updated and rendered sequentially.
+        """
+
+        self._pt_prepare(target_language, context)
+        return self._pt_stream(context, expressions.thread_state())
+
+    def _pt_stream(self, context, state):
+        chunks = queue.Queue(2)
+        closed = threading.Event()
+        variant = self._pt_variant(context["target_language"])
+        base_renderer = super(BaseTemplate, variant).render
+
+        def write(chunk):
+            if closed.is_set():
+                raise StreamClosed()
+            chunks.put((_chunk, chunk))
+
+        def run():
+            with expressions.inherited_thread_state(state):
+                try:
+                    _streams.stream = OutputStream(
+                        write, self.stream_chunk_size
+                    )
+                    write(base_renderer(**context))
+                except BaseException:
+                    chunks.put((_error, sys.exc_info()))
+                else:
+                    chunks.put((None, None))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+        kind = _chunk
+        try:
+            while kind is _chunk:
+                kind, value = chunks.get()
+                if kind is _error:
+                    six.reraise(*value)
+                if value:
+                    yield value
+        finally:
+            # If the consumer has gone away, stop the rendering and
+            # wait for it to end.
+            closed.set()
+            while kind is _chunk:
+                kind, value = chunks.get()
+
+    def _pt_prepare(self, target_language, context):
+        """Set up the context for rendering."""
+
         # We always include a ``request`` variable; it is (currently)
         # depended on in various expression types and must be defined
         request = context.setdefault("request", None)
 
+        recorder = self.usage_recorder
+        if recorder is not None:
+            recorder.record(self)
+
         if target_language is None:
-            try:
-                target_language = i18n.negotiate(request)
-            except Exception:
-                target_language = None
+            target_language = self.negotiator(request)
 
         context["target_language"] = target_language
 
-        # bind translation-method to request
-        def translate(
-            msgid,
-            domain=None,
-            mapping=None,
-            target_language=None,
-            default=None,
-            context=None,
-        ):
-            if msgid is MV:
-                # Special case handling of Zope2's Missing.MV
-                # (Missing.Value) used by the ZCatalog but is
-                # unhashable.
-
-                # This case cannot arise in ordinary templates; msgid
-                # comes from i18n:translate attributes, which does not
-                # take a TALES expression, just a literal string.
-                # However, the 'context' argument is available as an
-                # implementation detail for macros
-                return
-            return fast_translate(
-                msgid, domain, mapping, request, target_language, default
-            )
-
-        context["translate"] = translate
+        # Translations of messages without a mapping are memoized for
+        # the request, so that they are shared with the templates
+        # rendered for it.
+        context["translate"] = Translator(
+            request, request_translations(request), self.translation_cache
+        )
 
         if request is not None and not isinstance(request, six.string_types):
             content_type = self.content_type or "text/html"
@@ -169,28 +696,28 @@ class BaseTemplate(template.PageTemplate):
             if response and not response.getHeader("Content-Type"):
                 response.setHeader("Content-Type", content_type)
 
-        base_renderer = super(BaseTemplate, self).render
-        return base_renderer(**context)
-
     def __call__(self, *args, **kwargs):
         bound_pt = self.bind(self)
         return bound_pt(*args, **kwargs)
 
     def _pt_get_context(self, instance, request, kwargs):
-        return dict(
-            context=instance,
-            here=instance,
-            options=kwargs,
-            request=request,
-            template=self,
-        )
+        return {
+            "context": instance,
+            "here": instance,
+            "options": kwargs,
+            "request": request,
+            "template": self,
+        }
 
 
 class BaseTemplateFile(BaseTemplate, template.PageTemplateFile):
     """If ``filename`` is a relative path, the module path of the
     class where the instance is used to get an absolute path."""
 
-    cache = {}
+    # When set, the watcher reloads the templates whose file has
+    # changed, rather than each template checking its file on every
+    # render (see ``z3c.pt.watcher``).
+    watcher = environment_watcher()
 
     def __init__(self, filename, path=None, content_type=None, **kwargs):
         if path is not None:
@@ -226,6 +753,15 @@ class BaseTemplateFile(BaseTemplate, template.PageTemplateFile):
         # magically sniffed from the source template.
         self.content_type = content_type
 
+    def cook_check(self):
+        watcher = self.watcher
+        if watcher is None:
+            return super(BaseTemplateFile, self).cook_check()
+
+        if self._cooked is False:
+            watcher.watch(self)
+            self.cook(self.read())
+
 
 class PageTemplate(BaseTemplate):
     """Page Templates using TAL, TALES, and METAL.
@@ -237,10 +773,43 @@ class PageTemplate(BaseTemplate):
 
     version = 1
 
+    # If true, the template is bound once for each instance it is
+    # accessed on (as a class attribute), rather than on each access.
+    # The bound template refers to the instance weakly; it must not be
+    # called once the instance is gone.
+    cache_bound = False
+
     def __get__(self, instance, type):
-        if instance is not None:
+        if instance is None:
+            return self
+        if not self.cache_bound:
             return self.bind(instance)
-        return self
+
+        # The bound templates are kept by the identity of the instance
+        # (which may not be hashable).
+        bindings = self.__dict__.get("_v_bindings")
+        if bindings is None:
+            bindings = self._v_bindings = {}
+
+        key = id(instance)
+        bound = bindings.get(key)
+        if bound is not None and bound._ref() is instance:
+            return bound
+
+        def forget(ref, key=key):
+            bound = bindings.get(key)
+            if bound is not None and bound._ref is ref:
+                bindings.pop(key, None)
+
+        try:
+            ref = weakref.ref(instance, forget)
+        except TypeError:
+            return self.bind(instance)
+
+        bound = bindings[key] = BoundPageTemplate(
+            self, None, None, None, None, ref
+        )
+        return bound
 
 
 class PageTemplateFile(BaseTemplateFile, PageTemplate):
@@ -251,8 +820,6 @@ class PageTemplateFile(BaseTemplateFile, PageTemplate):
 
     Initialize with a filename."""
 
-    cache = {}
-
 
 class ViewPageTemplate(PageTemplate):
     """Template class suitable for use with a Zope browser view; the
@@ -267,13 +834,13 @@ class ViewPageTemplate(PageTemplate):
         if context is None:
             context = view.context
         request = request or kwargs.get("request") or view.request
-        return dict(
-            view=view,
-            context=context,
-            request=request,
-            options=kwargs,
-            template=self,
-        )
+        return {
+            "view": view,
+            "context": context,
+            "request": request,
+            "options": kwargs,
+            "template": self,
+        }
 
     def __call__(self, _ob=None, context=None, request=None, **kwargs):
         kwargs.setdefault("context", context)
@@ -286,29 +853,79 @@ class ViewPageTemplateFile(ViewPageTemplate, PageTemplateFile):
     """If ``filename`` is a relative path, the module path of the
     class where the instance is used to get an absolute path."""
 
-    cache = {}
-
 
 class BoundPageTemplate(object):
     """When a page template class is used as a property, it's bound to
     the class instance on access, which is implemented using this
-    helper class."""
-
-    __self__ = None
-    __func__ = None
+    helper class.
+
+    The template is rendered for the instance ``ob`` (or the instance
+    which ``ref``, a weak reference, refers to) and ``request``, or
+    using the ``render`` and ``get_context`` functions if given.
+    """
+
+    __slots__ = (
+        "__self__", "_render", "_get_context", "_ob", "_request", "_ref",
+        "__weakref__",
+    )
+
+    def __init__(self, pt, render=None, get_context=None, ob=None,
+                 request=None, ref=None):
+        setattr = object.__setattr__
+        setattr(self, "__self__", pt)
+        setattr(self, "_render", render)
+        setattr(self, "_get_context", get_context)
+        setattr(self, "_ob", ob)
+        setattr(self, "_request", request)
+        setattr(self, "_ref", ref)
 
-    def __init__(self, pt, render):
-        object.__setattr__(self, "__self__", pt)
-        object.__setattr__(self, "__func__", render)
+    @property
+    def __func__(self):
+        if self._render is not None:
+            return self._render
+        return self._pt_render
 
     im_self = property(lambda self: self.__self__)
     im_func = property(lambda self: self.__func__)
     macros = property(lambda self: self.__self__.macros)
     filename = property(lambda self: self.__self__.filename)
 
+    def _pt_context(self, kw):
+        if self._get_context is not None:
+            return self._get_context(**kw)
+
+        ob = self._ob
+        if self._ref is not None:
+            ob = self._ref()
+            if ob is None:
+                raise ReferenceError(
+                    "The instance the template is bound to is gone"
+                )
+        request = kw.pop("request", self._request)
+        return self.__self__._pt_get_context(ob, request, kw)
+
+    def _pt_render(self, **kw):
+        return self.__self__.render(**self._pt_context(kw))
+
     def __call__(self, *args, **kw):
         kw.setdefault("args", args)
-        return self.__func__(**kw)
+        if self._render is not None:
+            return self._render(**kw)
+        return self.__self__.render(**self._pt_context(kw))
+
+    def stream(self, *args, **kw):
+        """Render the template, returning an iterator over chunks of
+        the output (see ``BaseTemplate.render_iter``)."""
+
+        kw.setdefault("args", args)
+        return self.__self__.render_iter(**self._pt_context(kw))
+
+    def render_async(self, *args, **kw):
+        """Render the template, returning an awaitable for the output
+        (see ``BaseTemplate.render_async``)."""
+
+        kw.setdefault("args", args)
+        return self.__self__.render_async(**self._pt_context(kw))
 
     def __setattr__(self, name, v):
         raise AttributeError("Can't set attribute", name)
@@ -0,0 +1,329 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Ahead-of-time template compilation.
+
+The ``.pt`` files of packages are compiled into an on-disk cache::
+
+  $ z3c-pt-precompile --cache-dir /var/cache/z3c.pt my.package
+
+Templates load their compiled code from the cache when the
+``Z3C_PT_CACHE`` environment variable is set to the same directory.
+The cache is kept in a subdirectory for the Python version and the
+versions of the installed packages, so that a deploy never loads
+code compiled for another environment. Templates are compiled in the
+environment (and at the paths) they are used in, and for the
+template classes used by the application.
+
+A server which forks its workers can compile the templates in memory
+before it forks instead, so that the workers share the compiled code
+(see ``preload``).
+"""
+import argparse
+import fnmatch
+import gc
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import traceback
+
+from chameleon.loader import ModuleLoader
+from chameleon.template import pkg_digest
+
+from z3c.pt.cache import TemplateCache
+
+CACHE_ENV = "Z3C_PT_CACHE"
+
+#: The template classes which templates are compiled for by default.
+TEMPLATE_CLASSES = (
+    "z3c.pt.pagetemplate.PageTemplateFile",
+    "z3c.pt.pagetemplate.ViewPageTemplateFile",
+)
+
+
+def cache_version():
+    """Return the name of the cache subdirectory for the running
+    Python and the installed packages."""
+
+    return "%s%d%d-%s" % (
+        platform.python_implementation().lower(),
+        sys.version_info[0],
+        sys.version_info[1],
+        pkg_digest.hexdigest()[:16],
+    )
+
+
+def cache_loader(directory):
+    """Return a module loader for the versioned cache in
+    ``directory``, creating it as needed."""
+
+    path = os.path.join(os.path.abspath(directory), cache_version())
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return ModuleLoader(path)
+
+
+def environment_loader(default):
+    """Return the loader for the cache in ``$Z3C_PT_CACHE``, or
+    ``default`` if it is not set."""
+
+    directory = os.environ.get(CACHE_ENV)
+    if not directory:
+        return default
+    return cache_loader(directory)
+
+
+def find_templates(packages, pattern="*.pt"):
+    """Yield the paths of the files in ``packages`` (the names of
+    importable packages) matching ``pattern``, in sorted order.
+
+    The pattern is matched against the path relative to the package
+    directory (with "/" as the separator) using ``fnmatch``; note that
+    "*" matches "/" as well. A leading "**/" matches any directory,
+    including the package directory itself.
+    """
+
+    if pattern.startswith("**/"):
+        pattern = pattern[3:]
+
+    for name in packages:
+        __import__(name)
+        module = sys.modules[name]
+        paths = getattr(module, "__path__", None)
+        if paths is None:
+            paths = [os.path.dirname(module.__file__)]
+
+        for path in paths:
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    filename = os.path.join(root, filename)
+                    relative = os.path.relpath(filename, path)
+                    if fnmatch.fnmatch(relative.replace(os.sep, "/"),
+                                       pattern):
+                        yield filename
+
+
+def resolve(dotted_name):
+    module, name = dotted_name.rsplit(".", 1)
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+
+def compile_template(job):
+    """Compile a template into the cache.
+
+    The ``job`` is a tuple of the cache directory (``None`` to compile
+    the template in memory, into the program cache of its class), the
+    dotted name of the template class and the path of the template.
+    Returns the path, the class name, the compile time in seconds and
+    the error message (or ``None``).
+    """
+
+    directory, class_name, filename = job
+
+    def cook():
+        template = resolve(class_name)(filename)
+        if directory is not None:
+            template.cache = TemplateCache()
+            template.loader = cache_loader(directory)
+        template.cook_check()
+
+    return (filename, class_name) + timed(cook)
+
+
+def timed(func):
+    """Call ``func``; returns the time it took in seconds and the
+    error message (or ``None``)."""
+
+    start = time.time()
+    try:
+        func()
+    except Exception:
+        error = traceback.format_exception_only(*sys.exc_info()[:2])
+        error = "".join(error).strip()
+    else:
+        error = None
+    return time.time() - start, error
+
+
+def precompile(directory, packages, classes=TEMPLATE_CLASSES, jobs=None,
+               pattern="*.pt"):
+    """Compile the templates in ``packages`` matching ``pattern`` into
+    the cache in ``directory``, using a pool of ``jobs`` processes
+    (one per CPU by default, none if 1). If ``directory`` is ``None``,
+    the templates are compiled in memory, in this process.
+
+    Returns the results of ``compile_template``.
+    """
+
+    if directory is not None:
+        cache_loader(directory)
+    tasks = [
+        (directory, class_name, filename)
+        for filename in find_templates(packages, pattern)
+        for class_name in classes
+    ]
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    if directory is None or jobs <= 1 or len(tasks) <= 1:
+        return list(map(compile_template, tasks))
+
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        return pool.map(compile_template, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def warm_lookups():
+    """Look up the registered path adapters and content providers.
+
+    This fills the lookup caches of the adapter registry, and those of
+    ``z3c.pt`` for the adapters registered for classes. Returns the
+    number of adapters looked up.
+    """
+
+    from zope.component import getSiteManager
+    from zope.contentprovider.interfaces import IContentProvider
+    from zope.traversing.interfaces import IPathAdapter
+
+    from z3c.pt.expressions import content_providers
+    from z3c.pt.namespaces import adapter_factories
+
+    caches = {
+        IContentProvider: content_providers,
+        IPathAdapter: adapter_factories,
+    }
+    count = 0
+    for registration in getSiteManager().registeredAdapters():
+        cache = caches.get(registration.provided)
+        if cache is not None:
+            cache.lookup(
+                registration.required, registration.provided,
+                registration.name,
+            )
+            count += 1
+    return count
+
+
+def preload(packages=(), classes=TEMPLATE_CLASSES, freeze_gc=True):
+    """Compile the templates in memory and fill the lookup caches in a
+    process before it forks its workers.
+
+    The template files which are not compiled yet and the ``.pt``
+    files in ``packages`` (for the template ``classes``) are compiled
+    into the program cache of their class, which the templates created
+    later in the workers share. If ``freeze_gc`` is set, the objects
+    are then moved to the permanent generation of the garbage
+    collector (Python 3.7 and later) so that collections in the workers
+    do not write to (and copy) the pages holding the compiled code.
+
+    Returns the results of the compilations, as ``compile_template``.
+    """
+
+    from z3c.pt.pagetemplate import BaseTemplateFile
+
+    results = []
+    for ob in gc.get_objects():
+        # The type is checked rather than the class, which proxies
+        # may not allow to get.
+        if issubclass(type(ob), BaseTemplateFile) and ob._cooked is False:
+            cls = type(ob)
+            results.append(
+                (ob.filename, "%s.%s" % (cls.__module__, cls.__name__)) +
+                timed(ob.cook_check)
+            )
+
+    results += precompile(None, packages, classes)
+    warm_lookups()
+
+    if freeze_gc:
+        gc.collect()
+        freeze = getattr(gc, "freeze", None)
+        if freeze is not None:
+            freeze()
+
+    return results
+
+
+def main(argv=None, stdout=None):
+    parser = argparse.ArgumentParser(
+        description="Compile the page templates of packages into an "
+        "on-disk cache."
+    )
+    parser.add_argument(
+        "packages", nargs="+", metavar="package",
+        help="compile the .pt files in this package",
+    )
+    parser.add_argument(
+        "-d", "--cache-dir", default=os.environ.get(CACHE_ENV),
+        help="the cache directory (default: $%s)" % CACHE_ENV,
+    )
+    parser.add_argument(
+        "-c", "--class", dest="classes", action="append",
+        metavar="DOTTED_NAME",
+        help="compile for this template class (repeatable; default: %s)"
+        % ", ".join(TEMPLATE_CLASSES),
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int,
+        help="the number of processes (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="print the compile time of each template",
+    )
+    args = parser.parse_args(argv)
+    if not args.cache_dir:
+        parser.error("no cache directory (use --cache-dir or $%s)" % CACHE_ENV)
+
+    stdout = stdout if stdout is not None else sys.stdout
+    start = time.time()
+    results = precompile(
+        args.cache_dir,
+        args.packages,
+        args.classes or TEMPLATE_CLASSES,
+        args.jobs,
+    )
+
+    failed = 0
+    for filename, class_name, seconds, error in results:
+        if error is not None:
+            failed += 1
+            stdout.write(
+                "%s (%s): %s\n" % (filename, class_name, error)
+            )
+        elif args.verbose:
+            stdout.write(
+                "%s (%s): %.1f ms\n" % (filename, class_name, seconds * 1000)
+            )
+
+    stdout.write(
+        "Compiled %d templates (%d failed) into %s in %.1f s.\n" % (
+            len(results) - failed,
+            failed,
+            os.path.join(os.path.abspath(args.cache_dir), cache_version()),
+            time.time() - start,
+        )
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the benchmarks package.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from six import StringIO
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt.benchmarks import runner
+from z3c.pt.benchmarks import workloads
+
+
+class TestPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        timings = list(range(1, 101))
+        self.assertEqual(runner.percentile(timings, 50), 50)
+        self.assertEqual(runner.percentile(timings, 99), 99)
+        self.assertEqual(runner.percentile(timings, 100), 100)
+        self.assertEqual(runner.percentile([7], 90), 7)
+
+
+class TestWorkloads(CleanUp, unittest.TestCase):
+    def test_compile_misses_cache(self):
+        workloads.setUp()
+        for workload in workloads.make_workloads(rows=2):
+            for i in range(2):
+                template = workload.compile()
+                stats = type(template).cache.stats()
+                self.assertEqual(stats["misses"], 1, workload.name)
+                self.assertEqual(stats["hits"], 0, workload.name)
+
+
+class TestRunner(CleanUp, unittest.TestCase):
+    argv = [
+        "--number", "2", "--repeat", "1", "--warmup", "1", "--rows", "2",
+        "--threads", "4",
+    ]
+
+    def test_stdout(self):
+        out = StringIO()
+        runner.main(self.argv + ["PageTemplateFile"], stdout=out)
+        data = json.loads(out.getvalue())
+
+        names = [result["name"] for result in data["results"]]
+        self.assertEqual(
+            names,
+            ["PageTemplateFile", "ViewPageTemplateFile"],
+        )
+        result = data["results"][0]
+        self.assertEqual(
+            sorted(result["render"]),
+            ["max", "mean", "min", "ops_per_second", "p50", "p90", "p99",
+             "peak_memory"],
+        )
+        self.assertEqual(data["parameters"]["number"], 2)
+        self.assertEqual(data["cold_start"]["compiles"], 1)
+        self.assertEqual(data["cold_start"]["threads"], 4)
+        self.assertIn("Chameleon", data["environment"]["versions"])
+
+    def test_output_file(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        filename = os.path.join(path, "results.json")
+
+        runner.main(self.argv + ["--output", filename, "--threads", "0"])
+
+        with open(filename) as f:
+            data = json.load(f)
+
+        self.assertEqual(len(data["results"]), 12)
+        self.assertIsNone(data["cold_start"])
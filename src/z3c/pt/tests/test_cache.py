@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cache.py.
+
+"""
+import threading
+import time
+import unittest
+
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt import cache
+
+
+class TestLookupCache(CleanUp, unittest.TestCase):
+    def test_unbounded(self):
+        c = cache.LookupCache()
+        for i in range(10):
+            c[i] = i
+        self.assertEqual(len(c), 10)
+
+    def test_replace_does_not_evict(self):
+        c = cache.LookupCache(size=2)
+        c["a"] = 1
+        c["b"] = 2
+        c["b"] = 3
+        self.assertEqual(len(c), 2)
+        self.assertEqual(c.get("a"), 1)
+        self.assertEqual(c.get("b"), 3)
+
+    def test_invalidated_by_registration(self):
+        from zope import component
+        from zope.interface import Interface
+
+        class IFoo(Interface):
+            pass
+
+        c = cache.LookupCache()
+        c["a"] = 1
+
+        sm = component.getGlobalSiteManager()
+        sm.registerAdapter(lambda ob: ob, (Interface,), IFoo)
+        self.assertEqual(len(c), 0)
+
+        c["a"] = 1
+        sm.unregisterAdapter(
+            required=(Interface,), provided=IFoo
+        )
+        self.assertEqual(len(c), 0)
+
+    def test_other_events_ignored(self):
+        import zope.event
+
+        c = cache.LookupCache()
+        c["a"] = 1
+        zope.event.notify(object())
+        self.assertEqual(len(c), 1)
+
+    def test_cleared_on_cleanup(self):
+        from zope.testing.cleanup import cleanUp
+
+        c = cache.LookupCache()
+        c["a"] = 1
+        cleanUp()
+        self.assertEqual(len(c), 0)
+
+    def test_threads(self):
+        import sys
+
+        # Switch threads as often as possible to provoke races between
+        # eviction, lookups and clearing the cache.
+        interval = sys.getswitchinterval()
+        self.addCleanup(sys.setswitchinterval, interval)
+        sys.setswitchinterval(1e-6)
+
+        c = cache.LookupCache(size=8)
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(20000):
+                    c[n, i] = i
+                    c.get((n, i - 1))
+                    if i % 100 == 0:
+                        c.clear()
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        workers = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(c.hits + c.misses, 4 * 20000)
+
+
+class TestAdapterLookupCache(CleanUp, unittest.TestCase):
+    def test_lookup(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.interface import implementedBy
+
+        class IFoo(Interface):
+            pass
+
+        spec = (implementedBy(object),)
+        c = cache.AdapterLookupCache()
+        self.assertIsNone(c.lookup(spec, IFoo))
+        self.assertIsNone(c.lookup(spec, IFoo))
+        self.assertEqual(c.stats(), {"entries": 1, "hits": 1, "misses": 1})
+
+        # no event is notified; the cache must be invalidated
+        factory = lambda ob: ob  # noqa: E731
+        component.provideAdapter(factory, (Interface,), IFoo)
+        self.assertIsNone(c.lookup(spec, IFoo))
+        cache.invalidate()
+        self.assertIs(c.lookup(spec, IFoo), factory)
+        self.assertIsNone(c.lookup(spec, IFoo, u"other"))
+        self.assertIsNone(c.lookup(spec * 2, IFoo))
+        self.assertEqual(len(c), 3)
+
+
+class TestExpressionCache(CleanUp, unittest.TestCase):
+    def test_ratio(self):
+        c = cache.ExpressionCache()
+        self.assertIsNone(c.stats()["ratio"])
+        c["a"] = 1
+        c.get("a")
+        c.get("a")
+        c.get("b")
+        self.assertAlmostEqual(c.stats()["ratio"], 2.0 / 3)
+
+
+class TestTemplateCache(unittest.TestCase):
+    def test_lru(self):
+        c = cache.TemplateCache(size=2)
+        c.set("a", {})
+        c.set("b", {})
+        c.get("a")
+        c.set("c", {})
+        self.assertEqual(list(c.data), ["a", "c"])
+
+    def test_memory(self):
+        c = cache.TemplateCache()
+        c.set("a", {"render": cache.invalidate, "x": 1})
+        memory = c.memory
+        self.assertGreater(memory, 0)
+        c.set("b", {})
+        self.assertEqual(c.stats()["memory_per_entry"], memory // 2)
+        c.set("a", {})
+        self.assertEqual(c.memory, 0)
+
+    def test_evicts_module(self):
+        import sys
+        import types
+
+        module = types.ModuleType("z3c_pt_test_template")
+        sys.modules[module.__name__] = module
+        self.addCleanup(sys.modules.pop, module.__name__, None)
+
+        c = cache.TemplateCache(size=1)
+        c.set("a", {"__name__": module.__name__})
+        c.set("b", {})
+        self.assertIn(module.__name__, sys.modules)
+
+        c.set("c", module.__dict__)
+        c.clear()
+        self.assertNotIn(module.__name__, sys.modules)
+
+    def _load_concurrently(self, c, compile, threads=8):
+        results = []
+
+        def load():
+            try:
+                results.append(c.load("a", compile))
+            except ValueError as e:
+                results.append(e)
+
+        workers = [threading.Thread(target=load) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        return workers, results
+
+    def test_load_single_flight(self):
+        c = cache.TemplateCache()
+        compiling = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compile():
+            calls.append(1)
+            compiling.set()
+            release.wait()
+            return {"n": len(calls)}
+
+        workers, results = self._load_concurrently(c, compile)
+        compiling.wait()
+        release.set()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [{"n": 1}] * 8)
+        stats = c.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"] + stats["misses"], 8)
+        self.assertEqual(c.pending, {})
+
+    def test_load_error(self):
+        c = cache.TemplateCache()
+        compiling = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compile():
+            calls.append(1)
+            if len(calls) == 1:
+                compiling.set()
+                release.wait()
+                raise ValueError("compile")
+            return {}
+
+        workers, results = self._load_concurrently(c, compile, 2)
+        compiling.wait()
+        # The other thread waits for the compilation, then compiles
+        # the program itself.
+        for i in range(10000):
+            time.sleep(0.001)
+            if c.waits:
+                break
+        release.set()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sorted(map(repr, results)),
+                         ["ValueError('compile')", "{}"])
+        self.assertEqual(c.stats()["misses"], 2)
+        self.assertEqual(c.pending, {})
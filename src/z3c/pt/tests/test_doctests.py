@@ -42,6 +42,18 @@ def test_suite():
                 setUp=setUp,
                 tearDown=zope.component.testing.tearDown,
             ),
+            doctest.DocTestSuite(
+                "z3c.pt.cache",
+                optionflags=OPTIONFLAGS,
+                setUp=setUp,
+                tearDown=zope.component.testing.tearDown,
+            ),
+            doctest.DocTestSuite(
+                "z3c.pt.fragments",
+                optionflags=OPTIONFLAGS,
+                setUp=setUp,
+                tearDown=zope.component.testing.tearDown,
+            ),
             doctest.DocTestSuite(
                 "z3c.pt.namespaces",
                 optionflags=OPTIONFLAGS,
@@ -5,6 +5,9 @@ Tests for expressions.py
 """
 import unittest
 
+from zope.interface import Attribute
+from zope.interface import Interface
+from zope.interface import implementer
 from zope.testing.cleanup import CleanUp
 
 from z3c.pt import expressions
@@ -12,6 +15,11 @@ from z3c.pt import expressions
 # pylint:disable=protected-access
 
 
+class IPureView(Interface):
+    # Interfaces of pure attributes are imported by the template code.
+    url = Attribute("The URL.")
+
+
 class TestRenderContentProvider(CleanUp, unittest.TestCase):
     def test_not_found(self):
         from zope.contentprovider.interfaces import ContentProviderLookupError
@@ -62,6 +70,163 @@ class TestRenderContentProvider(CleanUp, unittest.TestCase):
 
         self.assertEqual(attrs, {"__name__": "a provider"})
 
+    def test_lookup_cached(self):
+        from zope import component
+        from zope.contentprovider.interfaces import ContentProviderLookupError
+        from zope.contentprovider.interfaces import IContentProvider
+
+        class Provider(object):
+            def __init__(self, *args):
+                pass
+
+            def update(self):
+                pass
+
+            def render(self):
+                return u"rendered"
+
+        cache = expressions.content_providers
+        econtext = {"context": 1, "request": None, "view": None}
+
+        # a negative result is cached, too
+        for i in range(2):
+            with self.assertRaises(ContentProviderLookupError):
+                expressions.render_content_provider(econtext, "cached")
+        self.assertEqual(len(cache), 1)
+        misses = cache.misses
+
+        # the registration event clears the cache
+        component.getGlobalSiteManager().registerAdapter(
+            Provider,
+            required=(object, object, object),
+            provided=IContentProvider,
+            name="cached",
+        )
+        self.assertEqual(len(cache), 0)
+        for i in range(2):
+            self.assertEqual(
+                expressions.render_content_provider(econtext, "cached"),
+                u"rendered",
+            )
+        self.assertEqual(cache.misses, misses + 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_factory_returns_none(self):
+        from zope import component
+        from zope.contentprovider.interfaces import ContentProviderLookupError
+        from zope.contentprovider.interfaces import IContentProvider
+
+        component.provideAdapter(
+            lambda *args: None,
+            adapts=(object, object, object),
+            provides=IContentProvider,
+            name="none",
+        )
+        econtext = {"context": 1, "request": None, "view": None}
+        with self.assertRaises(ContentProviderLookupError):
+            expressions.render_content_provider(econtext, "none")
+
+
+class TestProviderOutputCache(CleanUp, unittest.TestCase):
+    def setUp(self):
+        from zope import component
+        from zope import interface
+        from zope.contentprovider.interfaces import IContentProvider
+        from z3c.pt.interfaces import IContentProviderCacheKey
+
+        CleanUp.setUp(self)
+        self.calls = calls = []
+
+        class IProvider(IContentProvider):
+            pass
+
+        @interface.implementer(IProvider)
+        class Provider(object):
+            output = u"<p>cached</p>"
+
+            def __init__(self, context, request, view):
+                self.context = context
+
+            def update(self):
+                calls.append("update")
+
+            def render(self):
+                calls.append("render")
+                return self.output
+
+        @component.adapter(IProvider)
+        @interface.implementer(IContentProviderCacheKey)
+        class CacheKey(object):
+            def __init__(self, provider):
+                self.key = provider.context
+
+        self.Provider = Provider
+        component.provideAdapter(
+            Provider, adapts=(object, object, object), name="cached"
+        )
+        component.provideAdapter(CacheKey)
+
+    def _render(self, key, name="cached", **kwargs):
+        econtext = {"context": key, "request": None, "view": None}
+        econtext.update(kwargs)
+        return expressions.render_content_provider(econtext, name)
+
+    def test_cached(self):
+        self.assertEqual(self._render(1), u"<p>cached</p>")
+        self.assertEqual(self._render(1), u"<p>cached</p>")
+        self.assertEqual(self.calls, ["update", "render"])
+        self._render(2)
+        self._render(1, target_language="de")
+        self.assertEqual(len(self.calls), 6)
+
+        stats = expressions.provider_outputs.stats()
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["ratio"], 0.25)
+
+    def test_no_key(self):
+        self._render(None)
+        self._render(None)
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(len(expressions.provider_outputs), 0)
+
+    def test_none_output(self):
+        self.Provider.output = None
+        self.assertIsNone(self._render(1))
+        self.assertEqual(self._render(1), u"")
+        self.assertEqual(self.calls, ["update", "render"])
+
+    def test_provider_class(self):
+        from zope import component
+
+        class Other(self.Provider):
+            output = u"<p>other</p>"
+
+        component.provideAdapter(
+            Other, adapts=(int, object, object), name="cached"
+        )
+        self.assertEqual(self._render(1), u"<p>other</p>")
+        self.assertEqual(self._render(u"1"), u"<p>cached</p>")
+
+    def test_utility(self):
+        from zope import component
+        from z3c.pt.fragments import RAMFragmentCache
+        from z3c.pt.interfaces import IFragmentCache
+
+        cache = RAMFragmentCache()
+        component.provideUtility(cache, IFragmentCache, name="provider")
+        self._render(1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(len(expressions.provider_outputs), 0)
+
+    def test_cleared_on_cleanup(self):
+        from zope.testing.cleanup import cleanUp
+
+        self._render(1)
+        cleanUp()
+        self.assertEqual(len(expressions.provider_outputs), 0)
+
 
 class TestPathExpr(CleanUp, unittest.TestCase):
     def test_translate_empty_string(self):
@@ -136,7 +301,8 @@ class TestPathExpr(CleanUp, unittest.TestCase):
         self.assertEqual(code, "(var2, )")
 
         translated = expr.translate("a/?var/?var2", None)
-        self.assertEqual(len(translated), 1)
+        # the second statement resolves an awaitable value
+        self.assertEqual(len(translated), 2)
         code = TemplateCodeGenerator(translated[0]).code
         # XXX: Normally this starts with 'None =', but sometimes on Python 2,
         # at least in tox, it starts with '__package__ ='. Why
@@ -147,3 +313,743 @@ class TestPathExpr(CleanUp, unittest.TestCase):
             "None = _path_traverse(a, econtext, True, (('%s' % (var, )), "
             "('%s' % (var2, )), ))",
         )
+
+    def test_translate_custom_traverser(self):
+        from chameleon.astutil import Symbol
+        from chameleon.codegen import TemplateCodeGenerator
+
+        def custom_traverse(base, econtext, call, path_items):
+            raise NotImplementedError
+
+        class CustomPathExpr(expressions.PathExpr):
+            traverser = Symbol(custom_traverse)
+
+        expr = CustomPathExpr("")
+        translated = expr.translate("a/b/c", None)
+        self.assertEqual(len(translated), 2)
+        code = TemplateCodeGenerator(translated[0]).code
+        code = code.strip().replace("__package__", "None")
+        self.assertEqual(
+            code,
+            "None = _custom_traverse(a, econtext, True, ('b', 'c', ))",
+        )
+
+
+class TestInlinePathTraversal(CleanUp, unittest.TestCase):
+    def _render(self, expression, **context):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        template = PageTemplate(
+            '<p tal:replace="%s" />' % expression
+        )
+        return template.render(**context)
+
+    def _provideTraversable(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        component.provideAdapter(
+            DefaultTraversable, (Interface,), ITraversable
+        )
+
+    def test_attributes_and_items(self):
+        class Ob(object):
+            items = {"key": u"value"}
+
+        self.assertEqual(self._render("ob/items/key", ob=Ob()), "value")
+
+    def test_call(self):
+        class Ob(object):
+            def method(self):
+                return u"called"
+
+        self.assertEqual(self._render("ob/method", ob=Ob()), "called")
+        self.assertIn(
+            "bound method", self._render("nocall:ob/method", ob=Ob())
+        )
+
+    def test_miss_uses_traversal(self):
+        self._provideTraversable()
+
+        class Container(object):
+            def __getitem__(self, name):
+                return {"title": name.upper()}
+
+        class Ob(object):
+            container = Container()
+
+        self.assertEqual(
+            self._render("ob/container/item/title", ob=Ob()), "ITEM"
+        )
+
+    def test_miss_raises(self):
+        from zope.location.interfaces import LocationError
+
+        self._provideTraversable()
+
+        with self.assertRaises(LocationError):
+            self._render("ob/missing/title", ob=object())
+
+        self.assertEqual(self._render("ob/missing | nothing", ob=object()), "")
+
+    def test_interpolation_after_static_segment(self):
+        ob = {"a": {"b": u"value"}}
+        self.assertEqual(self._render("ob/a/?name", ob=ob, name="b"), "value")
+
+    def test_namespace(self):
+        from z3c.pt.namespaces import function_namespaces
+
+        class Namespace(object):
+            def __init__(self, context):
+                self.context = context
+
+            def upper(self):
+                return self.context.upper()
+
+        function_namespaces.namespaces["test"] = Namespace
+        self.addCleanup(function_namespaces.namespaces.pop, "test")
+
+        self.assertEqual(
+            self._render("ob/title/test:upper", ob={"title": u"title"}),
+            "TITLE",
+        )
+
+    def test_traversable_namespace(self):
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+        from z3c.pt.namespaces import function_namespaces
+
+        @implementer(ITraversable)
+        class Namespace(object):
+            def __init__(self, context):
+                self.context = context
+
+            def traverse(self, name, further_path):
+                return "%s:%s" % (name, self.context)
+
+        function_namespaces.namespaces["test"] = Namespace
+        self.addCleanup(function_namespaces.namespaces.pop, "test")
+
+        self.assertEqual(
+            self._render("ob/title/test:upper", ob={"title": u"title"}),
+            "upper:title",
+        )
+
+
+class TestPathTraverse(CleanUp, unittest.TestCase):
+    def setUp(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        super(TestPathTraverse, self).setUp()
+        component.provideAdapter(
+            DefaultTraversable, (Interface,), ITraversable
+        )
+
+    def _traverse(self, base, *path_items):
+        return expressions.path_traverse(
+            base, {"request": None}, True, path_items
+        )
+
+    def test_items_attributes_and_traversal(self):
+        class Container(object):
+            title = u"title"
+
+            def __getitem__(self, name):
+                return {"name": name}
+
+        ob = {"container": Container()}
+        self.assertEqual(self._traverse(ob, "container", "title"), "title")
+        self.assertEqual(
+            self._traverse(ob, "container", "item", "name"), "item"
+        )
+        self.assertEqual(self._traverse({"f": lambda: u"done"}, "f"), "done")
+
+    def test_namespaces(self):
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+        from z3c.pt.namespaces import function_namespaces
+
+        class Namespace(object):
+            def __init__(self, context):
+                self.context = context
+
+            def upper(self):
+                return self.context.upper()
+
+        @implementer(ITraversable)
+        class TraversableNamespace(Namespace):
+            def traverse(self, name, further_path):
+                return name
+
+        function_namespaces.namespaces["test"] = Namespace
+        self.addCleanup(function_namespaces.namespaces.pop, "test")
+        function_namespaces.namespaces["traverse"] = TraversableNamespace
+        self.addCleanup(function_namespaces.namespaces.pop, "traverse")
+
+        self.assertEqual(self._traverse(u"title", "test:upper"), "TITLE")
+        self.assertEqual(self._traverse(u"title", "traverse:name"), "name")
+        self.assertEqual(
+            self._traverse({"name": u"title"}, "test:context", "name"),
+            "title",
+        )
+
+    def test_miss(self):
+        class Container(object):
+            def __getitem__(self, name):
+                return {"name": name}
+
+        self.assertEqual(
+            expressions.path_traverse_miss(
+                Container(), {}, True, "item", ("name",)
+            ),
+            "item",
+        )
+
+
+class TestPathTraversalCache(CleanUp, unittest.TestCase):
+    def setUp(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        super(TestPathTraversalCache, self).setUp()
+        component.provideAdapter(
+            DefaultTraversable, (Interface,), ITraversable
+        )
+
+    def _makeOne(self, name="item"):
+        return expressions.PathTraversalCache(name)
+
+    def test_remembers_adapter_factory(self):
+        class Container(object):
+            def __getitem__(self, name):
+                return {"name": name}
+
+        cache = self._makeOne()
+        for i in range(3):
+            self.assertEqual(cache(Container(), {}, True, ("name",)), "item")
+
+        self.assertEqual(cache.stats(), {"entries": 1, "hits": 2, "misses": 1})
+
+    def test_invalidated_by_registration(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+
+        @implementer(ITraversable)
+        class Traversable(object):
+            def __init__(self, context):
+                pass
+
+            def traverse(self, name, further_path):
+                return "traversed"
+
+        class Container(object):
+            def __getitem__(self, name):
+                return name
+
+        cache = self._makeOne()
+        self.assertEqual(cache(Container(), {}, False, ()), "item")
+
+        component.getGlobalSiteManager().registerAdapter(
+            Traversable, (Interface,), ITraversable
+        )
+        self.assertEqual(cache(Container(), {}, False, ()), "traversed")
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+
+        from z3c.pt.cache import invalidate
+
+        @implementer(ITraversable)
+        class Traversable(object):
+            def __init__(self, context):
+                pass
+
+            def traverse(self, name, further_path):
+                return "traversed"
+
+        class Container(object):
+            def __getitem__(self, name):
+                return name
+
+        cache = self._makeOne()
+        self.assertEqual(cache(Container(), {}, False, ()), "item")
+
+        # No event is notified; the cache must be invalidated.
+        component.provideAdapter(Traversable, (Interface,), ITraversable)
+        self.assertEqual(cache(Container(), {}, False, ()), "item")
+        invalidate()
+        self.assertEqual(cache(Container(), {}, False, ()), "traversed")
+
+    def test_traversable(self):
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+
+        @implementer(ITraversable)
+        class Traversable(object):
+            def traverse(self, name, further_path):
+                self.further_path = list(further_path)
+                further_path.pop()
+                return {"name": name}
+
+        ob = Traversable()
+        cache = self._makeOne()
+        result = cache(ob, {}, True, ("skipped", "name"))
+        self.assertEqual(result, "item")
+        self.assertEqual(ob.further_path, ["name", "skipped"])
+
+    def test_not_found(self):
+        from zope.location.interfaces import LocationError
+
+        cache = self._makeOne()
+        with self.assertRaises(LocationError):
+            cache(object(), {}, True, ())
+
+    def test_no_adapter(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.location.interfaces import LocationError
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        component.getGlobalSiteManager().unregisterAdapter(
+            DefaultTraversable, (Interface,), ITraversable
+        )
+
+        cache = self._makeOne()
+        with self.assertRaises(LocationError):
+            cache(object(), {}, True, ())
+        self.assertEqual(len(cache), 0)
+
+    def test_factory_returns_none(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.location.interfaces import LocationError
+        from zope.traversing.interfaces import ITraversable
+
+        class IMarker(Interface):
+            pass
+
+        @implementer(IMarker)
+        class Ob(object):
+            pass
+
+        component.provideAdapter(lambda ob: None, (IMarker,), ITraversable)
+
+        cache = self._makeOne()
+        with self.assertRaises(LocationError):
+            cache(Ob(), {}, True, ())
+        self.assertEqual(len(cache), 1)
+
+    def test_conform_not_cached(self):
+        from zope.traversing.interfaces import ITraversable
+
+        class Traversable(object):
+            def traverse(self, name, further_path):
+                return name.upper()
+
+        class Conforming(object):
+            def __conform__(self, iface):
+                if iface is ITraversable:
+                    return Traversable()
+
+        cache = self._makeOne()
+        self.assertEqual(cache(Conforming(), {}, True, ()), "ITEM")
+        self.assertEqual(len(cache), 0)
+
+    def test_compiled_parent_segment(self):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class Ob(object):
+            title = u"parent"
+
+        ob = Ob()
+        ob.child = type("Child", (object,), {"__parent__": ob})()
+
+        template = PageTemplate(
+            '<p tal:replace="options/ob/child/../title" />'
+        )
+        self.assertEqual(template(ob=ob), "parent")
+
+
+class TestMissingPaths(CleanUp, unittest.TestCase):
+    def setUp(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        super(TestMissingPaths, self).setUp()
+        component.provideAdapter(
+            DefaultTraversable, (Interface,), ITraversable
+        )
+
+    def _render(self, expression, **context):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        template = PageTemplate(
+            '<p tal:replace="%s" />' % expression
+        )
+        return template.render(**context)
+
+    def _no_exceptions(self):
+        # Objects adapted by ``DefaultTraversable`` are not traversed
+        # using ``traversePathElement`` (which raises).
+        def fail(*args, **kwargs):
+            raise AssertionError("Must not be called")
+
+        self.addCleanup(
+            setattr, expressions, "traversePathElement",
+            expressions.traversePathElement,
+        )
+        expressions.traversePathElement = fail
+
+    def test_alternatives(self):
+        class Container(object):
+            title = u"title"
+
+            def __getitem__(self, name):
+                if name == "item":
+                    return self
+                raise KeyError(name)
+
+        self._no_exceptions()
+        ob = Container()
+        render = self._render
+        self.assertEqual(render("ob/missing | ob/title", ob=ob), "title")
+        self.assertEqual(render("ob/item/title | nothing", ob=ob), "title")
+        self.assertEqual(
+            render("ob/item/missing/title | ob/x | ob/title", ob=ob), "title"
+        )
+        self.assertEqual(render("ob/?name | nothing", ob=ob, name="x"), "")
+        self.assertEqual(render("ob/title/x | nothing", ob=ob), "")
+        self.assertEqual(render("nocall:ob/missing | nothing", ob=ob), "")
+        self.assertEqual(render("ob/missing | string:default", ob=ob),
+                         "default")
+
+    def test_alternatives_exceptions(self):
+        class Ob(object):
+            child = object()
+
+            @property
+            def error(self):
+                raise AttributeError("error")
+
+        ob = Ob()
+        render = self._render
+        self.assertEqual(render("ob/error | nothing", ob=ob), "")
+        self.assertEqual(render("undefined/title | nothing"), "")
+        self.assertEqual(render("ob/child/.. | nothing", ob=ob), "")
+        # The last alternative raises.
+        with self.assertRaises(LookupError):
+            render("nothing/title | ob/error", ob=ob)
+
+    def test_exists(self):
+        class Ob(object):
+            title = u"title"
+
+            def method(self):
+                raise AssertionError("Must not be called")
+
+        self._no_exceptions()
+        ob = Ob()
+        render = self._render
+        self.assertEqual(render("exists:ob/title", ob=ob), "1")
+        self.assertEqual(render("exists:ob/method", ob=ob), "1")
+        self.assertEqual(render("exists:ob/missing", ob=ob), "0")
+        self.assertEqual(render("exists:ob/missing | ob/title", ob=ob), "1")
+        self.assertEqual(render("exists:ob/missing | ob/x", ob=ob), "0")
+        self.assertEqual(
+            render("exists:ob/missing | python: 1", ob=ob), "1"
+        )
+        self.assertEqual(render("exists:undefined"), "0")
+
+    def test_exists_other_expression(self):
+        from chameleon.tales import PythonExpr
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class Template(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types, nocall=PythonExpr
+            )
+
+        template = Template(
+            '<p tal:replace="exists:int(None)" />'
+            '<p tal:replace="exists:int(1)" />'
+        )
+        self.assertEqual(template(), "01")
+
+    def test_subclass_translate(self):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        translated = []
+
+        class Translate(object):
+            def translate(self, string, target):
+                translated.append(string.strip())
+                return super(Translate, self).translate(string, target)
+
+        class PathExpr(Translate, expressions.PathExpr):
+            pass
+
+        class NocallExpr(Translate, expressions.NocallExpr):
+            pass
+
+        class Template(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types,
+                path=PathExpr,
+                nocall=NocallExpr,
+            )
+
+        class Ob(object):
+            title = u"title"
+
+        template = Template(
+            '<p tal:replace="ob/missing | ob/title" />'
+            '<p tal:replace="exists:ob/missing | ob/title" />'
+        )
+        self.assertEqual(template.render(ob=Ob()), "title1")
+        self.assertEqual(
+            translated,
+            ["ob/title", "ob/missing", "ob/title", "ob/missing"],
+        )
+
+    def test_no_input(self):
+        from chameleon.exc import ExpressionError
+
+        expr = expressions.PathExpr("")
+        with self.assertRaises(ExpressionError):
+            expr("target", None)
+
+    def test_traversable(self):
+        from zope.interface import implementer
+        from zope.location.interfaces import LocationError
+        from zope.traversing.interfaces import ITraversable
+
+        @implementer(ITraversable)
+        class Traversable(object):
+            def traverse(self, name, further_path):
+                if name == "item":
+                    return {"name": name}
+                raise LocationError(self, name)
+
+        ob = Traversable()
+        render = self._render
+        self.assertEqual(render("ob/item/name | nothing", ob=ob), "item")
+        self.assertEqual(render("ob/missing/name | nothing", ob=ob), "")
+        self.assertEqual(render("exists:ob/x/?name", ob=ob, name="x"), "0")
+        self.assertEqual(render("exists:ob/?name/x", ob=ob, name="x"), "0")
+        self.assertEqual(
+            render("exists:ob/?name/name", ob=ob, name="item"), "1"
+        )
+
+    def test_no_adapter(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        component.getGlobalSiteManager().unregisterAdapter(
+            DefaultTraversable, (Interface,), ITraversable
+        )
+
+        self.assertEqual(self._render("ob/missing | nothing", ob=1), "")
+        self.assertEqual(
+            self._render("ob/?name | nothing", ob=1, name="missing"), ""
+        )
+
+    def test_parent(self):
+        class Ob(object):
+            title = u"parent"
+
+        ob = Ob()
+        ob.child = type("Child", (object,), {"__parent__": ob})()
+        render = self._render
+        self.assertEqual(render("ob/child/../title | nothing", ob=ob),
+                         "parent")
+        self.assertEqual(render("ob/child/../x | nothing", ob=ob), "")
+        self.assertEqual(render("ob/child/+x | nothing", ob=ob), "")
+
+    def test_path_find_namespaces(self):
+        from zope.interface import implementer
+        from zope.location.interfaces import LocationError
+        from zope.traversing.interfaces import ITraversable
+        from z3c.pt.namespaces import function_namespaces
+
+        class Namespace(object):
+            def __init__(self, context):
+                self.context = context
+
+            def upper(self):
+                return self.context.upper()
+
+        @implementer(ITraversable)
+        class TraversableNamespace(Namespace):
+            def traverse(self, name, further_path):
+                if name == "missing":
+                    raise LocationError(self, name)
+                return {"name": name}
+
+        function_namespaces.namespaces["test"] = Namespace
+        self.addCleanup(function_namespaces.namespaces.pop, "test")
+        function_namespaces.namespaces["traverse"] = TraversableNamespace
+        self.addCleanup(function_namespaces.namespaces.pop, "traverse")
+
+        def find(base, *path_items):
+            return expressions.path_find(
+                base, {"request": None}, True, path_items
+            )
+
+        Missing = expressions.Missing
+        self.assertEqual(find(u"title", "test:upper"), "TITLE")
+        self.assertEqual(find(u"title", "traverse:x", "name"), "x")
+        self.assertIs(find(u"title", "traverse:missing", "name"), Missing)
+        self.assertIs(find(u"title", "missing", "name"), Missing)
+        self.assertEqual(find({"f": lambda: u"done"}, "f"), "done")
+
+    def test_find_element(self):
+        from zope.traversing.interfaces import ITraversable
+
+        class Traversable(object):
+            def traverse(self, name, further_path):
+                return name.upper()
+
+        class Conforming(object):
+            def __conform__(self, iface):
+                if iface is ITraversable:
+                    return Traversable()
+
+        self.assertEqual(expressions.default_traverse(u"", "upper"),
+                         u"".upper)
+
+        find = expressions.find_element
+        self.assertEqual(find(Conforming(), "name", [], None), "NAME")
+        self.assertEqual(find([], "name", [], None), expressions.Missing)
+        self.assertEqual(find({"a": 1}, "a", [], None), 1)
+
+
+class TestPurePaths(CleanUp, unittest.TestCase):
+    def _template(self, body, paths=(), attributes=()):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class Template(PageTemplate):
+            pure_paths = paths
+            pure_attributes = attributes
+
+        return Template(body)
+
+    def _view(self, provides=True):
+        calls = self.calls = []
+
+        class View(object):
+            @property
+            def url(self):
+                calls.append(self)
+                return u"url%d" % len(calls)
+
+            def items(self):
+                calls.append(self)
+                return self
+
+        if provides:
+            View = implementer(IPureView)(View)
+        return View()
+
+    def test_loop(self):
+        template = self._template(
+            '<p tal:repeat="item items">${view/url} ${view/url}</p>'
+            '<i tal:define="view other">${view/url}</i>',
+            paths=["view/url"],
+        )
+        view = self._view()
+        other = type(view)()
+        self.assertEqual(
+            template.render(view=view, other=other, items=[1, 2]),
+            "<p>url1 url1</p>\n<p>url1 url1</p><i>url2</i>",
+        )
+        self.assertEqual(template.render(view=view, other=other, items=[1]),
+                         "<p>url3 url3</p><i>url4</i>")
+
+    def test_not_pure(self):
+        template = self._template(
+            "${view/url} ${view/url}", paths=["context/url"]
+        )
+        self.assertEqual(template.render(view=self._view()), "url1 url2")
+
+    def test_missing(self):
+        template = self._template(
+            '<p tal:content="view/url | string:x" />'
+            '<p tal:content="view/url | string:y" />',
+            paths=["view/url"],
+        )
+        self.assertEqual(template.render(view=object()),
+                         "<p>x</p><p>y</p>")
+
+    def test_nocall(self):
+        template = self._template(
+            '<p tal:define="f nocall:view/items; g nocall:view/items">'
+            '${python: f == g} ${python: len(calls)}'
+            ' ${python: view is path("view/items")}</p>',
+            paths=["nocall:view/items", "view/items"],
+        )
+        view = self._view()
+        self.assertEqual(template.render(view=view, calls=self.calls),
+                         "<p>True 0 True</p>")
+
+    def test_attributes(self):
+        template = self._template(
+            "${view/url} ${view/url} ${python: path('view/url')}",
+            attributes=[IPureView["url"]],
+        )
+        self.assertEqual(template.render(view=self._view()),
+                         "url1 url1 url1")
+        self.assertEqual(template.render(view=self._view(False)),
+                         "url1 url2 url3")
+
+    def test_digest(self):
+        body = '${view/url}'
+        plain = self._template(body)
+        pure = self._template(body, paths=["view/url"])
+        self.assertNotEqual(plain.digest(body, []), pure.digest(body, []))
+        self.assertEqual(
+            pure._pt_pure(), (("view/url",), ())
+        )
+        self.assertEqual(
+            self._template(body, attributes=[IPureView["url"]])._pt_pure(),
+            ((), ("z3c.pt.tests.test_expressions.IPureView.url",)),
+        )
+
+
+class TestThreadState(CleanUp, unittest.TestCase):
+    def test_inherited(self):
+        from zope.security import management
+
+        class Site(object):
+            def getSiteManager(self):
+                from zope.component import getGlobalSiteManager
+
+                return getGlobalSiteManager()
+
+        site = Site()
+        interaction = object()
+        state = (site, interaction)
+
+        self.assertEqual(expressions.thread_state(), (None, None))
+        with expressions.inherited_thread_state(state):
+            self.assertEqual(expressions.thread_state(), state)
+        self.assertEqual(expressions.thread_state(), (None, None))
+        self.assertFalse(hasattr(management.thread_local, "interaction"))
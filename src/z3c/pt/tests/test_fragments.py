@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for fragments.py.
+
+"""
+import threading
+import unittest
+
+from six.moves import socketserver
+from zope.testing.cleanup import CleanUp
+import zope.configuration.xmlconfig
+
+from z3c.pt import fragments
+from z3c.pt import pagetemplate
+
+NS = 'xmlns:z3c="http://xml.zope.org/namespaces/z3c"'
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.clock = fragments._clock
+        fragments._clock = lambda: self.now
+
+    def restore(self):
+        fragments._clock = self.clock
+
+
+class TestRAMFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def tearDown(self):
+        self.clock.restore()
+
+    def test_least_recently_used_evicted(self):
+        cache = fragments.RAMFragmentCache(size=2)
+        cache.set("a", u"1")
+        cache.set("b", u"2")
+        cache.get("a")
+        cache.set("c", u"3")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), u"1")
+        self.assertIsNone(cache.get("b"))
+
+    def test_replace(self):
+        cache = fragments.RAMFragmentCache(size=2)
+        cache.set("a", u"1")
+        cache.set("b", u"2")
+        cache.set("a", u"3")
+        self.assertEqual(cache.get("a"), u"3")
+        self.assertEqual(cache.get("b"), u"2")
+
+    def test_ttl(self):
+        cache = fragments.RAMFragmentCache(ttl=60)
+        cache.set("a", u"1")
+        cache.set("b", u"2", 10)
+        cache.set("c", u"3", 0)
+        self.clock.now += 10
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), u"1")
+        self.clock.now += 50
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), u"3")
+        self.assertEqual(len(cache), 1)
+
+    def test_clear(self):
+        cache = fragments.RAMFragmentCache()
+        cache.set("a", u"1")
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class MemcachedHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        for line in iter(self.rfile.readline, b""):
+            command = line.split()
+            server.commands.append(command)
+            response = server.response
+            if command[0] == b"set":
+                # The data block is read even if the response is
+                # canned, so that it isn't taken for a command.
+                value = self.rfile.read(int(command[4]) + 2)[:-2]
+                if response is None:
+                    server.data[command[1]] = value
+
+            if response is not None:
+                self.wfile.write(response)
+            elif command[0] == b"get":
+                value = server.data.get(command[1])
+                if value is not None:
+                    self.wfile.write(
+                        b"VALUE %s 0 %d\r\n%s\r\n" % (
+                            command[1], len(value), value
+                        )
+                    )
+                self.wfile.write(b"END\r\n")
+            else:
+                self.wfile.write(b"STORED\r\n")
+
+
+class MemcachedServer(socketserver.ThreadingTCPServer):
+    """Stand-in for a memcached server (``get`` and ``set`` only)."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(
+            self, ("127.0.0.1", 0), MemcachedHandler
+        )
+        self.data = {}
+        self.commands = []
+        self.response = None
+
+
+class TestMemcachedFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.server = MemcachedServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.cache = fragments.MemcachedFragmentCache(
+            "127.0.0.1:%d" % self.server.server_address[1], ttl=300
+        )
+
+    def tearDown(self):
+        self.cache.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", u"<p>\xe9</p>")
+        self.cache.set("b", u"", ttl=10)
+        self.assertEqual(self.cache.get("a"), u"<p>\xe9</p>")
+        self.assertEqual(self.cache.get("b"), u"")
+        self.assertEqual(self.server.data[b"a"], b"<p>\xc3\xa9</p>")
+        self.assertEqual(
+            [
+                command[:4]
+                for command in self.server.commands
+                if command[0] == b"set"
+            ],
+            [[b"set", b"a", b"0", b"300"], [b"set", b"b", b"0", b"10"]],
+        )
+
+    def test_unavailable(self):
+        cache = fragments.MemcachedFragmentCache("127.0.0.1:1", timeout=0.5)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", u"1")
+        self.assertIsNone(cache.get("a"))
+
+    def test_unexpected_response(self):
+        self.cache.set("a", u"1")
+        self.server.response = b"ERROR\r\n"
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("b", u"2")
+        self.assertNotIn(b"b", self.server.data)
+
+        # A new connection is made.
+        self.server.response = None
+        self.assertEqual(self.cache.get("a"), u"1")
+
+    def test_unterminated_value(self):
+        self.server.response = b"VALUE a 0 1\r\n1\r\nERROR\r\n"
+        self.assertIsNone(self.cache.get("a"))
+
+
+class TestFragmentCaching(CleanUp, unittest.TestCase):
+    def setUp(self):
+        import z3c.pt
+
+        CleanUp.setUp(self)
+        zope.configuration.xmlconfig.file("configure.zcml", z3c.pt)
+        self.count = 0
+
+    def counter(self):
+        self.count += 1
+        return self.count
+
+    def _template(self, body):
+        return pagetemplate.PageTemplate(
+            "<div %s>%s</div>" % (NS, body)
+        )
+
+    def test_cached(self):
+        template = self._template(
+            '<p z3c:cache="options/key" tal:content="options/counter" />'
+            '<span tal:replace="options/counter" />'
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter), "<div><p>1</p>2</div>"
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter), "<div><p>1</p>3</div>"
+        )
+        self.assertEqual(
+            template(key=2, counter=self.counter), "<div><p>4</p>5</div>"
+        )
+
+    def test_ttl(self):
+        clock = Clock()
+        self.addCleanup(clock.restore)
+        template = self._template(
+            '<p z3c:cache="string:key; 60" tal:content="options/counter" />'
+        )
+        self.assertEqual(template(counter=self.counter), "<div><p>1</p></div>")
+        clock.now += 59
+        self.assertEqual(template(counter=self.counter), "<div><p>1</p></div>")
+        clock.now += 1
+        self.assertEqual(template(counter=self.counter), "<div><p>2</p></div>")
+
+    def test_none_key(self):
+        template = self._template(
+            '<p z3c:cache="nothing" tal:content="options/counter" />'
+        )
+        template(counter=self.counter)
+        self.assertEqual(template(counter=self.counter), "<div><p>2</p></div>")
+        self.assertEqual(len(fragments.fragment_cache), 0)
+
+    def test_element_position_and_language(self):
+        template = self._template(
+            '<p z3c:cache="string:key" tal:content="counter" />'
+            '<p z3c:cache="string:key" tal:content="counter" />'
+        )
+        self.assertEqual(
+            template.render(counter=self.counter),
+            "<div><p>1</p><p>2</p></div>",
+        )
+        self.assertEqual(
+            template.render(counter=self.counter, target_language="de"),
+            "<div><p>3</p><p>4</p></div>",
+        )
+        self.assertEqual(
+            template.render(counter=self.counter),
+            "<div><p>1</p><p>2</p></div>",
+        )
+
+    def test_nested(self):
+        template = self._template(
+            '<div z3c:cache="options/outer">'
+            '<p z3c:cache="string:inner" tal:content="options/counter" />'
+            '<span tal:replace="options/counter" /></div>'
+        )
+        self.assertEqual(
+            template(outer=1, counter=self.counter),
+            "<div><div><p>1</p>2</div></div>",
+        )
+        self.assertEqual(
+            template(outer=2, counter=self.counter),
+            "<div><div><p>1</p>3</div></div>",
+        )
+
+    def test_block_and_statements(self):
+        template = self._template(
+            '<z3c:block z3c:cache="string:key${i}"'
+            ' tal:repeat="i python: range(2)">${options/counter}</z3c:block>'
+        )
+        self.assertEqual(template(counter=self.counter), "<div>1\n2</div>")
+        self.assertEqual(template(counter=self.counter), "<div>1\n2</div>")
+
+    def test_repeat(self):
+        template = self._template(
+            '<p tal:repeat="item options/items" z3c:cache="python: item"'
+            ' tal:content="options/counter" />'
+        )
+        self.assertEqual(
+            template(items=(1, 2), counter=self.counter),
+            "<div><p>1</p>\n<p>2</p></div>",
+        )
+        self.assertEqual(
+            template(items=(2, 3), counter=self.counter),
+            "<div><p>2</p>\n<p>3</p></div>",
+        )
+
+    def test_define(self):
+        template = self._template(
+            '<p tal:define="x options/key" z3c:cache="x"'
+            ' tal:content="options/counter" />'
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter), "<div><p>1</p></div>"
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter), "<div><p>1</p></div>"
+        )
+
+    def test_condition(self):
+        template = self._template(
+            '<p tal:condition="options/show" z3c:cache="string:key"'
+            ' tal:content="options/counter" />'
+        )
+        self.assertEqual(
+            template(show=False, counter=self.counter), "<div></div>"
+        )
+        self.assertEqual(
+            template(show=True, counter=self.counter), "<div><p>1</p></div>"
+        )
+        self.assertEqual(
+            template(show=False, counter=self.counter), "<div></div>"
+        )
+
+    def test_case(self):
+        template = self._template(
+            '<tal:block tal:switch="options/key">'
+            '<p tal:case="python: 1" tal:define="x string:one" z3c:cache="x"'
+            ' tal:content="options/counter" />'
+            '<p tal:case="default" z3c:cache="string:default"'
+            ' tal:content="options/counter" /></tal:block>'
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter), "<div><p>1</p></div>"
+        )
+        self.assertEqual(
+            template(key=2, counter=self.counter), "<div><p>2</p></div>"
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter), "<div><p>1</p></div>"
+        )
+
+    def test_scope_and_outer_attributes(self):
+        template = self._template(
+            '<p metal:define-macro="m" tal:on-error="string:error"'
+            ' tal:define="x options/key" z3c:cache="x"'
+            ' tal:content="options/counter" />'
+            '<span i18n:translate=""><b metal:define-slot="s" i18n:name="n"'
+            ' tal:condition="options/key" z3c:cache="string:slot"'
+            ' tal:content="options/counter" /></span>'
+        )
+        # (the static message is written out as the name, as it is
+        # without caching)
+        self.assertEqual(
+            template(key=1, counter=self.counter),
+            "<div><p>1</p><span><b>2</b>${n}</span></div>",
+        )
+        self.assertEqual(
+            template(key=1, counter=self.counter),
+            "<div><p>1</p><span><b>2</b>${n}</span></div>",
+        )
+
+    def test_macro(self):
+        macros = self._template(
+            '<p metal:define-macro="m" z3c:cache="string:key"'
+            ' tal:content="options/counter" />'
+        )
+        template = pagetemplate.PageTemplate(
+            '<div metal:use-macro="options/m" />'
+        )
+        for i in range(2):
+            self.assertEqual(
+                template(m=macros.macros["m"], counter=self.counter),
+                "<p>1</p>",
+            )
+        self.assertEqual(macros(counter=self.counter), "<div><p>1</p></div>")
+
+    def test_fill_slot(self):
+        macros = pagetemplate.PageTemplate(
+            '<div metal:define-macro="m">'
+            '<p metal:define-slot="s">default</p></div>'
+        )
+        template = pagetemplate.PageTemplate(
+            '<div metal:use-macro="options/m" %s>'
+            '<p metal:fill-slot="s" z3c:cache="string:key"'
+            ' tal:content="options/counter" /></div>' % NS
+        )
+        for i in range(2):
+            self.assertEqual(
+                template(m=macros.macros["m"], counter=self.counter),
+                "<div><p>1</p></div>",
+            )
+
+    def test_define_slot(self):
+        macros = self._template(
+            '<p metal:define-macro="m">'
+            '<b metal:define-slot="s" z3c:cache="string:key"'
+            ' tal:content="options/counter" /></p>'
+        )
+        template = pagetemplate.PageTemplate(
+            '<div metal:use-macro="options/m">'
+            '<i metal:fill-slot="s" tal:content="options/counter" /></div>'
+        )
+        for i in range(2):
+            self.assertEqual(
+                macros(counter=self.counter), "<div><p><b>1</b></p></div>"
+            )
+        self.assertEqual(
+            template(m=macros.macros["m"], counter=self.counter),
+            "<p><i>2</i></p>",
+        )
+
+    def test_on_error(self):
+        template = self._template(
+            '<p tal:on-error="string:error" z3c:cache="string:key"'
+            ' tal:content="options/counter" />'
+        )
+        for i in range(2):
+            self.assertEqual(
+                template(counter=self.counter), "<div><p>1</p></div>"
+            )
+
+    def test_error_not_cached(self):
+        def fail():
+            raise ValueError(self.counter())
+
+        template = self._template(
+            '<tal:block tal:on-error="string:error">'
+            '<p z3c:cache="string:key">'
+            '<span tal:on-error="string:inner" tal:content="options/fail" />'
+            '${options/fail}</p></tal:block>'
+        )
+        self.assertEqual(template(fail=fail), "<div>error</div>")
+        self.assertEqual(template(fail=fail), "<div>error</div>")
+        self.assertEqual(self.count, 4)
+
+    def test_utility(self):
+        from zope.component import provideUtility
+        from z3c.pt.interfaces import IFragmentCache
+
+        cache = fragments.RAMFragmentCache()
+        provideUtility(cache, IFragmentCache)
+        template = self._template(
+            '<p z3c:cache="string:key" tal:content="options/counter" />'
+        )
+        template(counter=self.counter)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(len(fragments.fragment_cache), 0)
+
+    def test_concurrent_providers(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.contentprovider.interfaces import IContentProvider
+        from z3c.pt.interfaces import IThreadSafeContentProvider
+
+        main = threading.current_thread()
+
+        @implementer(IThreadSafeContentProvider)
+        class Provider(object):
+            def __init__(self, context, request, view):
+                pass
+
+            def update(self):
+                pass
+
+            def render(self):
+                return u"%s" % (threading.current_thread() is main)
+
+        provideAdapter(
+            Provider, (Interface, Interface, Interface), IContentProvider,
+            name="a",
+        )
+
+        class View(object):
+            context = request = None
+
+        template = pagetemplate.ViewPageTemplate(
+            '<div %s><p z3c:cache="string:key"'
+            ' tal:content="structure provider:a" />'
+            '<p tal:content="structure provider:a" /></div>' % NS
+        )
+        template.provider_executor = executor = ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+
+        self.assertEqual(
+            template(View()), "<div><p>True</p><p>False</p></div>"
+        )
+        self.assertEqual(
+            template(View()), "<div><p>True</p><p>False</p></div>"
+        )
+
+    def test_bad_attribute(self):
+        from chameleon.exc import LanguageError
+
+        self.assertRaises(
+            LanguageError, self._template, '<p z3c:cached="string:key" />'
+        )
+
+    def test_missing_key(self):
+        from chameleon.exc import LanguageError
+
+        self.assertRaises(
+            LanguageError, self._template, '<p z3c:cache=" ; 60" />'
+        )
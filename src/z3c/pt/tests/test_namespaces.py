@@ -6,6 +6,8 @@ Tests for namespaces.py.
 
 import unittest
 
+from zope.testing.cleanup import CleanUp
+
 from z3c.pt import namespaces
 
 
@@ -23,7 +25,7 @@ class TestAdapterNamespaces(unittest.TestCase):
             nss.getFunctionNamespace("ns")
 
         # but __getitem__ makes one up
-        self.assertIsNotNone(nss["ns"])
+        self.assertIsInstance(nss["ns"], namespaces.AdapterNamespace)
 
     def test_using_pagetemplate_version(self):
         from zope.pagetemplate import engine
@@ -34,3 +36,99 @@ class TestAdapterNamespaces(unittest.TestCase):
         self.assertIsInstance(
             namespaces.function_namespaces, engine.AdapterNamespaces
         )
+
+
+class TestAdapterNamespace(CleanUp, unittest.TestCase):
+    def _register(self, factory, name="ns"):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.interfaces import IPathAdapter
+
+        component.provideAdapter(factory, (Interface,), IPathAdapter, name)
+
+    def test_caches_factory(self):
+        self._register(lambda ob: (ob,))
+        cache = namespaces.adapter_factories
+        namespace = namespaces.AdapterNamespace("ns")
+        hits, misses = cache.hits, cache.misses
+
+        ob = object()
+        self.assertEqual(namespace(ob), (ob,))
+        self.assertEqual(namespace(ob), (ob,))
+        self.assertEqual(cache.hits - hits, 1)
+        self.assertEqual(cache.misses - misses, 1)
+        self.assertEqual(repr(namespace), "<AdapterNamespace 'ns'>")
+
+    def test_registration_invalidates(self):
+        namespace = namespaces.AdapterNamespace("ns")
+        with self.assertRaises(KeyError):
+            namespace(object())
+
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.interfaces import IPathAdapter
+
+        component.getGlobalSiteManager().registerAdapter(
+            lambda ob: "adapted", (Interface,), IPathAdapter, "ns"
+        )
+        self.assertEqual(namespace(object()), "adapted")
+
+    def test_factory_returns_none(self):
+        self._register(lambda ob: None)
+        with self.assertRaises(KeyError):
+            namespaces.AdapterNamespace("ns")(object())
+
+
+class TestLookup(CleanUp, unittest.TestCase):
+    def setUp(self):
+        super(TestLookup, self).setUp()
+        self.namespaces = namespaces.function_namespaces.namespaces
+        self.saved = dict(self.namespaces)
+
+    def tearDown(self):
+        self.namespaces.clear()
+        self.namespaces.update(self.saved)
+        super(TestLookup, self).tearDown()
+
+    def test_registered_function(self):
+        func = lambda ctx: ctx  # noqa: E731
+        self.namespaces["ns"] = func
+        self.assertIs(namespaces.lookup("ns"), func)
+
+    def test_adapter_namespace(self):
+        self.namespaces.pop("ns", None)
+        namespace = namespaces.lookup("ns")
+        self.assertIsInstance(namespace, namespaces.AdapterNamespace)
+        self.assertIs(namespaces.lookup("ns"), namespace)
+
+        # The registry of the engine is not changed.
+        self.assertNotIn("ns", self.namespaces)
+
+        # Namespaces registered later take precedence.
+        func = lambda ctx: ctx  # noqa: E731
+        self.namespaces["ns"] = func
+        self.assertIs(namespaces.lookup("ns"), func)
+
+    def test_made_up_by_engine(self):
+        self.namespaces.pop("ns", None)
+        uncached = namespaces.function_namespaces["ns"]
+        namespace = namespaces.lookup("ns")
+        self.assertIsNot(namespace, uncached)
+        self.assertIsInstance(namespace, namespaces.AdapterNamespace)
+
+        # The registry of the engine is not changed.
+        self.assertIs(self.namespaces["ns"], uncached)
+
+        # The adapter factory is cached.
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.interfaces import IPathAdapter
+
+        component.provideAdapter(
+            lambda ob: "adapted", (Interface,), IPathAdapter, "ns"
+        )
+        cache = namespaces.adapter_factories
+        hits = cache.hits
+        self.assertEqual(namespace(object()), "adapted")
+        self.assertEqual(namespace(object()), "adapted")
+        self.assertEqual(cache.hits - hits, 1)
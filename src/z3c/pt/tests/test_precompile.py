@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for precompile.py.
+
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from six import StringIO
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt import precompile
+from z3c.pt.cache import TemplateCache
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+here = os.path.dirname(__file__)
+
+
+class TestPrecompile(CleanUp, unittest.TestCase):
+    def setUp(self):
+        CleanUp.setUp(self)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _load(self, factory, filename):
+        def compile(body, builtins):
+            raise AssertionError("Must not compile")
+
+        template = factory(os.path.join(here, filename))
+        template.cache = TemplateCache()
+        template.loader = precompile.cache_loader(self.path)
+        template._compile = compile
+        template.cook_check()
+        return template
+
+    def test_find_templates(self):
+        filenames = list(precompile.find_templates(["z3c.pt.tests"]))
+        self.assertIn(os.path.join(here, "view.pt"), filenames)
+        self.assertEqual(filenames, sorted(filenames))
+        self.assertEqual(
+            list(precompile.find_templates(["z3c.pt.tests.test_precompile"])),
+            filenames,
+        )
+
+    def test_precompile(self):
+        results = precompile.precompile(self.path, ["z3c.pt.tests"], jobs=2)
+        self.assertEqual(
+            len(results),
+            2 * len(list(precompile.find_templates(["z3c.pt.tests"]))),
+        )
+        self.assertEqual([r for r in results if r[3] is not None], [])
+
+        template = self._load(PageTemplateFile, "helloworld.pt")
+        self.assertIn("Hello World!", template())
+        self._load(ViewPageTemplateFile, "view.pt")
+
+        # The cache is versioned.
+        self.assertEqual(os.listdir(self.path), [precompile.cache_version()])
+
+    def test_main(self):
+        out = StringIO()
+        status = precompile.main(
+            [
+                "z3c.pt.tests",
+                "--cache-dir", self.path,
+                "--class", "z3c.pt.pagetemplate.PageTemplateFile",
+                "--jobs", "1",
+                "--verbose",
+            ],
+            stdout=out,
+        )
+        self.assertEqual(status, 0)
+        output = out.getvalue()
+        self.assertIn("helloworld.pt (z3c.pt.pagetemplate.PageTemplateFile)",
+                      output)
+        self.assertIn("(0 failed)", output)
+        self._load(PageTemplateFile, "helloworld.pt")
+
+    def test_main_failed(self):
+        out = StringIO()
+        status = precompile.main(
+            ["z3c.pt.tests", "-d", self.path, "-c", "z3c.pt.Missing"],
+            stdout=out,
+        )
+        self.assertEqual(status, 1)
+        self.assertIn("AttributeError", out.getvalue())
+        self.assertNotIn("ms\n", out.getvalue())
+
+    def test_main_cache_dir_required(self):
+        environ = os.environ.copy()
+        self.addCleanup(os.environ.update, environ)
+        os.environ.pop(precompile.CACHE_ENV, None)
+
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self.assertRaises(SystemExit, precompile.main, ["z3c.pt"],
+                              stdout=StringIO())
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertIn("no cache directory", message)
+
+    def test_environment_loader(self):
+        environ = os.environ.copy()
+        self.addCleanup(os.environ.update, environ)
+        default = object()
+
+        os.environ.pop(precompile.CACHE_ENV, None)
+        self.assertIs(precompile.environment_loader(default), default)
+
+        os.environ[precompile.CACHE_ENV] = self.path
+        loader = precompile.environment_loader(default)
+        self.assertEqual(
+            loader.path,
+            os.path.join(self.path, precompile.cache_version()),
+        )
+
+
+class TestPreload(CleanUp, unittest.TestCase):
+    def test_preload(self):
+        template = ViewPageTemplateFile(os.path.join(here, "view.pt"))
+        missing = PageTemplateFile(os.path.join(here, "missing.pt"))
+        results = precompile.preload(["z3c.pt.tests"], freeze_gc=False)
+
+        self.assertIs(template._cooked, True)
+        self.assertIn(
+            (template.filename, "z3c.pt.pagetemplate.ViewPageTemplateFile"),
+            [result[:2] for result in results if result[3] is None],
+        )
+        errors = [result for result in results if result[3] is not None]
+        self.assertIn(missing.filename, [result[0] for result in errors])
+
+        # The templates created later share the compiled programs.
+        hits = PageTemplateFile.cache.hits
+        PageTemplateFile(os.path.join(here, "helloworld.pt")).cook_check()
+        self.assertEqual(PageTemplateFile.cache.hits, hits + 1)
+
+    def test_warm_lookups(self):
+        from zope.component import provideAdapter
+        from zope.interface import implementedBy
+        from zope.interface import providedBy
+        from zope.traversing.interfaces import IPathAdapter
+
+        from z3c.pt.namespaces import adapter_factories
+
+        class Ob(object):
+            pass
+
+        provideAdapter(lambda ob: ob, (Ob,), IPathAdapter, name="ns")
+        self.assertEqual(precompile.warm_lookups(), 1)
+        self.assertEqual(len(adapter_factories), 1)
+
+        hits = adapter_factories.hits
+        adapter_factories.lookup((providedBy(Ob()),), IPathAdapter, "ns")
+        self.assertEqual(adapter_factories.hits, hits + 1)
+        self.assertIs(providedBy(Ob()), implementedBy(Ob))
+
+    def test_freeze_gc(self):
+        if not hasattr(gc, "freeze"):  # pragma: no cover
+            self.skipTest("gc.freeze requires Python 3.7")
+
+        self.addCleanup(gc.unfreeze)
+        precompile.preload()
+        self.assertGreater(gc.get_freeze_count(), 0)
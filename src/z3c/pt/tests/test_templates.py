@@ -11,8 +11,15 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import gc
 import os
 import unittest
+import weakref
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    asyncio = None
 
 from zope.testing.cleanup import CleanUp
 import zope.configuration.xmlconfig
@@ -53,6 +60,270 @@ class TestPageTemplate(Setup, unittest.TestCase):
         result = template.render(arg=arg)
         self.assertEqual(result, "<div>Not Called</div>")
 
+    def test_runtime_expressions(self):
+        from z3c.pt.expressions import compiled_expressions
+
+        body = (
+            """<p tal:repeat="i python: range(3)" """
+            """tal:content="python: path('a/b') + string('-${i}')" />"""
+        )
+        template = pagetemplate.PageTemplate(body)
+        self.assertIs(
+            template.builtins["tales"], template.builtins["tales"]
+        )
+
+        hits = compiled_expressions.hits
+        misses = compiled_expressions.misses
+        self.assertEqual(
+            template.render(a={"b": "x"}),
+            "<p>x-0</p>\n<p>x-1</p>\n<p>x-2</p>",
+        )
+        self.assertEqual(compiled_expressions.misses - misses, 2)
+        self.assertEqual(compiled_expressions.hits - hits, 4)
+
+        # The compiled expressions are shared by the templates with
+        # the same expression types.
+        pagetemplate.PageTemplate(body).render(a={"b": "x"})
+        self.assertEqual(compiled_expressions.misses - misses, 2)
+        self.assertIsNotNone(compiled_expressions.stats()["ratio"])
+
+        class PageTemplate(pagetemplate.PageTemplate):
+            default_expression = "python"
+
+        PageTemplate(body).render(a={"b": "x"})
+        self.assertEqual(compiled_expressions.misses - misses, 4)
+
+    def test_literal_false(self):
+        class PageTemplate(pagetemplate.PageTemplate):
+            literal_false = False
+
+        body = """<div tal:attributes="title python: False" />"""
+        result = pagetemplate.PageTemplate(body).render()
+        self.assertEqual(result, """<div title="False" />""")
+        result = PageTemplate(body).render()
+        self.assertEqual(result, "<div />")
+
+
+class Domain(object):
+    def __init__(self):
+        self.calls = []
+
+    def translate(self, msgid, mapping=None, context=None,
+                  target_language=None, default=None, *args, **kwargs):
+        self.calls.append(msgid)
+        return u"%s-%s" % (msgid, target_language)
+
+
+class TestTranslations(Setup, unittest.TestCase):
+    def setUp(self):
+        from zope.component import provideUtility
+        from zope.i18n.interfaces import ITranslationDomain
+
+        Setup.setUp(self)
+        self.domain = Domain()
+        provideUtility(self.domain, ITranslationDomain, name="test")
+
+    def _template(self, body):
+        return pagetemplate.PageTemplate(
+            '<div i18n:domain="test">%s</div>' % body
+        )
+
+    def test_memoized_for_request(self):
+        from zope.i18nmessageid import Message
+        from zope.publisher.browser import TestRequest
+
+        template = self._template(
+            '<p tal:repeat="i python: range(3)" tal:content="string:a"'
+            ' i18n:translate="" />'
+            '<p tal:content="message" i18n:translate="" />'
+        )
+        message = Message(u"b", domain="test", mapping={"i": 1})
+        request = TestRequest()
+        expected = (
+            "<div><p>a-en</p>\n<p>a-en</p>\n<p>a-en</p>"
+            "<p>b-en</p></div>"
+        )
+        self.assertEqual(
+            template.render(
+                request=request, target_language="en", message=message
+            ),
+            expected,
+        )
+        self.assertEqual(self.domain.calls, ["a", "b"])
+
+        # Nested templates rendered for the request share the memo.
+        self.assertEqual(
+            template.render(
+                request=request, target_language="en", message=message
+            ),
+            expected,
+        )
+        self.assertEqual(self.domain.calls, ["a", "b", "b"])
+
+        template.render(
+            request=TestRequest(), target_language="en", message=message
+        )
+        self.assertEqual(self.domain.calls.count("a"), 2)
+
+    def test_messages(self):
+        from zope.i18nmessageid import Message
+
+        template = self._template(
+            '<p tal:repeat="msgid msgids" tal:content="msgid"'
+            ' i18n:translate="" />'
+        )
+        self.assertEqual(
+            template.render(target_language="en", msgids=[
+                Message(u"a", domain="test"),
+                Message(u"a", domain="test", default=u"A"),
+                Message(u"a", domain="test", mapping={"x": 1}),
+                Message(u"a", domain="test", mapping={"x": 1}),
+                1,
+            ]),
+            "<div><p>a-en</p>\n<p>a-en</p>\n<p>a-en</p>\n"
+            "<p>a-en</p>\n<p>1-en</p></div>",
+        )
+        self.assertEqual(self.domain.calls, ["a"] * 4 + [1])
+
+    def test_shared(self):
+        from z3c.pt.cache import LookupCache
+
+        class PageTemplate(pagetemplate.PageTemplate):
+            translation_cache = LookupCache(size=100)
+
+        template = PageTemplate(
+            '<p i18n:domain="test" tal:content="string:a" i18n:translate="" />'
+        )
+        self.assertEqual(template.render(target_language="en"),
+                         "<p>a-en</p>")
+        self.assertEqual(template.render(target_language="en"),
+                         "<p>a-en</p>")
+        self.assertEqual(template.render(target_language="de"),
+                         "<p>a-de</p>")
+        self.assertEqual(template.render(), "<p>a</p>")
+        self.assertEqual(self.domain.calls, ["a"] * 2)
+        self.assertEqual(
+            PageTemplate.translation_cache.stats(),
+            {"entries": 2, "hits": 1, "misses": 2},
+        )
+
+
+class TestTemplateCache(Setup, unittest.TestCase):
+    def _makeClass(self):
+        from z3c.pt.cache import TemplateCache
+
+        compiled = []
+
+        class PageTemplate(pagetemplate.PageTemplate):
+            cache = TemplateCache(size=1)
+
+            def _compile(self, body, builtins):
+                compiled.append(body)
+                return super(PageTemplate, self)._compile(body, builtins)
+
+        return PageTemplate, compiled
+
+    def test_shared(self):
+        PageTemplate, compiled = self._makeClass()
+        first = PageTemplate("<p>${options/a}</p>")
+        second = PageTemplate("<p>${options/a}</p>")
+        self.assertEqual(len(compiled), 1)
+        self.assertEqual(first(a=1), "<p>1</p>")
+        self.assertEqual(second(a=2), "<p>2</p>")
+
+        stats = PageTemplate.cache.stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertGreater(stats["compile_time"], 0)
+        self.assertGreater(stats["memory_per_entry"], 0)
+
+    def test_evicted(self):
+        PageTemplate, compiled = self._makeClass()
+        PageTemplate("<p />")
+        PageTemplate("<div />")
+        gc.collect()
+        PageTemplate("<p />")
+        self.assertEqual(len(compiled), 3)
+        gc.collect()
+        self.assertEqual(PageTemplate.cache.stats()["live"], 1)
+
+    def test_evicted_live(self):
+        # An evicted program is shared while a template uses it.
+        PageTemplate, compiled = self._makeClass()
+        first = PageTemplate("<p>${options/a}</p>")
+        PageTemplate("<div />")
+        gc.collect()
+        second = PageTemplate("<p>${options/a}</p>")
+        self.assertEqual(len(compiled), 2)
+        self.assertIs(second._render.__globals__, first._render.__globals__)
+
+    def test_content_addressed(self):
+        # Templates of different classes with the same source and
+        # configuration share a program.
+        from z3c.pt.cache import TemplateCache
+        from z3c.pt.expressions import NocallExpr
+
+        class PageTemplate(pagetemplate.PageTemplate):
+            cache = TemplateCache()
+
+        class Other(PageTemplate):
+            pass
+
+        class Strict(PageTemplate):
+            strict = True
+
+        class Expressions(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types, path=NocallExpr
+            )
+
+        class Compiler(PageTemplate):
+            def _compile(self, body, builtins):
+                return super(Compiler, self)._compile(body, builtins)
+
+        body = "<p>${options/a}</p>"
+        first = PageTemplate(body)
+        second = Other(body)
+        self.assertIs(second._render.__globals__, first._render.__globals__)
+        self.assertEqual(len(PageTemplate.cache), 1)
+
+        for cls in (Strict, Expressions, Compiler):
+            cls(body)
+        self.assertEqual(len(PageTemplate.cache), 4)
+
+    def test_content_addressed_parser_options(self):
+        from chameleon.tokenize import iter_xml
+        from z3c.pt.cache import TemplateCache
+
+        class PageTemplate(pagetemplate.PageTemplate):
+            cache = TemplateCache()
+
+        class Text(PageTemplate):
+            mode = "text"
+
+        class Tokenizer(PageTemplate):
+            tokenizer = staticmethod(iter_xml)
+
+        class LiteralFalse(PageTemplate):
+            literal_false = False
+
+        body = '<p tal:content="options/x">a</p> ${options/x}'
+        self.assertEqual(
+            PageTemplate(body)(x="<b>"), "<p>&lt;b&gt;</p> &lt;b&gt;"
+        )
+        self.assertEqual(
+            Text(body)(x="<b>"), body
+        )
+        for cls in (Tokenizer, LiteralFalse):
+            cls(body)
+        self.assertEqual(len(PageTemplate.cache), 4)
+
+    def test_keep_source(self):
+        PageTemplate, compiled = self._makeClass()
+        template = PageTemplate("<p />", keep_source=True)
+        self.assertIn("def render", template.source)
+        self.assertEqual(len(PageTemplate.cache), 0)
+
 
 class TestPageTemplateFile(Setup, unittest.TestCase):
     def test_nocall(self):
@@ -161,6 +432,468 @@ class TestViewPageTemplateFile(Setup, unittest.TestCase):
         self.assertIn(repr({"context": context}), result)
 
 
+class TestConcurrentProviders(Setup, unittest.TestCase):
+    def setUp(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        super(TestConcurrentProviders, self).setUp()
+        self.executor = ThreadPoolExecutor(2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        super(TestConcurrentProviders, self).tearDown()
+
+    def _provide(self, name, render, threadsafe=True):
+        import threading
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.contentprovider.interfaces import IContentProvider
+        from z3c.pt.interfaces import IThreadSafeContentProvider
+
+        iface = IThreadSafeContentProvider if threadsafe else IContentProvider
+
+        @implementer(iface)
+        class Provider(object):
+            def __init__(self, context, request, view):
+                self.context = context
+
+            def update(self):
+                self.thread = threading.current_thread()
+
+            def render(self):
+                return render(self)
+
+        provideAdapter(
+            Provider, (Interface, Interface, Interface), IContentProvider,
+            name=name,
+        )
+
+    def _render(self, body, executor=None, **kwargs):
+        class View(object):
+            context = request = None
+
+        template = pagetemplate.ViewPageTemplate(body)
+        template.provider_executor = executor
+        return template(View(), **kwargs)
+
+    def test_concurrent(self):
+        import threading
+
+        updated = threading.Event()
+
+        def wait(provider):
+            return u"<a>%s</a>" % updated.wait(5)
+
+        def notify(provider):
+            updated.set()
+            return u"<b />"
+
+        def sequential(provider):
+            return u"<c>%s</c>" % (
+                provider.thread is threading.current_thread()
+            )
+
+        self._provide("a", wait)
+        self._provide("b", notify)
+        self._provide("c", sequential, threadsafe=False)
+
+        result = self._render(
+            '<div><p tal:replace="structure provider:a" />'
+            '<p tal:replace="structure provider:b" />'
+            '<p tal:replace="structure provider:c" /></div>',
+            self.executor,
+        )
+        self.assertEqual(result, "<div><a>True</a><b /><c>True</c></div>")
+
+    def test_without_executor(self):
+        import threading
+
+        self._provide(
+            "a", lambda p: u"%s" % (p.thread is threading.current_thread())
+        )
+        result = self._render('<p tal:content="structure provider:a" />')
+        self.assertEqual(result, "<p>True</p>")
+
+    def test_on_error(self):
+        self._provide("a", lambda p: u"<a />")
+        result = self._render(
+            '<div tal:on-error="structure provider:a">'
+            '<p tal:content="python: 1 / 0" /></div>',
+            self.executor,
+        )
+        self.assertEqual(result, "<div><a /></div>")
+
+    def test_escaped(self):
+        self._provide("a", lambda p: u"<a>&</a>")
+        result = self._render(
+            '<p tal:content="provider:a" title="" '
+            'tal:attributes="title provider:a">x</p>',
+            self.executor,
+        )
+        self.assertEqual(
+            result,
+            '<p title="&lt;a&gt;&amp;&lt;/a&gt;">&lt;a&gt;&amp;&lt;/a&gt;</p>',
+        )
+
+    def test_define(self):
+        self._provide("a", lambda p: u"<a />")
+        result = self._render(
+            '<p tal:define="a provider:a" '
+            'tal:content="structure python: a.upper()" />',
+            self.executor,
+        )
+        self.assertEqual(result, "<p><A /></p>")
+
+    def test_cached_output(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from z3c.pt.interfaces import IContentProviderCacheKey
+
+        rendered = []
+
+        @implementer(IContentProviderCacheKey)
+        class CacheKey(object):
+            key = "key"
+
+            def __init__(self, provider):
+                pass
+
+        provideAdapter(CacheKey, (Interface,), IContentProviderCacheKey)
+        self._provide("a", lambda p: rendered.append(p) or u"<a />")
+
+        for i in range(2):
+            result = self._render(
+                '<p tal:content="structure provider:a" />', self.executor
+            )
+            self.assertEqual(result, "<p><a /></p>")
+        self.assertEqual(len(rendered), 1)
+
+    def test_none(self):
+        self._provide("a", lambda p: None)
+        result = self._render(
+            '<p tal:content="structure provider:a" />', self.executor
+        )
+        self.assertEqual(result, "<p></p>")
+
+    def test_site(self):
+        from zope.component import getGlobalSiteManager
+        from zope.component.hooks import getSite
+        from zope.component.hooks import setSite
+
+        class Site(object):
+            def getSiteManager(self):
+                return getGlobalSiteManager()
+
+        site = Site()
+        self._provide("a", lambda p: u"%s" % (getSite() is site))
+        setSite(site)
+        try:
+            result = self._render(
+                '<p tal:content="structure provider:a" />', self.executor
+            )
+        finally:
+            setSite()
+        self.assertEqual(result, "<p>True</p>")
+
+    def test_provider_error(self):
+        def error(provider):
+            raise ValueError(provider)
+
+        self._provide("a", error)
+        with self.assertRaises(ValueError):
+            self._render(
+                '<p tal:content="structure provider:a" />', self.executor
+            )
+
+    def test_template_error_cancels(self):
+        from concurrent.futures import Future
+
+        class Executor(object):
+            def submit(self, *args):
+                self.future = Future()
+                return self.future
+
+        executor = Executor()
+        self._provide("a", lambda p: u"")
+        with self.assertRaises(ZeroDivisionError):
+            self._render(
+                '<div><p tal:content="structure provider:a" />'
+                '<p tal:content="python: 1 / 0" /></div>',
+                executor,
+            )
+        self.assertTrue(executor.future.cancelled())
+
+    def test_nested(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+
+        self._provide("inner", lambda p: u"inner")
+        self._provide(
+            "outer",
+            lambda p: self._render(
+                '<b tal:content="structure provider:inner" />', executor
+            ),
+        )
+        result = self._render(
+            '<p tal:content="structure provider:outer" />', executor
+        )
+        self.assertEqual(result, "<p><b>inner</b></p>")
+
+
+class TestRenderIter(Setup, unittest.TestCase):
+    body = (
+        '<div><p tal:repeat="i options/items" tal:content="i" />'
+        '</div>'
+    )
+
+    def _makeOne(self, body=None, size=16):
+        template = pagetemplate.PageTemplate(body or self.body)
+        template.stream_chunk_size = size
+        return template
+
+    def test_chunks(self):
+        template = self._makeOne()
+        chunks = list(template.bind(None).stream(items=range(10)))
+        self.assertEqual(u"".join(chunks), template(items=range(10)))
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 16)
+
+    def test_content_type_set_first(self):
+        class Response(object):
+            def __init__(self):
+                self.headers = {}
+
+            def getHeader(self, name):
+                return self.headers.get(name)
+
+            def setHeader(self, name, value):
+                self.headers[name] = value
+
+        class Request(object):
+            response = Response()
+
+        request = Request()
+        template = self._makeOne()
+        chunks = template.render_iter(request=request, options={"items": ()})
+        self.assertEqual(
+            request.response.headers, {"Content-Type": "text/html"}
+        )
+        self.assertEqual(list(chunks), [u"<div></div>"])
+
+    def test_view(self):
+        class View(object):
+            context = request = None
+            items = (1, 2)
+
+        template = pagetemplate.ViewPageTemplate(
+            '<p tal:repeat="i view/items" tal:content="i" />'
+        )
+        chunks = template.bind(View()).stream()
+        self.assertEqual(u"".join(chunks), u"<p>1</p>\n<p>2</p>")
+
+    def test_error(self):
+        from zope.location.interfaces import LocationError
+
+        template = self._makeOne('<p tal:content="options/missing" />')
+        with self.assertRaises(LocationError):
+            list(template.bind(None).stream())
+
+    def test_close(self):
+        rendered = []
+        template = self._makeOne(
+            '<p tal:repeat="i options/items"'
+            '   tal:content="python: options[\'render\'](i)" />'
+        )
+        chunks = template.bind(None).stream(
+            items=range(100000), render=rendered.append
+        )
+        next(chunks)
+        chunks.close()
+        self.assertLess(len(rendered), 100)
+
+    def test_on_error(self):
+        body = (
+            '<div tal:on-error="string:error">'
+            '<p tal:repeat="i options/items" tal:content="i" />'
+            '<p tal:content="options/missing" /></div>'
+        )
+        template = self._makeOne(body, size=1000)
+        self.assertEqual(
+            u"".join(template.bind(None).stream(items=range(3))),
+            u"<div>error</div>",
+        )
+
+        # output which has been streamed cannot be retracted
+        template = self._makeOne(body)
+        with self.assertRaises(RuntimeError):
+            list(template.bind(None).stream(items=range(10)))
+
+    def test_nested_template(self):
+        inner = pagetemplate.PageTemplate('<b>inner</b>')
+        template = self._makeOne(
+            '<p tal:content="structure python: options[\'inner\']()" />'
+        )
+        chunks = template.bind(None).stream(inner=inner)
+        self.assertEqual(list(chunks), [u"<p><b>inner</b></p>"])
+
+
+@unittest.skipIf(asyncio is None, "requires asyncio")
+class TestRenderAsync(Setup, unittest.TestCase):
+    def setUp(self):
+        super(TestRenderAsync, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        shutdown = getattr(self.loop, "shutdown_default_executor", None)
+        if shutdown is not None:
+            self.loop.run_until_complete(shutdown())
+        self.loop.close()
+        super(TestRenderAsync, self).tearDown()
+
+    def _run(self, func):
+        # Call ``func`` from the running event loop (as a coroutine
+        # would) and wait for the awaitable which it returns.
+        called = self.loop.create_future()
+        self.loop.call_soon(lambda: called.set_result(func()))
+        return self.loop.run_until_complete(
+            self.loop.run_until_complete(called)
+        )
+
+    def _render(self, body, **kwargs):
+        template = pagetemplate.PageTemplate(body)
+        return self._run(lambda: template.bind(None).render_async(**kwargs))
+
+    def test_path(self):
+        def value():
+            return asyncio.sleep(0.01, result=u"awaited")
+
+        result = self._render('<p tal:content="options/value" />', value=value)
+        self.assertEqual(result, u"<p>awaited</p>")
+
+    def test_python(self):
+        def value():
+            future = self.loop.create_future()
+            self.loop.call_soon(future.set_result, 42)
+            return future
+
+        result = self._render(
+            '<p tal:content="python: options[\'value\']()" />', value=value
+        )
+        self.assertEqual(result, u"<p>42</p>")
+
+    def test_nocall(self):
+        future = asyncio.Future(loop=self.loop)
+        result = self._render(
+            '<p tal:define="f nocall:options/f"'
+            '   tal:content="python: f is options[\'f\']" />',
+            f=future,
+        )
+        self.assertEqual(result, u"<p>True</p>")
+
+    def test_provider(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.contentprovider.interfaces import IContentProvider
+
+        @implementer(IContentProvider)
+        class Provider(object):
+            def __init__(self, *args):
+                pass
+
+            def update(self):
+                self.updated = asyncio.sleep(0, result=True)
+                return self.updated
+
+            def render(self):
+                return asyncio.sleep(0, result=u"rendered")
+
+        provideAdapter(
+            Provider, (Interface, Interface, Interface), IContentProvider,
+            name="async",
+        )
+        result = self._render('<p tal:content="structure provider:async" />')
+        self.assertEqual(result, u"<p>rendered</p>")
+
+    def test_error(self):
+        future = self.loop.create_future()
+        future.set_exception(ValueError())
+        with self.assertRaises(ValueError):
+            self._render('<p tal:content="options/value" />', value=future)
+
+    def test_cancelled(self):
+        from concurrent.futures import CancelledError
+
+        future = self.loop.create_future()
+        future.cancel()
+        with self.assertRaises(CancelledError):
+            self._render('<p tal:content="options/value" />', value=future)
+
+    def test_not_awaitable(self):
+        class Value(object):
+            __await__ = None
+
+            def __init__(self):
+                self.__await__ = True
+
+        with self.assertRaises(TypeError):
+            self._render('<p tal:content="options/value" />', value=Value())
+
+    def test_loop_not_blocked(self):
+        event = asyncio.Event()
+
+        def wait():
+            return asyncio.wait_for(event.wait(), 5)
+
+        def notify():
+            event.set()
+            return asyncio.sleep(0, result=u"set")
+
+        template = pagetemplate.PageTemplate(
+            '<p tal:content="options/value" />'
+        )
+        results = self._run(
+            lambda: asyncio.gather(
+                template.bind(None).render_async(value=wait),
+                template.bind(None).render_async(value=notify),
+            )
+        )
+        self.assertEqual(results, [u"<p>True</p>", u"<p>set</p>"])
+
+    @unittest.skipIf(
+        not hasattr(asyncio, "get_running_loop"), "requires Python 3.7"
+    )
+    def test_not_running(self):
+        template = pagetemplate.PageTemplate("<p />")
+        with self.assertRaises(RuntimeError):
+            template.bind(None).render_async()
+
+
+class TestOutputStream(unittest.TestCase):
+    def test_retract(self):
+        written = []
+        stream = pagetemplate.OutputStream(written.append, 4)
+        stream.append(u"ab")
+        fallback = len(stream)
+        stream.append(u"c")
+        del stream[fallback:]
+        self.assertEqual(stream.buffered, 2)
+        stream.append(u"cd")
+        self.assertEqual(written, [u"abcd"])
+        self.assertEqual(len(stream), 2)
+        self.assertEqual(list(stream), [])
+
+        with self.assertRaises(RuntimeError):
+            del stream[0:]
+
+
 class TestOpaqueDict(unittest.TestCase):
     def test_getitem(self):
         import operator
@@ -210,6 +943,40 @@ class TestBaseTemplate(unittest.TestCase):
         finally:
             pagetemplate.i18n = orig_i18n
 
+    def test_negotiated_once(self):
+        from zope.publisher.browser import TestRequest
+
+        class I18N(object):
+            calls = 0
+
+            def negotiate(self, request):
+                self.calls += 1
+                return "de"
+
+        i18n = I18N()
+        self.addCleanup(setattr, pagetemplate, "i18n", pagetemplate.i18n)
+        pagetemplate.i18n = i18n
+        negotiator = pagetemplate.LanguageNegotiator()
+        template = pagetemplate.BaseTemplate("<p>${target_language}</p>")
+        template.negotiator = negotiator
+
+        request = TestRequest()
+        for i in range(3):
+            self.assertEqual(template.render(request=request), "<p>de</p>")
+        self.assertEqual(
+            template.render(request=request, target_language="en"),
+            "<p>en</p>",
+        )
+        self.assertEqual(i18n.calls, 1)
+
+        template.render(request=TestRequest())
+        template.render(request=None)
+        self.assertEqual(i18n.calls, 3)
+
+        stats = negotiator.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 3))
+        self.assertGreaterEqual(stats["time"], 0)
+
     def test_translate_mv(self):
         template = pagetemplate.BaseTemplate(
             """
@@ -264,6 +1031,14 @@ class TestBoundPageTemplate(unittest.TestCase):
             repr(bound),
         )
 
+    def test_stream(self):
+        class Template(object):
+            def render_iter(self, **kw):
+                return iter([kw])
+
+        bound = pagetemplate.BoundPageTemplate(Template(), None, dict)
+        self.assertEqual(list(bound.stream(1, a=2)), [{"args": (1,), "a": 2}])
+
     def test_attributes(self):
         func = object()
         bound = pagetemplate.BoundPageTemplate(self, func)
@@ -271,3 +1046,79 @@ class TestBoundPageTemplate(unittest.TestCase):
         self.assertIs(self, bound.__self__)
         self.assertIs(func, bound.im_func)
         self.assertIs(func, bound.__func__)
+
+    def test_call_render(self):
+        bound = pagetemplate.BoundPageTemplate(None, dict)
+        self.assertEqual(bound(1, a=2), {"args": (1,), "a": 2})
+
+    def test_call_without_instance(self):
+        class Template(object):
+            def _pt_get_context(self, ob, request, kw):
+                return {"ob": ob, "request": request, "options": kw}
+
+            def render(self, **context):
+                return context
+
+        pt = Template()
+        bound = pagetemplate.BoundPageTemplate(pt, ob=self, request="r")
+        self.assertEqual(bound.__func__(a=1), {
+            "ob": self, "request": "r", "options": {"a": 1},
+        })
+        self.assertEqual(bound(request=None)["request"], None)
+
+
+class TestCachedBinding(CleanUp, unittest.TestCase):
+    def _view_class(self):
+        class View(object):
+            template = pagetemplate.PageTemplate(
+                "<p>${context/title}</p>"
+            )
+            template.cache_bound = True
+
+        return View
+
+    def test_cached(self):
+        View = self._view_class()
+        view = View()
+        view.title = "Title"
+        bound = view.template
+        self.assertIs(view.template, bound)
+        self.assertEqual(bound(), "<p>Title</p>")
+
+        other = View()
+        self.assertIsNot(other.template, bound)
+        self.assertEqual(len(View.template._v_bindings), 2)
+
+    def test_released(self):
+        View = self._view_class()
+        view = View()
+        bound = view.template
+        del view
+        gc.collect()
+        self.assertEqual(View.template._v_bindings, {})
+        self.assertRaises(ReferenceError, bound)
+
+    def test_replaced(self):
+        # A binding which has replaced the one of a released instance
+        # is kept.
+        View = self._view_class()
+        view = View()
+        bound = view.template
+        bindings = View.template._v_bindings
+        other = bindings[id(view)] = pagetemplate.BoundPageTemplate(
+            View.template, ref=weakref.ref(view)
+        )
+        del view
+        gc.collect()
+        self.assertEqual(list(bindings.values()), [other])
+        self.assertRaises(ReferenceError, bound)
+
+    def test_not_weakly_referenceable(self):
+        class View(object):
+            __slots__ = ()
+            template = pagetemplate.PageTemplate("<p />")
+            template.cache_bound = True
+
+        view = View()
+        self.assertIsNot(view.template, view.template)
+        self.assertEqual(view.template(), "<p />")
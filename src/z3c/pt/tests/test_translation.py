@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for translation.py.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from zope.component import provideUtility
+from zope.i18n.interfaces import ITranslationDomain
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt import pagetemplate
+
+
+class Domain(object):
+    def __init__(self):
+        self.calls = []
+
+    def translate(self, msgid, mapping=None, context=None,
+                  target_language=None, default=None, *args, **kwargs):
+        self.calls.append(msgid)
+        return u"%s (%s)" % (default or msgid, target_language)
+
+
+class PageTemplate(pagetemplate.PageTemplate):
+    translate_static = True
+
+
+class TestStaticTranslation(CleanUp, unittest.TestCase):
+    def setUp(self):
+        CleanUp.setUp(self)
+        self.domain = Domain()
+        provideUtility(self.domain, ITranslationDomain, name="test")
+
+    def test_variants(self):
+        template = PageTemplate(
+            '<div i18n:domain="test">'
+            '<p i18n:translate="">Hello\n  world</p>'
+            '<p i18n:translate="label">Hello</p>'
+            '<p i18n:translate=""> </p>'
+            '<input value="Save" title="Save &amp; close"'
+            ' i18n:attributes="value; title label_close" />'
+            '<p tal:content="string:dynamic" i18n:translate="" />'
+            '</div>'
+        )
+        expected = (
+            '<div><p>Hello world (%(lang)s)</p><p>Hello (%(lang)s)</p>'
+            '<p></p><input value="Save (%(lang)s)"'
+            ' title="Save &amp; close (%(lang)s)" />'
+            '<p>dynamic (%(lang)s)</p></div>'
+        )
+        for i in range(2):
+            self.assertEqual(template.render(target_language="de"),
+                             expected % {"lang": "de"})
+        self.assertEqual(
+            self.domain.calls,
+            [
+                "Hello world", "label", "Save", "label_close",
+                "dynamic", "dynamic",
+            ],
+        )
+
+        del self.domain.calls[:]
+        self.assertEqual(template.render(target_language="fr"),
+                         expected % {"lang": "fr"})
+        self.assertEqual(len(self.domain.calls), 5)
+
+        # Without a target language, messages are translated at
+        # render time.
+        self.assertIs(template._pt_variant(None), template)
+        self.assertEqual(sorted(template._v_variants), ["de", "fr"])
+
+    def test_shared(self):
+        body = '<p i18n:domain="test" i18n:translate="">Shared</p>'
+        PageTemplate(body).render(target_language="de")
+        PageTemplate(body).render(target_language="de")
+        self.assertEqual(self.domain.calls, ["Shared"])
+
+    def test_no_domain(self):
+        template = PageTemplate(
+            '<p i18n:translate="">Hello</p>'
+            '<input value="Save" i18n:attributes="value" />'
+            '<div i18n:domain="test"><p metal:define-macro="m">'
+            '<span i18n:translate="">Macro</span>'
+            '<span i18n:domain="test" i18n:translate="">Domain</span>'
+            '</p></div>'
+        )
+        template.render(target_language="de")
+
+        # A macro is rendered in the domain of the template which
+        # uses it, unless it sets one.
+        self.assertEqual(self.domain.calls, ["Domain"])
+
+    def test_dynamic_content(self):
+        template = PageTemplate(
+            '<div i18n:domain="test"><p i18n:translate="">Hello'
+            ' <b>${name}</b></p><input tal:attributes="value name"'
+            ' i18n:attributes="value" /></div>'
+        )
+        self.assertIn(
+            '<input value="x (de)" />',
+            template.render(target_language="de", name="x"),
+        )
+        self.assertNotIn("Hello", self.domain.calls)
+        self.assertIn("x", self.domain.calls)
+
+    def test_reload(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        filename = os.path.join(path, "a.pt")
+
+        def write(body, mtime):
+            with open(filename, "w") as f:
+                f.write(
+                    '<p i18n:domain="test" i18n:translate="">%s</p>' % body
+                )
+            os.utime(filename, (mtime, mtime))
+
+        class PageTemplateFile(pagetemplate.PageTemplateFile):
+            translate_static = True
+            auto_reload = True
+
+        write("Hello", 1000000000)
+        template = PageTemplateFile(filename)
+        self.assertEqual(template.render(target_language="de"),
+                         "<p>Hello (de)</p>")
+        write("Goodbye", 1000000001)
+        self.assertEqual(template.render(target_language="de"),
+                         "<p>Goodbye (de)</p>")
+
+    def test_enabled_after_cooking(self):
+        template = pagetemplate.PageTemplate(
+            '<p i18n:domain="test" i18n:translate="">Hello</p>'
+        )
+        template.translate_static = True
+        self.assertIs(template._pt_variant("de"), template)
+
+    def test_render_iter(self):
+        template = PageTemplate(
+            '<p i18n:domain="test" i18n:translate="">Hello</p>'
+        )
+        self.assertEqual(
+            "".join(template.render_iter(target_language="de")),
+            "<p>Hello (de)</p>",
+        )
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for usage.py.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt import usage
+from z3c.pt.pagetemplate import BaseTemplate
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+here = os.path.dirname(__file__)
+
+
+class UsageTests(CleanUp):
+    def setUp(self):
+        CleanUp.setUp(self)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.manifest = os.path.join(self.path, "templates.txt")
+
+
+class TestUsageRecorder(UsageTests, unittest.TestCase):
+    def test_record(self):
+        self.addCleanup(usage.disable)
+        recorder = usage.enable(self.manifest)
+        self.assertIs(BaseTemplate.usage_recorder, recorder)
+
+        hello = PageTemplateFile(os.path.join(here, "helloworld.pt"))
+        for i in range(3):
+            hello()
+        "".join(hello.render_iter())
+        PageTemplate("<p />")()
+        self.assertFalse(os.path.exists(self.manifest))
+
+        usage.disable()
+        self.assertIsNone(BaseTemplate.usage_recorder)
+        self.assertEqual(
+            usage.read_manifest(self.manifest),
+            [(4, "z3c.pt.pagetemplate.PageTemplateFile", hello.filename)],
+        )
+        usage.disable()
+
+    def test_save(self):
+        recorder = usage.UsageRecorder(self.manifest, interval=0)
+        hello = os.path.join(here, "helloworld.pt")
+        view = os.path.join(here, "view.pt")
+        usage.write_manifest(self.manifest, [
+            (2, "z3c.pt.pagetemplate.ViewPageTemplateFile", view),
+            (1, "z3c.pt.pagetemplate.PageTemplateFile", hello),
+        ])
+
+        threads = []
+        for i in range(2):
+            recorder.record(PageTemplateFile(hello))
+            threads.append(recorder.thread)
+        for thread in threads:
+            self.assertEqual(thread.name, "z3c.pt.usage")
+            thread.join()
+        self.assertEqual(recorder.counts, {})
+        self.assertEqual(usage.read_manifest(self.manifest), [
+            (3, "z3c.pt.pagetemplate.PageTemplateFile", hello),
+            (2, "z3c.pt.pagetemplate.ViewPageTemplateFile", view),
+        ])
+        recorder.save()
+        self.assertEqual(len(usage.read_manifest(self.manifest)), 2)
+        self.assertEqual(
+            sorted(os.listdir(self.path)),
+            ["templates.txt", "templates.txt.lock"],
+        )
+
+    def test_concurrent_saves(self):
+        import threading
+
+        hello = PageTemplateFile(os.path.join(here, "helloworld.pt"))
+        recorders = [usage.UsageRecorder(self.manifest) for i in range(8)]
+        for recorder in recorders:
+            recorder.record(hello)
+
+        threads = [
+            threading.Thread(target=recorder.save) for recorder in recorders
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            usage.read_manifest(self.manifest),
+            [(8, "z3c.pt.pagetemplate.PageTemplateFile", hello.filename)],
+        )
+
+    def test_save_at_exit(self):
+        import atexit
+
+        registered = []
+        self.addCleanup(setattr, atexit, "register", atexit.register)
+        atexit.register = registered.append
+
+        self.addCleanup(usage.disable)
+        for i in range(2):
+            recorder = usage.enable(self.manifest)
+        self.assertEqual(registered, [])
+
+        recorder.record(PageTemplateFile(os.path.join(here, "helloworld.pt")))
+        usage.save()
+        self.assertEqual(len(usage.read_manifest(self.manifest)), 1)
+
+        usage.disable()
+        usage.save()
+
+    def test_missing_manifest(self):
+        self.assertEqual(usage.read_manifest(self.manifest), [])
+
+    def test_environment_recorder(self):
+        environ = os.environ.copy()
+        self.addCleanup(os.environ.update, environ)
+
+        os.environ.pop(usage.USAGE_ENV, None)
+        self.assertIsNone(usage.environment_recorder())
+
+        os.environ[usage.USAGE_ENV] = self.manifest
+        recorder = usage.environment_recorder()
+        self.assertEqual(recorder.filename, self.manifest)
+
+
+class TestWarmUp(UsageTests, unittest.TestCase):
+    def setUp(self):
+        UsageTests.setUp(self)
+        self.view = os.path.join(here, "view.pt")
+        usage.write_manifest(self.manifest, [
+            (3, "z3c.pt.pagetemplate.ViewPageTemplateFile", self.view),
+            (2, "z3c.pt.pagetemplate.PageTemplateFile",
+             os.path.join(here, "missing.pt")),
+            (1, "z3c.pt.pagetemplate.PageTemplateFile",
+             os.path.join(here, "helloworld.pt")),
+        ])
+
+    def test_foreground(self):
+        results = usage.warm_up(self.manifest, top=2, background=False)
+        self.assertEqual(
+            [result[0] for result in results],
+            [self.view, os.path.join(here, "missing.pt")],
+        )
+        self.assertIsNone(results[0][3])
+        self.assertIsNotNone(results[1][3])
+
+        hits = ViewPageTemplateFile.cache.hits
+        ViewPageTemplateFile(self.view).cook_check()
+        self.assertEqual(ViewPageTemplateFile.cache.hits, hits + 1)
+
+    def test_background(self):
+        thread = usage.warm_up(self.manifest)
+        self.assertEqual(thread.name, "z3c.pt.warm_up")
+        thread.join()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for watcher.py.
+
+"""
+import gc
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt import watcher
+from z3c.pt.pagetemplate import BaseTemplateFile
+from z3c.pt.pagetemplate import PageTemplateFile
+
+
+class WatcherTests(CleanUp):
+    backend = "poll"
+    interval = 60
+
+    def setUp(self):
+        CleanUp.setUp(self)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.watcher = watcher.make_watcher(self.interval, self.backend)
+        self.addCleanup(self.watcher.stop)
+
+    def _write(self, name, body, mtime=None):
+        filename = os.path.join(self.path, name)
+        with open(filename, "w") as f:
+            f.write(body)
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+        return filename
+
+    def _template(self, name, body):
+        template = PageTemplateFile(self._write(name, body, 1000000000))
+        template.watcher = self.watcher
+        return template
+
+    def _wait(self, condition):
+        deadline = time.time() + 10
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+
+class TestWatcher(WatcherTests, unittest.TestCase):
+    def test_reload(self):
+        template = self._template("a.pt", "<p>a</p>")
+        other = self._template("b.pt", "<p>b</p>")
+        self.assertEqual(template(), "<p>a</p>")
+        self.assertEqual(other(), "<p>b</p>")
+        self.assertEqual(self.watcher.check(), [])
+
+        self._write("a.pt", "<p>changed</p>", 1000000001)
+        self.assertEqual(self.watcher.check(), [template.filename])
+        self.assertIs(template._cooked, False)
+        self.assertIs(other._cooked, True)
+        self.assertEqual(template(), "<p>changed</p>")
+        self.assertEqual(self.watcher.check(), [])
+
+    def test_no_stat_on_render(self):
+        template = self._template("a.pt", "<p>a</p>")
+        template()
+
+        def mtime():
+            raise AssertionError("Must not check the file")
+
+        template.mtime = mtime
+        template.auto_reload = True
+        self.assertEqual(template(), "<p>a</p>")
+
+    def test_macro_users(self):
+        layout = self._template(
+            "layout.pt", '<p metal:define-macro="main">layout</p>'
+        )
+        page = self._template(
+            "page.pt",
+            "<div metal:use-macro=\"python: options['layout'].macros['main']\""
+            " />",
+        )
+        self.assertEqual(page(layout=layout), "<p>layout</p>")
+
+        self._write(
+            "layout.pt", '<p metal:define-macro="main">changed</p>',
+            1000000001,
+        )
+        self.watcher.check()
+        self.assertIs(page._cooked, True)
+        self.assertEqual(page(layout=layout), "<p>changed</p>")
+
+    def test_released_templates(self):
+        template = self._template("a.pt", "<p>a</p>")
+        template()
+        filename = template.filename
+        self.assertIn(filename, self.watcher.files)
+
+        del template
+        gc.collect()
+        self._write("a.pt", "<p>changed</p>", 1000000001)
+        self.assertEqual(self.watcher.check(), [])
+        self.assertNotIn(filename, self.watcher.files)
+        self.assertEqual(self.watcher.check([filename]), [])
+
+    def test_removed(self):
+        template = self._template("a.pt", "<p>a</p>")
+        template()
+        os.remove(template.filename)
+        self.assertEqual(self.watcher.check(), [template.filename])
+
+    def test_thread(self):
+        self.watcher.interval = 0.01
+        template = self._template("a.pt", "<p>a</p>")
+        template()
+        self.assertEqual(self.watcher.thread.name, "z3c.pt.watcher")
+        self._write("a.pt", "<p>changed</p>", 1000000001)
+        self._wait(lambda: template._cooked is False)
+
+        self.watcher.stop()
+        self.assertFalse(self.watcher.thread.is_alive())
+
+
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    backend = "inotify"
+    interval = 0.01
+
+    def test_reload(self):
+        template = self._template("a.pt", "<p>a</p>")
+        other = self._template("b.pt", "<p>b</p>")
+        template()
+        other()
+        self.assertEqual(list(self.watcher.directories.values()), [self.path])
+
+        self._write("a.pt", "<p>changed</p>")
+        self._wait(lambda: template._cooked is False)
+        self.assertEqual(template(), "<p>changed</p>")
+        self.assertIs(other._cooked, True)
+
+    def test_unwatchable_directory(self):
+        filename = os.path.join(self.path, "missing", "a.pt")
+        self.watcher.add(filename)
+        self.assertEqual(self.watcher.directories, {})
+        self.assertEqual(self.watcher.wait(), set([filename]))
+
+
+class TestMakeWatcher(CleanUp, unittest.TestCase):
+    def _unavailable(self):
+        def libc():
+            raise AttributeError("inotify_init1")
+
+        self.addCleanup(setattr, watcher, "_libc", watcher._libc)
+        watcher._libc = libc
+
+    def test_inotify_error(self):
+        class libc(object):
+            def inotify_init1(self, flags):
+                return -1
+
+        self.addCleanup(setattr, watcher, "_libc", watcher._libc)
+        watcher._libc = libc
+        self.assertIs(type(watcher.make_watcher()), watcher.Watcher)
+        self.assertRaises(OSError, watcher.make_watcher, backend="inotify")
+
+    def test_poll(self):
+        poll = watcher.make_watcher(backend="poll")
+        self.assertIs(type(poll), watcher.Watcher)
+
+    def test_inotify_unavailable(self):
+        self._unavailable()
+        self.assertIs(type(watcher.make_watcher()), watcher.Watcher)
+        self.assertRaises(AttributeError, watcher.make_watcher,
+                          backend="inotify")
+
+    def test_enable(self):
+        self.addCleanup(watcher.disable)
+        first = watcher.enable(backend="poll")
+        self.assertIs(BaseTemplateFile.watcher, first)
+        PageTemplateFile("view.pt").cook_check()
+        second = watcher.enable(0.5)
+        self.assertIs(BaseTemplateFile.watcher, second)
+        self.assertEqual(second.interval, 0.5)
+        self.assertFalse(first.thread.is_alive())
+
+        watcher.disable()
+        self.assertIsNone(BaseTemplateFile.watcher)
+        watcher.disable()
+
+    def test_environment_watcher(self):
+        environ = os.environ.copy()
+        self.addCleanup(os.environ.update, environ)
+
+        os.environ.pop(watcher.WATCH_ENV, None)
+        self.assertIsNone(watcher.environment_watcher())
+
+        os.environ[watcher.WATCH_ENV] = "0.5"
+        environment_watcher = watcher.environment_watcher()
+        self.addCleanup(environment_watcher.stop)
+        self.assertEqual(environment_watcher.interval, 0.5)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for zcml.py.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+from zope.configuration import xmlconfig
+from zope.configuration.exceptions import ConfigurationError
+from zope.testing.cleanup import CleanUp
+from zope.testing.loggingsupport import InstalledHandler
+
+from z3c.pt import precompile
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.zcml import compile_templates
+
+here = os.path.dirname(__file__)
+
+CONFIGURE = """
+<configure
+    xmlns="http://namespaces.zope.org/zope"
+    xmlns:z3c="http://namespaces.zope.org/z3c">
+  <include package="z3c.pt" file="meta.zcml" />
+  %s
+</configure>
+"""
+
+
+class TestPrecompileDirective(CleanUp, unittest.TestCase):
+    def setUp(self):
+        CleanUp.setUp(self)
+        self.log = InstalledHandler("z3c.pt.zcml")
+        self.addCleanup(self.log.uninstall)
+
+        environ = os.environ.copy()
+        self.addCleanup(os.environ.update, environ)
+        os.environ.pop(precompile.CACHE_ENV, None)
+
+    def _configure(self, directive):
+        xmlconfig.string(CONFIGURE % directive)
+        return [record.getMessage() for record in self.log.records]
+
+    def test_precompile(self):
+        messages = self._configure(
+            '<z3c:precompile package="z3c.pt.tests" pattern="**/hello*.pt"'
+            ' classes="z3c.pt.pagetemplate.PageTemplateFile" />'
+        )
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith(
+            "Compiled %s (z3c.pt.pagetemplate.PageTemplateFile) in"
+            % os.path.join(here, "helloworld.pt")
+        ))
+        self.assertTrue(messages[1].startswith(
+            "Compiled 1 templates of z3c.pt.tests (0 failed) in"
+        ))
+
+        # The templates created later share the compiled program.
+        hits = PageTemplateFile.cache.hits
+        PageTemplateFile(os.path.join(here, "helloworld.pt")).cook_check()
+        self.assertEqual(PageTemplateFile.cache.hits, hits + 1)
+
+    def test_failed(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with open(os.path.join(path, "broken.pt"), "w") as f:
+            f.write('<p tal:unknown="x" />')
+
+        results = self._compile(path)
+        self.assertEqual(len(results), 2)
+        self.assertIn("Can't compile", self.log.records[0].getMessage())
+        self.assertEqual(self.log.records[0].levelname, "WARNING")
+        self.assertIn("(2 failed)", self.log.records[-1].getMessage())
+
+    def _compile(self, path):
+        module = types.ModuleType("z3c_pt_test_templates")
+        module.__file__ = os.path.join(path, "__init__.py")
+        sys.modules[module.__name__] = module
+        self.addCleanup(sys.modules.pop, module.__name__)
+        return compile_templates(
+            module.__name__, "*.pt", precompile.TEMPLATE_CLASSES, 1
+        )
+
+    def test_jobs(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        os.environ[precompile.CACHE_ENV] = path
+
+        messages = self._configure(
+            '<z3c:precompile package="z3c.pt.tests" pattern="hello*.pt"'
+            ' jobs="2" />'
+        )
+        self.assertIn("Compiled 2 templates", messages[-1])
+        # The template classes share the program.
+        filenames = os.listdir(os.path.join(path, precompile.cache_version()))
+        self.assertEqual(
+            len([name for name in filenames if name.endswith(".py")]), 1
+        )
+
+    def test_jobs_require_cache(self):
+        self.assertRaises(
+            ConfigurationError, self._configure,
+            '<z3c:precompile package="z3c.pt.tests" jobs="2" />',
+        )
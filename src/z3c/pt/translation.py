@@ -0,0 +1,123 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compile-time translation of static messages.
+
+A template with ``translate_static`` set is compiled into a variant
+for each target language it is rendered for. In a variant, the
+messages which are known when the template is compiled are translated
+by the compiler and written out as text:
+
+- the content of ``i18n:translate`` elements which contain only text,
+- the values of static attributes listed in ``i18n:attributes``,
+
+if the domain is set with ``i18n:domain`` in the template (inside the
+macro, for a macro). Other messages are translated at render time.
+"""
+import ast
+import re
+
+import six
+
+from chameleon.astutil import Static
+from chameleon.codegen import template
+from chameleon.nodes import Sequence
+from chameleon.nodes import Text
+from chameleon.nodes import Translate
+
+from z3c.pt import fragments
+
+_whitespace = re.compile(r"\s+")
+
+
+def static_text(node):
+    """Return the text of a node which contains only text, else
+    ``None``."""
+
+    if isinstance(node, Text):
+        return node.value
+    if isinstance(node, Sequence):
+        parts = [static_text(item) for item in node.items]
+        if None not in parts:
+            return u"".join(parts)
+    return None
+
+
+def static_string(node):
+    """Return the string of a constant expression node, else
+    ``None``."""
+
+    if isinstance(node, ast.Str) and isinstance(node.s, six.string_types):
+        return node.s
+    return None
+
+
+class Compiler(fragments.Compiler):
+    """Compiler which translates static messages into
+    ``target_language`` with ``translate``, a function with the
+    signature of ``chameleon.i18n.fast_translate``."""
+
+    def __init__(self, *args, **kwargs):
+        self.target_language = kwargs.pop("target_language")
+        self.translate_message = kwargs.pop("translate")
+        self._domains = []
+        super(Compiler, self).__init__(*args, **kwargs)
+
+    def _translate(self, msgid, default):
+        return six.text_type(self.translate_message(
+            msgid, self._domains[-1], None, None, self.target_language,
+            default,
+        ))
+
+    def visit_Macro(self, node):
+        # The domain of a macro is that of the template which uses
+        # it, unless the macro sets one.
+        domains, self._domains = self._domains, []
+        try:
+            return list(super(Compiler, self).visit_Macro(node))
+        finally:
+            self._domains = domains
+
+    def visit_Domain(self, node):
+        self._domains.append(node.name)
+        try:
+            return super(Compiler, self).visit_Domain(node)
+        finally:
+            self._domains.pop()
+
+    def visit_Translate(self, node):
+        text = static_text(node.node) if self._domains else None
+        if text is None:
+            return super(Compiler, self).visit_Translate(node)
+
+        default = _whitespace.sub(u" ", text).strip()
+        msgid = node.msgid or default
+        if not msgid:
+            return []
+
+        return template(
+            "__append(s)", s=ast.Str(s=self._translate(msgid, default))
+        )
+
+    def visit_Attribute(self, node):
+        expression = node.expression
+        if self._domains and isinstance(expression, Translate):
+            default = static_string(expression.node)
+            if default is not None:
+                value = self._translate(expression.msgid or default, default)
+                node = type(node)(*[
+                    Static(ast.Str(s=value))
+                    if field == "expression" else getattr(node, field)
+                    for field in node._fields
+                ])
+        return super(Compiler, self).visit_Attribute(node)
@@ -0,0 +1,238 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Recording which templates are rendered, to compile them first.
+
+When a recorder is enabled, the renders of each template file are
+counted and written to a manifest every ``interval`` seconds (and
+when the recorder is disabled or the process exits)::
+
+  >>> from z3c.pt import usage
+  >>> usage.enable("/var/lib/app/templates.txt")  # doctest: +SKIP
+
+The recorder can also be enabled by setting the ``Z3C_PT_USAGE``
+environment variable to the path of the manifest. On startup, the
+templates rendered most often can then be compiled in the
+background, in that order::
+
+  >>> usage.warm_up("/var/lib/app/templates.txt", top=300)  # doctest: +SKIP
+
+The manifest has a line for each template, with the number of
+renders, the dotted name of the template class and the filename
+separated by tabs, the templates rendered most often first. Several
+processes may record into the same manifest: the counts are added to
+those in the file when it is written, while holding a lock on the
+file with ``.lock`` appended to its name (where ``fcntl`` is
+available). Templates created from a
+string are not recorded, as they can't be compiled from the
+manifest.
+"""
+import atexit
+import contextlib
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from z3c.pt import precompile
+
+USAGE_ENV = "Z3C_PT_USAGE"
+
+logger = logging.getLogger(__name__)
+
+
+def read_manifest(filename):
+    """Return the entries of the manifest (tuples of the number of
+    renders, the class name and the filename), the templates
+    rendered most often first, or an empty list if it does not
+    exist."""
+
+    entries = []
+    try:
+        with open(filename) as f:
+            for line in f:
+                count, class_name, path = line.rstrip("\n").split("\t", 2)
+                entries.append((int(count), class_name, path))
+    except (IOError, OSError):
+        return []
+
+    entries.sort(key=lambda entry: (-entry[0], entry[1], entry[2]))
+    return entries
+
+
+def write_manifest(filename, entries):
+    """Write the manifest (replacing it as a whole)."""
+
+    temporary = "%s.%d.%d.tmp" % (
+        filename, os.getpid(), threading.current_thread().ident
+    )
+    with open(temporary, "w") as f:
+        for entry in entries:
+            f.write("%d\t%s\t%s\n" % entry)
+    getattr(os, "replace", os.rename)(temporary, filename)
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """Hold an exclusive lock for updating the manifest ``filename``
+    (on the file with ``.lock`` appended to its name)."""
+
+    with open(filename + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+class UsageRecorder(object):
+    """Counts the renders of template files and adds them to the
+    manifest ``filename`` every ``interval`` seconds, in a background
+    thread (``thread``)."""
+
+    thread = None
+
+    def __init__(self, filename, interval=60.0):
+        self.filename = filename
+        self.interval = interval
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.saved = time.time()
+
+    def record(self, template):
+        filename = template.filename
+        if not os.path.isabs(filename):
+            return
+
+        key = type(template), filename
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            now = time.time()
+            due = now - self.saved >= self.interval
+            if due:
+                self.saved = now
+
+        # The manifest is not written while the template renders.
+        if due:
+            self.thread = thread = threading.Thread(
+                target=self.save, name="z3c.pt.usage"
+            )
+            thread.daemon = True
+            thread.start()
+
+    def save(self):
+        """Add the renders counted since the last save to the
+        manifest."""
+
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            self.saved = time.time()
+
+        if not counts:
+            return
+
+        with locked(self.filename):
+            totals = {}
+            for count, class_name, filename in read_manifest(self.filename):
+                totals[class_name, filename] = count
+            for (cls, filename), count in counts.items():
+                key = "%s.%s" % (cls.__module__, cls.__name__), filename
+                totals[key] = totals.get(key, 0) + count
+
+            write_manifest(self.filename, sorted(
+                (count, class_name, filename)
+                for (class_name, filename), count in totals.items()
+            ))
+
+
+def warm_up(filename, top=100, background=True):
+    """Compile the ``top`` templates rendered most often according
+    to the manifest ``filename``, in that order.
+
+    The templates are compiled in memory, into the program cache of
+    their class, in a background thread which is returned unless
+    ``background`` is false; then the results (see
+    ``z3c.pt.precompile.compile_template``) are returned.
+    """
+
+    entries = read_manifest(filename)[:top]
+
+    def run():
+        start = time.time()
+        results = []
+        for count, class_name, path in entries:
+            result = precompile.compile_template((None, class_name, path))
+            if result[3] is not None:
+                logger.warning("Can't compile %s (%s): %s",
+                               path, class_name, result[3])
+            results.append(result)
+
+        logger.info("Compiled %d of the templates in %s in %.1f s.",
+                    len(results), filename, time.time() - start)
+        return results
+
+    if not background:
+        return run()
+
+    thread = threading.Thread(target=run, name="z3c.pt.warm_up")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def enable(filename, interval=60.0):
+    """Record the renders of templates into the manifest
+    ``filename``; returns the recorder."""
+
+    from z3c.pt.pagetemplate import BaseTemplate
+
+    disable()
+    BaseTemplate.usage_recorder = recorder = UsageRecorder(
+        filename, interval
+    )
+    return recorder
+
+
+def disable():
+    """Stop the recorder set by ``enable``, saving its counts."""
+
+    from z3c.pt.pagetemplate import BaseTemplate
+
+    recorder = BaseTemplate.usage_recorder
+    if recorder is not None:
+        BaseTemplate.usage_recorder = None
+        recorder.save()
+
+
+def environment_recorder():
+    """Return a recorder if ``$Z3C_PT_USAGE`` is set to the path of
+    the manifest."""
+
+    filename = os.environ.get(USAGE_ENV)
+    if filename:
+        return UsageRecorder(filename)
+
+
+@atexit.register
+def save():
+    """Save the counts of the recorder of templates, if any (when
+    the process exits)."""
+
+    from z3c.pt.pagetemplate import BaseTemplate
+
+    recorder = BaseTemplate.usage_recorder
+    if recorder is not None:
+        recorder.save()
@@ -0,0 +1,262 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Reloading template files which have changed.
+
+With ``auto_reload`` enabled, a template file checks the modification
+time of its file each time it is rendered. When a watcher is set
+instead, the files of all loaded templates are watched by a single
+background thread, and only the templates whose file has changed are
+reloaded (on their next render)::
+
+  >>> from z3c.pt import watcher
+  >>> watcher.enable(interval=2.0)  # doctest: +SKIP
+
+The watcher uses inotify on Linux and polls the modification times
+every ``interval`` seconds elsewhere. Note that inotify does not see
+changes made on another host of a network file system; use
+``backend="poll"`` there. The watcher can also be enabled by setting
+the ``Z3C_PT_WATCH`` environment variable to the polling interval.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import weakref
+
+WATCH_ENV = "Z3C_PT_WATCH"
+
+logger = logging.getLogger(__name__)
+
+
+def mtime(filename):
+    try:
+        return os.path.getmtime(filename)
+    except (IOError, OSError):
+        return 0
+
+
+class Watcher(object):
+    """Reloads templates when the modification time of their file
+    changes, checking all files every ``interval`` seconds."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.files = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def watch(self, template):
+        """Watch the file of ``template`` (before reading it)."""
+
+        filename = template.filename
+        with self.lock:
+            entry = self.files.get(filename)
+            if entry is None:
+                entry = self.files[filename] = [
+                    mtime(filename), weakref.WeakSet()
+                ]
+                self.add(filename)
+            entry[1].add(template)
+
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="z3c.pt.watcher"
+                )
+                self.thread.daemon = True
+                self.thread.start()
+
+    def add(self, filename):
+        """Start watching ``filename`` (called with the lock held)."""
+
+    def check(self, filenames=None):
+        """Reload the templates of those ``filenames`` (all by
+        default) which have changed; return the changed filenames."""
+
+        changed = []
+        with self.lock:
+            if filenames is None:
+                filenames = list(self.files)
+
+            for filename in filenames:
+                entry = self.files.get(filename)
+                if entry is None:
+                    continue
+
+                templates = list(entry[1])
+                if not templates:
+                    del self.files[filename]
+                    continue
+
+                current = mtime(filename)
+                if current != entry[0]:
+                    entry[0] = current
+                    changed.append(filename)
+                    for template in templates:
+                        template._cooked = False
+
+        for filename in changed:
+            logger.info("reloading %s", filename)
+        return changed
+
+    def wait(self):
+        """Wait until files may have changed; return the filenames to
+        check (or ``None`` for all of them)."""
+
+        self.stopped.wait(self.interval)
+
+    def run(self):
+        while not self.stopped.is_set():
+            filenames = self.wait()
+            if not self.stopped.is_set():
+                self.check(filenames)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+# Flags from <sys/inotify.h>.
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ONLYDIR = 0x01000000
+
+EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher(Watcher):
+    """Reloads templates when the directories of their files report
+    a change (Linux).
+
+    The ``interval`` is the time the watcher waits for a change before
+    checking whether it has been stopped.
+    """
+
+    mask = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE |
+        IN_DELETE | IN_ONLYDIR
+    )
+
+    def __init__(self, interval=1.0):
+        super(InotifyWatcher, self).__init__(interval)
+        self.libc = libc = _libc()
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.directories = {}
+        self.watched = set()
+        self.polled = set()
+
+    def add(self, filename):
+        directory = os.path.dirname(filename)
+        if directory in self.watched:
+            return
+
+        wd = self.libc.inotify_add_watch(
+            self.fd, directory.encode(sys.getfilesystemencoding()),
+            self.mask,
+        )
+        if wd < 0:
+            # The files are polled instead.
+            logger.warning("Can't watch %s (errno %d).",
+                           directory, ctypes.get_errno())
+            self.polled.add(filename)
+            return
+
+        self.directories[wd] = directory
+        self.watched.add(directory)
+
+    def wait(self):
+        with self.lock:
+            filenames = set(self.polled)
+        if not select.select([self.fd], [], [], self.interval)[0]:
+            return filenames
+
+        data = os.read(self.fd, 65536)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            directory = self.directories.get(wd)
+            if directory is not None and name:
+                filenames.add(os.path.join(
+                    directory, name.decode(sys.getfilesystemencoding())
+                ))
+        return filenames
+
+    def stop(self):
+        super(InotifyWatcher, self).stop()
+        os.close(self.fd)
+
+
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.inotify_init1
+    return libc
+
+
+def make_watcher(interval=1.0, backend="auto"):
+    """Return a watcher: ``backend`` is "inotify", "poll" or "auto"
+    (inotify if available)."""
+
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifyWatcher(interval)
+        except (OSError, AttributeError):
+            if backend == "inotify":
+                raise
+    return Watcher(interval)
+
+
+def enable(interval=1.0, backend="auto"):
+    """Reload template files using a watcher (see ``make_watcher``)
+    rather than checking them on each render; returns the watcher."""
+
+    from z3c.pt.pagetemplate import BaseTemplateFile
+
+    disable()
+    BaseTemplateFile.watcher = watcher = make_watcher(interval, backend)
+    return watcher
+
+
+def disable():
+    """Stop the watcher set by ``enable``."""
+
+    from z3c.pt.pagetemplate import BaseTemplateFile
+
+    watcher = BaseTemplateFile.watcher
+    if watcher is not None:
+        BaseTemplateFile.watcher = None
+        watcher.stop()
+
+
+def environment_watcher():
+    """Return a watcher if ``$Z3C_PT_WATCH`` is set to the polling
+    interval."""
+
+    interval = os.environ.get(WATCH_ENV)
+    if interval:
+        return make_watcher(float(interval))
@@ -0,0 +1,122 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""ZCML directives.
+
+The templates of a package are compiled while the configuration is
+processed with the ``precompile`` directive::
+
+  <configure xmlns:z3c="http://namespaces.zope.org/z3c">
+    <include package="z3c.pt" file="meta.zcml" />
+    <z3c:precompile package="my.package" pattern="browser/*.pt" />
+  </configure>
+
+The compile time of each template is logged (at the ``INFO`` level)
+to the ``z3c.pt.zcml`` logger.
+"""
+import logging
+import os
+import time
+
+from zope.configuration.exceptions import ConfigurationError
+from zope.configuration.fields import GlobalObject
+from zope.configuration.fields import Tokens
+from zope.interface import Interface
+from zope.schema import Int
+from zope.schema import TextLine
+
+from z3c.pt import precompile as _precompile
+
+logger = logging.getLogger(__name__)
+
+
+class IPrecompileDirective(Interface):
+    """Compile the templates of a package."""
+
+    package = GlobalObject(
+        title=u"Package",
+        description=u"The package whose templates are compiled.",
+        required=True,
+    )
+
+    pattern = TextLine(
+        title=u"Pattern",
+        description=u"The paths of the templates relative to the package"
+        u" directory, as a pattern (such as '**/*.pt').",
+        required=False,
+        default=u"*.pt",
+    )
+
+    classes = Tokens(
+        title=u"Template classes",
+        description=u"The template classes the templates are compiled"
+        u" for (PageTemplateFile and ViewPageTemplateFile by default).",
+        value_type=GlobalObject(),
+        required=False,
+    )
+
+    jobs = Int(
+        title=u"Processes",
+        description=u"If more than one, the templates are compiled in a"
+        u" pool of this many processes, into the on-disk cache in"
+        u" $Z3C_PT_CACHE which they are loaded from.",
+        required=False,
+        default=1,
+        min=1,
+    )
+
+
+def compile_templates(package, pattern, classes, jobs):
+    """Compile the templates; returns the results of
+    ``z3c.pt.precompile.compile_template``."""
+
+    start = time.time()
+    directory = os.environ.get(_precompile.CACHE_ENV) if jobs > 1 else None
+    results = _precompile.precompile(
+        directory, [package], classes, jobs, pattern
+    )
+
+    failed = 0
+    for filename, class_name, seconds, error in results:
+        if error is None:
+            logger.info("Compiled %s (%s) in %.1f ms.",
+                        filename, class_name, seconds * 1000)
+        else:
+            failed += 1
+            logger.warning("Can't compile %s (%s): %s",
+                           filename, class_name, error)
+
+    logger.info("Compiled %d templates of %s (%d failed) in %.1f s.",
+                len(results) - failed, package, failed, time.time() - start)
+    return results
+
+
+def precompile(_context, package, pattern=u"*.pt", classes=None, jobs=1):
+    if jobs > 1 and not os.environ.get(_precompile.CACHE_ENV):
+        raise ConfigurationError(
+            "Compiling in more than one process requires an on-disk cache"
+            " ($%s)." % _precompile.CACHE_ENV
+        )
+
+    if classes is None:
+        classes = _precompile.TEMPLATE_CLASSES
+    else:
+        classes = tuple(
+            "%s.%s" % (cls.__module__, cls.__name__) for cls in classes
+        )
+
+    _context.action(
+        discriminator=None,
+        callable=compile_templates,
+        args=(package.__name__, pattern, classes, jobs),
+    )